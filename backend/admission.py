@@ -0,0 +1,236 @@
+import os
+import json
+import math
+import time
+import asyncio
+import hashlib
+import heapq
+import itertools
+from collections import deque, Counter
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Any, Deque, Dict, Iterable, List, Optional, Tuple
+from fastapi import HTTPException
+
+# Admission control for workflow execution: bounded request size, bounded concurrency, fast rejection when saturated.
+# Budgets are per worker process; the effective host-wide budget is this times the number of uvicorn workers.
+MAX_WORKFLOW_PAYLOAD_BYTES = int(os.getenv("MAX_WORKFLOW_PAYLOAD_BYTES", str(2 * 1024 * 1024)))
+MAX_WORKFLOW_NODES = int(os.getenv("MAX_WORKFLOW_NODES", "500"))
+MAX_WORKFLOW_EDGES = int(os.getenv("MAX_WORKFLOW_EDGES", "2000"))
+MAX_INFLIGHT_RUNS = int(os.getenv("MAX_INFLIGHT_RUNS", "16"))
+MAX_QUEUED_RUNS = int(os.getenv("MAX_QUEUED_RUNS", "32")) # Interactive runs waiting for a slot; beyond this requests are shed immediately
+ADMISSION_QUEUE_TIMEOUT_SECONDS = float(os.getenv("ADMISSION_QUEUE_TIMEOUT_SECONDS", "10"))
+RUN_LATENCY_WINDOW = 100 # Recent run durations used to estimate Retry-After
+DEFAULT_RUN_SECONDS = 30.0 # Estimate until enough runs have finished
+MIN_RETRY_AFTER_SECONDS, MAX_RETRY_AFTER_SECONDS = 1, 300
+
+INTERACTIVE_LANE, BATCH_LANE = "interactive", "batch"
+LANES = (INTERACTIVE_LANE, BATCH_LANE) # Strict priority order: a free slot always goes to interactive work first
+MAX_QUEUED_BATCH_RUNS = int(os.getenv("MAX_QUEUED_BATCH_RUNS", "32")) # Separate bound, so a batch backlog never causes interactive 429s
+BATCH_QUEUE_TIMEOUT_SECONDS = float(os.getenv("BATCH_QUEUE_TIMEOUT_SECONDS", "120")) # Batch callers are expected to wait longer
+INTERACTIVE_RESERVED_SLOTS = int(os.getenv("INTERACTIVE_RESERVED_SLOTS", "2")) # Batch work can never occupy these
+TENANT_MAX_INFLIGHT = int(os.getenv("TENANT_MAX_INFLIGHT", "4"))
+TENANT_MAX_QUEUED = int(os.getenv("TENANT_MAX_QUEUED", "8")) # So one tenant can't fill the shared queue
+ANONYMOUS_TENANT = "anonymous"
+
+def _parse_tenant_map(raw: str) -> Dict[str, float]:
+    # "tenant_a=2,tenant_b=0.5" -> {"tenant_a": 2.0, "tenant_b": 0.5}
+    entries = (item.split("=", 1) for item in raw.split(",") if "=" in item)
+    return {name.strip(): float(value) for name, value in entries}
+
+TENANT_WEIGHTS = _parse_tenant_map(os.getenv("TENANT_WEIGHTS", "")) # Share of capacity relative to the default weight 1
+TENANT_CONCURRENCY_CAPS = _parse_tenant_map(os.getenv("TENANT_CONCURRENCY_CAPS", "")) # Per-tenant overrides of TENANT_MAX_INFLIGHT
+
+def tenant_id_for(api_keys: Any, header_value: Optional[str] = None) -> str:
+    """Explicit X-Tenant-ID header if present, otherwise a stable hash of the caller's provider keys (keys themselves are never kept)."""
+    if header_value and header_value.strip(): return header_value.strip()[:64]
+    keys = sorted(v for v in (api_keys.model_dump().values() if api_keys else ()) if v)
+    if not keys: return ANONYMOUS_TENANT
+    return "key:" + hashlib.sha256("\n".join(keys).encode()).hexdigest()[:16]
+
+class AdmissionRejected(Exception):
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.retry_after = retry_after
+
+@dataclass
+class _Ticket:
+    tenant: str
+    lane: str
+    future: "asyncio.Future[None]"
+    cancelled: bool = False # Lazily dropped from the heap
+
+class AdmissionController:
+    """Caps concurrent runs and schedules waiting ones by weighted fair queueing across tenants.
+
+    Each lane is a heap ordered by virtual finish time (start + cost / weight), so a tenant submitting many runs
+    only gets its weighted share while others are waiting. Interactive work always gets the next free slot before
+    batch work, and batch never uses the reserved slots. Anything over the queue bounds is rejected with Retry-After.
+    """
+    def __init__(self, max_inflight: int = MAX_INFLIGHT_RUNS, max_queued: int = MAX_QUEUED_RUNS,
+                 queue_timeout: float = ADMISSION_QUEUE_TIMEOUT_SECONDS, max_queued_batch: int = MAX_QUEUED_BATCH_RUNS):
+        self.max_inflight = max_inflight
+        self.max_queued = max_queued
+        self.max_queued_by_lane = {INTERACTIVE_LANE: max_queued, BATCH_LANE: max_queued_batch}
+        self.queue_timeout = queue_timeout
+        self.inflight = 0
+        self._inflight_by_tenant: Counter = Counter()
+        self._inflight_by_lane: Counter = Counter()
+        self._queued_by_tenant: Counter = Counter()
+        self._queued_by_lane: Counter = Counter()
+        self._queued = 0
+        self._heaps: Dict[str, List[Tuple[float, int, _Ticket]]] = {lane: [] for lane in LANES}
+        self._seq = itertools.count()
+        self._virtual_time = 0.0
+        self._last_finish: Dict[str, float] = {} # Per tenant virtual finish tag of its latest queued run
+        self._durations: Deque[float] = deque(maxlen=RUN_LATENCY_WINDOW)
+        self.rejected = 0
+
+    def typical_run_seconds(self) -> float:
+        if len(self._durations) < 5: return DEFAULT_RUN_SECONDS
+        ordered = sorted(self._durations)
+        return ordered[len(ordered) // 2]
+
+    def retry_after(self) -> int:
+        # Time for the runs ahead of a new request (in flight + queued) to drain through the available slots.
+        ahead = self.inflight + self._queued + 1
+        seconds = math.ceil(ahead / self.max_inflight) * self.typical_run_seconds()
+        return int(min(MAX_RETRY_AFTER_SECONDS, max(MIN_RETRY_AFTER_SECONDS, math.ceil(seconds))))
+
+    def _reject(self, reason: str):
+        self.rejected += 1
+        raise AdmissionRejected(reason, self.retry_after())
+
+    def _tenant_cap(self, tenant: str) -> int: return int(TENANT_CONCURRENCY_CAPS.get(tenant, TENANT_MAX_INFLIGHT))
+
+    def _lane_has_room(self, lane: str) -> bool:
+        limit = self.max_inflight if lane == INTERACTIVE_LANE else max(1, self.max_inflight - INTERACTIVE_RESERVED_SLOTS)
+        return self.inflight < limit
+
+    def _dequeued(self, ticket: _Ticket):
+        self._queued -= 1
+        self._queued_by_lane[ticket.lane] -= 1
+        self._queued_by_tenant[ticket.tenant] -= 1
+        if not self._queued_by_tenant[ticket.tenant]: del self._queued_by_tenant[ticket.tenant]
+
+    def _grant(self, ticket: _Ticket):
+        self.inflight += 1
+        self._inflight_by_tenant[ticket.tenant] += 1
+        self._inflight_by_lane[ticket.lane] += 1
+        ticket.future.set_result(None)
+
+    def _dispatch(self):
+        # Hand free slots to the lowest finish tags, skipping tenants that are at their concurrency cap.
+        for lane in LANES:
+            heap = self._heaps[lane]
+            skipped = []
+            while heap and self._lane_has_room(lane):
+                tag, seq, ticket = heapq.heappop(heap)
+                if ticket.cancelled: continue
+                if self._inflight_by_tenant[ticket.tenant] >= self._tenant_cap(ticket.tenant):
+                    skipped.append((tag, seq, ticket)); continue
+                self._dequeued(ticket)
+                self._virtual_time = max(self._virtual_time, tag)
+                self._grant(ticket)
+            for entry in skipped: heapq.heappush(heap, entry)
+
+    async def acquire(self, tenant: str = ANONYMOUS_TENANT, lane: str = INTERACTIVE_LANE, cost: float = 1.0) -> _Ticket:
+        if lane not in LANES: raise ValueError(f"Unknown lane '{lane}'; expected one of {', '.join(LANES)}.")
+        if self._queued_by_lane[lane] >= self.max_queued_by_lane[lane]: self._reject(f"Server is at capacity; too many {lane} workflow runs queued.")
+        if self._queued_by_tenant[tenant] >= TENANT_MAX_QUEUED: self._reject("Too many queued workflow runs for this tenant.")
+        ticket = _Ticket(tenant, lane, asyncio.get_running_loop().create_future())
+        start = max(self._virtual_time, self._last_finish.get(tenant, 0.0))
+        tag = self._last_finish[tenant] = start + max(cost, 1.0) / TENANT_WEIGHTS.get(tenant, 1.0)
+        heapq.heappush(self._heaps[lane], (tag, next(self._seq), ticket))
+        self._queued += 1
+        self._queued_by_lane[lane] += 1
+        self._queued_by_tenant[tenant] += 1
+        self._dispatch()
+        if ticket.future.done(): return ticket
+        timeout = self.queue_timeout if lane == INTERACTIVE_LANE else BATCH_QUEUE_TIMEOUT_SECONDS
+        try:
+            await asyncio.wait_for(asyncio.shield(ticket.future), timeout=timeout)
+        except asyncio.TimeoutError:
+            if ticket.future.done(): return ticket # Slot was handed over just as the wait expired; keep it
+            ticket.cancelled = True; self._dequeued(ticket)
+            self._reject("Server is at capacity; timed out waiting for a free execution slot.")
+        except asyncio.CancelledError:
+            if ticket.future.done(): self.release(ticket) # Pass the slot we were handed on
+            else: ticket.cancelled = True; self._dequeued(ticket)
+            raise
+        return ticket
+
+    def release(self, ticket: _Ticket):
+        self.inflight -= 1
+        self._inflight_by_tenant[ticket.tenant] -= 1
+        if not self._inflight_by_tenant[ticket.tenant]: del self._inflight_by_tenant[ticket.tenant]
+        self._inflight_by_lane[ticket.lane] -= 1
+        self._dispatch()
+        if ticket.tenant not in self._inflight_by_tenant and ticket.tenant not in self._queued_by_tenant \
+                and self._last_finish.get(ticket.tenant, 0.0) <= self._virtual_time:
+            self._last_finish.pop(ticket.tenant, None) # Idle tenant; an absent entry schedules identically
+
+    @asynccontextmanager
+    async def slot(self, tenant: str = ANONYMOUS_TENANT, lane: str = INTERACTIVE_LANE, cost: float = 1.0):
+        ticket = await self.acquire(tenant, lane, cost)
+        started = time.monotonic()
+        try: yield
+        finally:
+            self._durations.append(time.monotonic() - started)
+            self.release(ticket)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"inflight": self.inflight, "queued": self._queued, "max_inflight": self.max_inflight, "max_queued": self.max_queued,
+                "max_queued_by_lane": dict(self.max_queued_by_lane),
+                "inflight_by_lane": {lane: self._inflight_by_lane[lane] for lane in LANES},
+                "queued_by_lane": {lane: self._queued_by_lane[lane] for lane in LANES},
+                "inflight_by_tenant": dict(self._inflight_by_tenant), "queued_by_tenant": dict(self._queued_by_tenant),
+                "typical_run_seconds": round(self.typical_run_seconds(), 2), "retry_after": self.retry_after(), "rejected": self.rejected}
+
+def check_workflow_size(nodes: Iterable[Any], edges: Iterable[Any]) -> Optional[str]:
+    # Returns why the graph is too large, or None when it is within limits.
+    node_count, edge_count = len(list(nodes)), len(list(edges))
+    if node_count > MAX_WORKFLOW_NODES: return f"Workflow has {node_count} nodes; the limit is {MAX_WORKFLOW_NODES}."
+    if edge_count > MAX_WORKFLOW_EDGES: return f"Workflow has {edge_count} edges; the limit is {MAX_WORKFLOW_EDGES}."
+    return None
+
+class PayloadSizeLimitMiddleware:
+    """Rejects oversized request bodies on the given paths with 413 before they are buffered or parsed."""
+    def __init__(self, app, max_bytes: int = MAX_WORKFLOW_PAYLOAD_BYTES, path_prefixes: Iterable[str] = ("/api/v1/workflow/",)):
+        self.app = app
+        self.max_bytes = max_bytes
+        self.path_prefixes = tuple(path_prefixes)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith(self.path_prefixes):
+            return await self.app(scope, receive, send)
+        declared = dict(scope["headers"]).get(b"content-length")
+        if declared is not None and declared.isdigit() and int(declared) > self.max_bytes:
+            return await self._reject(send)
+        received = 0
+
+        async def limited_receive():
+            # Chunked uploads carry no Content-Length, so count as the body streams in.
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes: raise HTTPException(status_code=413, detail=self._detail()) # Rendered by the app's handlers
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+    def _detail(self) -> str: return f"Request body exceeds {self.max_bytes} bytes."
+
+    async def _reject(self, send):
+        body = json.dumps({"detail": self._detail()}).encode()
+        await send({"type": "http.response.start", "status": 413,
+                    "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]})
+        await send({"type": "http.response.body", "body": body})
+
+_controller: Optional[AdmissionController] = None
+
+def get_admission_controller() -> AdmissionController:
+    global _controller
+    if _controller is None: _controller = AdmissionController()
+    return _controller
@@ -0,0 +1,150 @@
+import asyncio
+import hashlib
+import ipaddress
+import os
+import socket
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional
+from uuid import uuid4
+import aiofiles
+import httpx
+from .store import get_store
+
+# Local copies of provider-returned images, so consumers stop re-downloading from provider CDNs and URLs can't expire.
+MIRROR_NAMESPACE = "mirrored_assets" # remote URL -> local URL, shared by all workers via the backing store
+MIRROR_MAX_BYTES = 50 * 1024 * 1024
+MIRROR_DOWNLOAD_TIMEOUT_SECONDS = 60.0
+MIRROR_MAX_CONCURRENT_DOWNLOADS = 8
+MIRROR_LOCAL_INDEX_MAX_ENTRIES = 4096 # Per worker; evicted entries are found again in the backing store
+MIRROR_FAILURE_TTL_SECONDS = 300.0 # Failed URLs aren't retried on every run, but get another chance later
+# Only images are mirrored, always under one of these extensions: the files are served from our own origin.
+MIRROR_IMAGE_EXTENSIONS = {"image/png": ".png", "image/jpeg": ".jpg", "image/webp": ".webp", "image/gif": ".gif"}
+
+async def _check_public_host(url: str):
+    # No fetching from loopback, private, link-local (cloud metadata) or otherwise non-public addresses.
+    host = httpx.URL(url).host
+    if not host: raise ValueError("URL has no host")
+    infos = await asyncio.get_running_loop().getaddrinfo(host, None, type=socket.SOCK_STREAM)
+    for info in infos:
+        address = ipaddress.ip_address(info[4][0].split("%")[0])
+        if not address.is_global: raise ValueError(f"refusing to fetch from non-public address {address}")
+
+class AssetMirror:
+    def __init__(self, directory: Path, public_base_url: str):
+        self.directory = directory
+        self.public_base_url = public_base_url.rstrip("/")
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._ready: "OrderedDict[str, str]" = OrderedDict() # remote URL -> local URL, this worker's view, LRU
+        self._failed: "OrderedDict[str, float]" = OrderedDict() # remote URL -> monotonic time its failure expires
+        self._downloads: Dict[str, "asyncio.Task[Optional[str]]"] = {} # In-flight downloads, deduplicated by URL
+        self._semaphore: Optional[asyncio.Semaphore] = None # Created lazily inside the running event loop
+
+    def is_remote(self, url: Optional[str]) -> bool:
+        return bool(url) and url.startswith(("http://", "https://")) and not url.startswith(self.public_base_url)
+
+    def prefetch(self, url: Optional[str]) -> None:
+        # Fire-and-forget; safe to call repeatedly for the same URL.
+        if not self.is_remote(url) or url in self._ready or url in self._downloads or self._recently_failed(url): return
+        task = asyncio.ensure_future(self._mirror(url))
+        self._downloads[url] = task
+        task.add_done_callback(lambda _: self._downloads.pop(url, None))
+
+    def resolve(self, url: Optional[str]) -> Optional[str]:
+        # Local copy when the download has finished, otherwise the original URL.
+        return (self._known(url) or url) if url else url
+
+    def local_url(self, url: Optional[str]) -> Optional[str]: return self._known(url) if url else None
+
+    def _known(self, url: str) -> Optional[str]:
+        local = self._ready.get(url)
+        if local is not None: self._ready.move_to_end(url)
+        return local
+
+    def _remember(self, url: str, local: str):
+        self._ready[url] = local
+        self._ready.move_to_end(url)
+        if len(self._ready) > MIRROR_LOCAL_INDEX_MAX_ENTRIES: self._ready.popitem(last=False)
+
+    def _recently_failed(self, url: str) -> bool:
+        expires = self._failed.get(url)
+        if expires is None: return False
+        if expires > time.monotonic(): return True
+        del self._failed[url]
+        return False
+
+    def _record_failure(self, url: str):
+        self._failed[url] = time.monotonic() + MIRROR_FAILURE_TTL_SECONDS
+        self._failed.move_to_end(url)
+        if len(self._failed) > MIRROR_LOCAL_INDEX_MAX_ENTRIES: self._failed.popitem(last=False)
+
+    async def resolve_shared(self, urls: List[str]) -> Dict[str, Optional[str]]:
+        # Like `local_url`, but also sees downloads finished by other workers.
+        resolved: Dict[str, Optional[str]] = {}
+        for url in urls:
+            local = self._known(url)
+            if local is None and self.is_remote(url):
+                try: local = await get_store().get(MIRROR_NAMESPACE, url)
+                except Exception: local = None
+                if local: self._remember(url, local)
+            resolved[url] = local
+        return resolved
+
+    async def wait(self, url: str, timeout: float) -> Optional[str]:
+        task = self._downloads.get(url)
+        if task is not None:
+            try: await asyncio.wait_for(asyncio.shield(task), timeout=timeout)
+            except asyncio.TimeoutError: pass
+        return self.local_url(url)
+
+    async def _mirror(self, url: str) -> Optional[str]:
+        try:
+            known = await get_store().get(MIRROR_NAMESPACE, url) # Another worker may have mirrored it already
+            if known:
+                self._remember(url, known)
+                return known
+            if self._semaphore is None: self._semaphore = asyncio.Semaphore(MIRROR_MAX_CONCURRENT_DOWNLOADS)
+            async with self._semaphore:
+                local = await self._download(url)
+            self._remember(url, local)
+            await get_store().set(MIRROR_NAMESPACE, url, local)
+            return local
+        except Exception as e:
+            print(f"Warning: could not mirror {url[:80]}: {e}")
+            self._record_failure(url)
+            return None
+
+    async def _download(self, url: str) -> str:
+        base_name = hashlib.sha256(url.encode()).hexdigest()[:32]
+        tmp_path = self.directory / f".{base_name}.{uuid4().hex}.part"
+        try:
+            await _check_public_host(url)
+            async with httpx.AsyncClient(follow_redirects=False) as client: # A redirect could point anywhere; it fails the download
+                async with client.stream("GET", url, timeout=MIRROR_DOWNLOAD_TIMEOUT_SECONDS) as response:
+                    if response.is_redirect: raise ValueError(f"unexpected redirect ({response.status_code})")
+                    response.raise_for_status()
+                    content_type = response.headers.get("content-type", "").split(";")[0].strip().lower()
+                    extension = MIRROR_IMAGE_EXTENSIONS.get(content_type)
+                    if extension is None: raise ValueError(f"not a supported image type: {content_type or 'unknown'}")
+                    received = 0
+                    async with aiofiles.open(tmp_path, "wb") as out_file:
+                        async for chunk in response.aiter_bytes():
+                            received += len(chunk)
+                            if received > MIRROR_MAX_BYTES: raise ValueError(f"asset larger than {MIRROR_MAX_BYTES} bytes")
+                            await out_file.write(chunk)
+            file_name = f"{base_name}{extension}"
+            os.replace(tmp_path, self.directory / file_name) # Atomic, readers never see partial files
+            return f"{self.public_base_url}/{file_name}"
+        finally:
+            if tmp_path.exists(): tmp_path.unlink()
+
+_mirror: Optional[AssetMirror] = None
+
+def configure_asset_mirror(directory: Path, public_base_url: str) -> AssetMirror:
+    global _mirror
+    _mirror = AssetMirror(directory, public_base_url)
+    return _mirror
+
+def get_asset_mirror() -> Optional[AssetMirror]:
+    return _mirror # None when mirroring isn't configured (e.g. library use); callers fall back to remote URLs
@@ -0,0 +1,72 @@
+"""Encode/decode time and bytes on the wire for workflow payloads of 100 to 5,000 nodes.
+
+    python -m backend.bench_serialization [--sizes 100 1000 5000] [--repeat 5]
+
+Compares the previous path (Pydantic -> dict -> stdlib json) with orjson, Pydantic's own JSON encoder and,
+when installed, msgpack; wire sizes are shown raw, gzipped and (when installed) brotli-compressed.
+"""
+import json
+import time
+import random
+import argparse
+from typing import Callable, List, Optional
+import orjson
+
+from .models import WorkflowPayload, WorkflowExecutionResponse, Node, Edge, NodeType
+from .serialization import dumps, compress, msgpack, brotli
+
+PROMPT_WORDS = "cinematic product shot soft studio lighting marble table pastel background shallow depth of field 8k".split()
+
+def build_workflow(node_count: int, seed: int = 7) -> WorkflowPayload:
+    # A layered chain of realistic nodes: long prompts, provider URLs, a few edges per node.
+    rng = random.Random(seed)
+    types = [NodeType.TEXT_TO_IMAGE, NodeType.PRODUCT_IN_SCENE, NodeType.STYLE_APPLY, NodeType.TEXT_OVERLAY, NodeType.CROP_RESIZE]
+    nodes, edges = [], []
+    for i in range(node_count):
+        node_type = types[i % len(types)]
+        data = {"label": f"{node_type.value} {i}", "prompt": " ".join(rng.choices(PROMPT_WORDS, k=40)), "seed": rng.randint(0, 2**31),
+                "output_image_url": f"https://v3.fal.media/files/{rng.getrandbits(64):016x}/{rng.getrandbits(64):016x}.png"}
+        nodes.append(Node(id=f"node_{i}", type=node_type, position={"x": float(i % 50) * 220, "y": float(i // 50) * 160}, data=data))
+        if i: edges.append(Edge(id=f"e_{i}", source=f"node_{rng.randrange(max(0, i - 20), i)}", target=f"node_{i}"))
+    return WorkflowPayload(nodes=nodes, edges=edges)
+
+def _best_ms(fn: Callable[[], object], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter(); fn(); best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+def _kb(size: Optional[int]) -> str: return f"{size / 1024:8.1f}" if size is not None else "       -"
+
+def run(sizes: List[int], repeat: int):
+    print(f"{'nodes':>6} {'format':<18} {'encode ms':>10} {'decode ms':>10} {'raw KB':>8} {'gzip KB':>8} {'br KB':>8}")
+    for size in sizes:
+        response = WorkflowExecutionResponse(updated_nodes=build_workflow(size).nodes, execution_log=[f"Node {i} done" for i in range(size)])
+        content = response.model_dump(mode="json")
+        variants = [
+            ("stdlib json", lambda: json.dumps(content).encode(), json.loads),
+            ("orjson", lambda: dumps(content), orjson.loads),
+            ("pydantic json", response.model_dump_json, json.loads),
+        ]
+        if msgpack: variants.append(("msgpack", lambda: msgpack.packb(content, use_bin_type=True), lambda b: msgpack.unpackb(b, raw=False)))
+        for name, encode, decode in variants:
+            body = encode()
+            body = body.encode() if isinstance(body, str) else body
+            encode_ms, decode_ms = _best_ms(encode, repeat), _best_ms(lambda: decode(body), repeat)
+            gzip_size = len(compress(body, "gzip"))
+            br_size = len(compress(body, "br")) if brotli else None
+            print(f"{size:>6} {name:<18} {encode_ms:>10.2f} {decode_ms:>10.2f} {_kb(len(body))} {_kb(gzip_size)} {_kb(br_size)}")
+        # End to end on the request side: validating the payload back into models dominates either decoder.
+        raw = dumps(content)
+        validate_ms = _best_ms(lambda: WorkflowExecutionResponse.model_validate_json(raw), repeat)
+        print(f"{size:>6} {'pydantic validate':<18} {'':>10} {validate_ms:>10.2f}")
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m backend.bench_serialization", description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 500, 1000, 2500, 5000])
+    parser.add_argument("--repeat", type=int, default=5, help="Best of N timings")
+    args = parser.parse_args()
+    run(args.sizes, args.repeat)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+import time
+import asyncio
+from typing import Any, Dict, Optional
+from .store import get_store
+
+# Durable per-run progress: the payload a run started from plus every node that finished successfully.
+# A run that dies mid-way (deploy, OOM, worker restart) is resumed from these instead of re-paying provider calls.
+CHECKPOINT_NAMESPACE = "run_checkpoints"
+CHECKPOINT_TTL_SECONDS = 24 * 3600
+CHECKPOINT_FLUSH_INTERVAL_SECONDS = 0.5 # Completions within this window share one store write
+CHECKPOINT_MAX_BATCH = 32 # Flush early once this many completions are pending
+
+def _payload_key(run_id: str) -> str: return f"{run_id}:payload"
+def _nodes_key(run_id: str) -> str: return f"{run_id}:nodes"
+
+class CheckpointWriter:
+    """Collects completed nodes of one run and persists them in the background, batched, off the execution path."""
+    def __init__(self, run_id: str, payload: Dict[str, Any]):
+        self.run_id = run_id
+        self._payload: Optional[Dict[str, Any]] = payload # Written with the first flush
+        self._completed: Dict[str, Dict[str, Any]] = {} # Everything checkpointed so far (a flush rewrites the whole map)
+        self._pending = 0
+        self._dirty = asyncio.Event()
+        self._dirty.set() # So the payload is persisted even before the first node finishes
+        self._full = asyncio.Event()
+        self._closed = False
+        self._task = asyncio.ensure_future(self._run())
+
+    def seed(self, completed: Dict[str, Dict[str, Any]]):
+        # Nodes restored from an earlier attempt of the same run; kept so later flushes don't drop them.
+        self._completed.update(completed)
+
+    def record(self, node_id: str, data: Dict[str, Any]):
+        # Synchronous and non-blocking: nodes never wait on the store.
+        self._completed[node_id] = data
+        self._pending += 1
+        self._dirty.set()
+        if self._pending >= CHECKPOINT_MAX_BATCH: self._full.set()
+
+    async def _run(self):
+        while True:
+            await self._dirty.wait()
+            if not self._closed:
+                try: await asyncio.wait_for(self._full.wait(), timeout=CHECKPOINT_FLUSH_INTERVAL_SECONDS)
+                except asyncio.TimeoutError: pass
+            self._dirty.clear(); self._full.clear()
+            await self._flush()
+            if self._closed and not self._pending: return # A record() that landed during the flush gets one more
+
+    async def _flush(self):
+        if not self._pending and self._payload is None: return
+        self._pending = 0
+        store = get_store()
+        try:
+            if self._payload is not None:
+                await store.set(CHECKPOINT_NAMESPACE, _payload_key(self.run_id), self._payload, ttl_seconds=CHECKPOINT_TTL_SECONDS)
+                self._payload = None
+            await store.set(CHECKPOINT_NAMESPACE, _nodes_key(self.run_id), {"updated_at": time.time(), "nodes": dict(self._completed)},
+                            ttl_seconds=CHECKPOINT_TTL_SECONDS)
+        except Exception as e:
+            print(f"Warning: could not write checkpoint for run '{self.run_id}': {e}")
+
+    async def close(self):
+        # Final flush; callers shield this when the run itself is being cancelled.
+        self._closed = True
+        self._dirty.set(); self._full.set()
+        await self._task
+
+async def load_checkpoint(run_id: str) -> Optional[Dict[str, Any]]:
+    """Returns {"payload": ..., "nodes": {node_id: node data}} for a checkpointed run, or None."""
+    store = get_store()
+    payload = await store.get(CHECKPOINT_NAMESPACE, _payload_key(run_id))
+    if payload is None: return None
+    completed = await store.get(CHECKPOINT_NAMESPACE, _nodes_key(run_id))
+    return {"payload": payload, "nodes": (completed or {}).get("nodes", {})}
+
+async def delete_checkpoint(run_id: str):
+    store = get_store()
+    await store.delete(CHECKPOINT_NAMESPACE, _payload_key(run_id))
+    await store.delete(CHECKPOINT_NAMESPACE, _nodes_key(run_id))
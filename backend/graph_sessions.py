@@ -0,0 +1,79 @@
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+from .models import Node, Edge, WorkflowDeltaRequest
+from .store import get_store
+
+# Session-scoped copy of each canvas graph, so clients only send what changed since the revision they last synced.
+# The graph lives in the backing store (shared by all workers); each worker keeps recently used graphs decoded.
+GRAPH_SESSION_NAMESPACE = "graph_sessions"
+GRAPH_SESSION_TTL_SECONDS = 24 * 3600
+LOCAL_GRAPH_CACHE_MAX_ENTRIES = 64
+
+class GraphRevisionConflict(Exception):
+    """The client's base revision isn't the session's current one; the client must resend its full graph."""
+    def __init__(self, session_id: str, current_revision: Optional[int]):
+        super().__init__(f"Graph session '{session_id}' is at revision {current_revision}; resend the full graph.")
+        self.current_revision = current_revision
+
+class SessionGraph:
+    def __init__(self, revision: int, nodes: Dict[str, Node], edges: Dict[str, Edge]):
+        self.revision = revision
+        self.nodes = nodes # Insertion-ordered by id, mirrors the client's node order
+        self.edges = edges
+
+_local_graphs: "OrderedDict[str, SessionGraph]" = OrderedDict()
+
+def _revision_key(session_id: str) -> str: return f"{session_id}:revision"
+
+async def load_session_graph(session_id: str) -> Optional[SessionGraph]:
+    store = get_store()
+    revision = await store.get(GRAPH_SESSION_NAMESPACE, _revision_key(session_id)) # Tiny read; the graph is only fetched on a miss
+    if revision is None: return None
+    cached = _local_graphs.get(session_id)
+    if cached is not None and cached.revision == revision:
+        _local_graphs.move_to_end(session_id)
+        return cached
+    stored = await store.get(GRAPH_SESSION_NAMESPACE, session_id)
+    if stored is None or stored.get("revision") != revision: return None # Expired between the two reads; treat as unknown
+    graph = SessionGraph(revision, {n["id"]: Node(**n) for n in stored["nodes"]}, {e["id"]: Edge(**e) for e in stored["edges"]})
+    _remember(session_id, graph)
+    return graph
+
+def _remember(session_id: str, graph: SessionGraph):
+    _local_graphs[session_id] = graph
+    _local_graphs.move_to_end(session_id)
+    if len(_local_graphs) > LOCAL_GRAPH_CACHE_MAX_ENTRIES: _local_graphs.popitem(last=False)
+
+async def apply_graph_delta(delta: WorkflowDeltaRequest) -> Tuple[int, List[Node], List[Edge]]:
+    """Returns (base revision, nodes, edges) of the session graph with the delta applied. Raises GraphRevisionConflict."""
+    if delta.base_revision is None:
+        # Keep revisions increasing across full resyncs; read directly, so a session whose graph is unreadable still resyncs.
+        base_revision = await get_store().get(GRAPH_SESSION_NAMESPACE, _revision_key(delta.session_id)) or 0
+        nodes: Dict[str, Node] = {}
+        edges: Dict[str, Edge] = {}
+    else:
+        current = await load_session_graph(delta.session_id)
+        if current is None or current.revision != delta.base_revision:
+            raise GraphRevisionConflict(delta.session_id, current.revision if current else None)
+        base_revision = current.revision
+        nodes, edges = dict(current.nodes), dict(current.edges) # Shallow copies; replaced entries never mutate the cached graph
+        for node_id in delta.removed_node_ids: nodes.pop(node_id, None)
+        for edge_id in delta.removed_edge_ids: edges.pop(edge_id, None)
+    for node in delta.upserted_nodes: nodes[node.id] = node
+    for edge in delta.upserted_edges: edges[edge.id] = edge
+    # Copies, so running the workflow can't mutate nodes the local cache still holds.
+    return base_revision, [Node(**n.model_dump()) for n in nodes.values()], list(edges.values())
+
+async def save_session_graph(session_id: str, base_revision: int, revision: int, nodes: List[Node], edges: List[Edge]):
+    """Stores the graph as `revision` only if the session is still at `base_revision`. Raises GraphRevisionConflict.
+
+    Two deltas run against the same base race here: the first to save wins, the other must resync.
+    """
+    store = get_store()
+    saved = await store.compare_and_set(GRAPH_SESSION_NAMESPACE, _revision_key(session_id), base_revision or None, { # 0: new session, no key yet
+        session_id: {"revision": revision, "nodes": [n.model_dump(mode="json") for n in nodes], "edges": [e.model_dump(mode="json") for e in edges]},
+        _revision_key(session_id): revision,
+    }, ttl_seconds=GRAPH_SESSION_TTL_SECONDS)
+    if not saved:
+        raise GraphRevisionConflict(session_id, await store.get(GRAPH_SESSION_NAMESPACE, _revision_key(session_id)))
+    _remember(session_id, SessionGraph(revision, {n.id: n for n in nodes}, {e.id: e for e in edges}))
@@ -0,0 +1,147 @@
+import os
+import json
+import time
+import asyncio
+import sqlite3
+import threading
+from pathlib import Path
+from typing import List, Dict, Any, Optional, Callable
+
+# Persistent run history: one row per run plus one row per executed node, indexed for reuse lookups and analytics.
+DEFAULT_RUN_HISTORY_DB_PATH = Path(__file__).parent / "run_history.db"
+PRUNE_BATCH_SIZE = 1000
+
+_SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS runs (
+        run_id TEXT PRIMARY KEY, workflow_id TEXT, template_id TEXT, status TEXT NOT NULL,
+        started_at REAL NOT NULL, finished_at REAL, duration_ms REAL, node_count INTEGER,
+        final_output_url TEXT, error TEXT, execution_log TEXT, nodes TEXT, edges TEXT)""",
+    "CREATE INDEX IF NOT EXISTS idx_runs_started_at ON runs (started_at)",
+    "CREATE INDEX IF NOT EXISTS idx_runs_workflow ON runs (workflow_id, started_at)",
+    "CREATE INDEX IF NOT EXISTS idx_runs_template ON runs (template_id, started_at)",
+    """CREATE TABLE IF NOT EXISTS run_nodes (
+        run_id TEXT NOT NULL, node_id TEXT NOT NULL, node_type TEXT NOT NULL, content_hash TEXT,
+        output_image_url TEXT, error_message TEXT, duration_ms REAL, finished_at REAL NOT NULL,
+        PRIMARY KEY (run_id, node_id))""",
+    "CREATE INDEX IF NOT EXISTS idx_run_nodes_hash ON run_nodes (content_hash, finished_at)",
+]
+# Columns added after the first schema version: (table, column, type). Applied to existing databases on open.
+_MIGRATIONS = [
+    ("runs", "execution_mode", "TEXT"),
+]
+
+_RUN_SUMMARY_COLUMNS = "run_id, workflow_id, template_id, execution_mode, status, started_at, finished_at, duration_ms, node_count, final_output_url, error"
+
+class RunHistory:
+    def __init__(self, path: str):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=10.0)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            for statement in _SCHEMA: self._conn.execute(statement)
+            for table, column, column_type in _MIGRATIONS:
+                existing = {row[1] for row in self._conn.execute(f"PRAGMA table_info({table})").fetchall()}
+                if column not in existing: self._conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+
+    async def _run(self, fn: Callable[[], Any]) -> Any:
+        def locked():
+            with self._lock: return fn()
+        return await asyncio.get_running_loop().run_in_executor(None, locked)
+
+    async def record_run(self, run: Dict[str, Any], node_rows: List[Dict[str, Any]]) -> None:
+        def op():
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO runs (run_id, workflow_id, template_id, status, started_at, finished_at, duration_ms, "
+                    "node_count, final_output_url, error, execution_log, nodes, edges, execution_mode) VALUES (:run_id, :workflow_id, "
+                    ":template_id, :status, :started_at, :finished_at, :duration_ms, :node_count, :final_output_url, :error, "
+                    ":execution_log, :nodes, :edges, :execution_mode)",
+                    {**run, "execution_log": json.dumps(run.get("execution_log", [])),
+                     "nodes": json.dumps(run.get("nodes", [])), "edges": json.dumps(run.get("edges", []))})
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO run_nodes VALUES (:run_id, :node_id, :node_type, :content_hash, :output_image_url, "
+                    ":error_message, :duration_ms, :finished_at)", node_rows)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        await self._run(op)
+
+    async def recent_runs(self, workflow_id: Optional[str] = None, template_id: Optional[str] = None,
+                          before: Optional[float] = None, limit: int = 50) -> List[Dict[str, Any]]:
+        clauses, params = [], []
+        if workflow_id: clauses.append("workflow_id = ?"); params.append(workflow_id)
+        if template_id: clauses.append("template_id = ?"); params.append(template_id)
+        if before: clauses.append("started_at < ?"); params.append(before)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        query = f"SELECT {_RUN_SUMMARY_COLUMNS} FROM runs {where} ORDER BY started_at DESC LIMIT ?"
+        return await self._run(lambda: [dict(r) for r in self._conn.execute(query, (*params, limit)).fetchall()])
+
+    async def get_run(self, run_id: str) -> Optional[Dict[str, Any]]:
+        def op():
+            row = self._conn.execute("SELECT * FROM runs WHERE run_id = ?", (run_id,)).fetchone()
+            if not row: return None
+            run = dict(row)
+            for field in ("execution_log", "nodes", "edges"): run[field] = json.loads(run[field] or "[]")
+            run["node_results"] = [dict(r) for r in self._conn.execute("SELECT * FROM run_nodes WHERE run_id = ?", (run_id,)).fetchall()]
+            return run
+        return await self._run(op)
+
+    async def last_output_for_hash(self, content_hash: str) -> Optional[Dict[str, Any]]:
+        # Most recent successful output produced by this exact node configuration + inputs.
+        def op():
+            row = self._conn.execute(
+                "SELECT * FROM run_nodes WHERE content_hash = ? AND output_image_url IS NOT NULL AND error_message IS NULL "
+                "ORDER BY finished_at DESC LIMIT 1", (content_hash,)).fetchone()
+            return dict(row) if row else None
+        return await self._run(op)
+
+    async def latency_trend(self, bucket_seconds: int = 3600, since: Optional[float] = None,
+                            workflow_id: Optional[str] = None, template_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        clauses, params = ["duration_ms IS NOT NULL", "started_at >= ?"], [since or 0.0]
+        if workflow_id: clauses.append("workflow_id = ?"); params.append(workflow_id)
+        if template_id: clauses.append("template_id = ?"); params.append(template_id)
+        query = (f"SELECT CAST(started_at / ? AS INTEGER) * ? AS bucket_start, COUNT(*) AS runs, AVG(duration_ms) AS avg_ms, "
+                 f"MIN(duration_ms) AS min_ms, MAX(duration_ms) AS max_ms FROM runs WHERE {' AND '.join(clauses)} "
+                 f"GROUP BY bucket_start ORDER BY bucket_start")
+        return await self._run(lambda: [dict(r) for r in self._conn.execute(query, (bucket_seconds, bucket_seconds, *params)).fetchall()])
+
+    async def prune(self, older_than: float) -> int:
+        # Deletes in batches so a large prune never holds the write lock for long.
+        def delete_batch() -> int:
+            ids = [r[0] for r in self._conn.execute("SELECT run_id FROM runs WHERE started_at < ? LIMIT ?", (older_than, PRUNE_BATCH_SIZE)).fetchall()]
+            if not ids: return 0
+            marks = ",".join("?" * len(ids))
+            self._conn.execute("BEGIN")
+            self._conn.execute(f"DELETE FROM run_nodes WHERE run_id IN ({marks})", ids)
+            self._conn.execute(f"DELETE FROM runs WHERE run_id IN ({marks})", ids)
+            self._conn.execute("COMMIT")
+            return len(ids)
+        total = 0
+        while True:
+            deleted = await self._run(delete_batch)
+            total += deleted
+            if deleted < PRUNE_BATCH_SIZE: return total
+
+    async def close(self) -> None:
+        await self._run(self._conn.close)
+
+_history: Optional[RunHistory] = None
+
+def get_run_history() -> RunHistory:
+    global _history
+    if _history is None: _history = RunHistory(os.getenv("RUN_HISTORY_DB", str(DEFAULT_RUN_HISTORY_DB_PATH)))
+    return _history
+
+async def close_run_history() -> None:
+    global _history
+    if _history is not None:
+        await _history.close()
+        _history = None
+
+async def prune_run_history(retention_days: float) -> int:
+    return await get_run_history().prune(time.time() - retention_days * 86400)
@@ -1,18 +1,35 @@
-from fastapi import FastAPI, HTTPException, Body, File, UploadFile
+from fastapi import FastAPI, HTTPException, Body, File, UploadFile, Request, Query, Header, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
+from fastapi.responses import FileResponse
 from dotenv import load_dotenv
 import os
 import json
+import asyncio
 import aiofiles
 from pathlib import Path
+from typing import Dict, List, Any, Awaitable, Callable, Optional
 from uuid import uuid4
 
 from .models import (
     WorkflowPayload, WorkflowExecutionResponse, AISuggestionRequest, AISuggestionResponse,
-    StylePreset, WorkflowTemplate, Node, NodeType, AIProviderKeyConfig
+    StylePreset, WorkflowTemplate, Node, NodeType, AIProviderKeyConfig, RunSummary, NodeOutputLookupRequest, PromoteRequest, ResumeRequest, MirrorResolveRequest,
+    WorkflowDeltaRequest, WorkflowDeltaResponse
+)
+from .services import (
+    execute_ai_workflow, execute_workflow_delta, promote_preview_run, resume_workflow_run, is_run_active, get_ai_assistant_suggestion, get_run_state, get_provider_latency_stats, find_final_output_url, node_content_hash, PREDEFINED_STYLES,
+    RunNotFound, RunNotResumable
+)
+from .store import close_store
+from .history import get_run_history, close_run_history, prune_run_history
+from .asset_mirror import configure_asset_mirror
+from .thumbnails import configure_thumbnails
+from .graph_sessions import apply_graph_delta, GraphRevisionConflict
+from .run_log import RunLog
+from .serialization import FastJSONResponse, NegotiatedRoute, CompressionMiddleware, etag_for, etag_matches
+from .admission import (
+    AdmissionRejected, PayloadSizeLimitMiddleware, get_admission_controller, check_workflow_size, tenant_id_for, INTERACTIVE_LANE, LANES
 )
-from .services import execute_ai_workflow, get_ai_assistant_suggestion, PREDEFINED_STYLES
 
 dotenv_path = Path(__file__).parent / '.env'
 load_dotenv(dotenv_path)
@@ -21,9 +38,13 @@ BACKEND_BASE_URL = os.getenv("BACKEND_BASE_URL", "http://localhost:8000")
 TEMP_UPLOAD_DIR_NAME = os.getenv("TEMP_UPLOAD_DIR", "temp_uploads")
 TEMP_UPLOAD_PATH = Path(__file__).parent / TEMP_UPLOAD_DIR_NAME
 TEMP_UPLOAD_PATH.mkdir(parents=True, exist_ok=True)
+RUN_HISTORY_RETENTION_DAYS = float(os.getenv("RUN_HISTORY_RETENTION_DAYS", "30"))
 
-app = FastAPI(title="MarketCanvas AI Backend")
+app = FastAPI(title="MarketCanvas AI Backend", default_response_class=FastJSONResponse)
+app.router.route_class = NegotiatedRoute # JSON by default, msgpack when the client sends/accepts application/x-msgpack
 
+app.add_middleware(PayloadSizeLimitMiddleware) # Added first so CORS headers still wrap its 413s
+app.add_middleware(CompressionMiddleware) # Brotli (if installed) or gzip for large API bodies
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["http://localhost:3000"], # Reflex default dev port
@@ -33,6 +54,11 @@ app.add_middleware(
 )
 
 app.mount(f"/{TEMP_UPLOAD_DIR_NAME}", StaticFiles(directory=TEMP_UPLOAD_PATH), name="temp_uploads")
+# Provider outputs are mirrored under the upload mount, e.g. /temp_uploads/mirror/<hash>.png
+ASSET_MIRROR = configure_asset_mirror(TEMP_UPLOAD_PATH / "mirror", f"{BACKEND_BASE_URL}/{TEMP_UPLOAD_DIR_NAME}/mirror")
+# Thumbnails of uploads and mirrored outputs, rendered on first request: /api/v1/assets/thumbnail?url=...&size=192
+THUMBNAILS = configure_thumbnails(TEMP_UPLOAD_PATH / "thumbnails", TEMP_UPLOAD_PATH, f"{BACKEND_BASE_URL}/{TEMP_UPLOAD_DIR_NAME}")
+THUMBNAIL_CACHE_CONTROL = "public, max-age=31536000, immutable" # Artifact URLs never change content
 
 TEMPLATES_DATA_DIR = Path(__file__).parent / "templates_data"
 WORKFLOW_TEMPLATES_CACHE: List[WorkflowTemplate] = []
@@ -40,6 +66,7 @@ WORKFLOW_TEMPLATES_CACHE: List[WorkflowTemplate] = []
 @app.on_event("startup")
 async def startup_event():
     WORKFLOW_TEMPLATES_CACHE.clear() # Clear cache on reload if any
+    _catalog_etags.clear()
     for file_path in TEMPLATES_DATA_DIR.glob("*.json"):
         try:
             with open(file_path, "r") as f:
@@ -49,42 +76,202 @@ async def startup_event():
             print(f"Error loading template {file_path.name}: {e}")
     print(f"Loaded {len(WORKFLOW_TEMPLATES_CACHE)} workflow templates.")
     print(f"Available {len(PREDEFINED_STYLES)} style presets.")
+    pruned = await prune_run_history(RUN_HISTORY_RETENTION_DAYS)
+    if pruned: print(f"Pruned {pruned} runs older than {RUN_HISTORY_RETENTION_DAYS:g} days from run history.")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await close_store()
+    await close_run_history()
+
+DISCONNECT_POLL_INTERVAL_SECONDS = 0.5
+
+async def _run_until_client_disconnects(request: Request, work: Awaitable[Any]) -> Any:
+    # Cancels `work` (and with it every in-flight provider request) as soon as the client goes away.
+    task = asyncio.ensure_future(work)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_INTERVAL_SECONDS)
+            if done: return task.result()
+            if await request.is_disconnected():
+                print("Client disconnected; cancelling workflow execution.")
+                task.cancel()
+                raise asyncio.CancelledError()
+    finally:
+        if not task.done(): task.cancel()
+
+def _check_target_nodes(nodes: List[Node], target_node_ids: Optional[List[str]]):
+    unknown = set(target_node_ids or ()) - {n.id for n in nodes}
+    if unknown: raise HTTPException(status_code=400, detail=f"Unknown target node ids: {', '.join(sorted(unknown))}")
+
+async def _run_admitted(request: Request, make_work: Callable[[], Awaitable[Any]], api_keys: Optional[AIProviderKeyConfig],
+                        tenant_header: Optional[str], lane: Optional[str], cost: float) -> Any:
+    # Holds an execution slot for the whole run, scheduled fairly per tenant; sheds load with 429 + Retry-After when saturated.
+    lane = (lane or INTERACTIVE_LANE).lower()
+    if lane not in LANES: raise HTTPException(status_code=400, detail=f"X-Run-Lane must be one of: {', '.join(LANES)}.")
+    try:
+        async with get_admission_controller().slot(tenant_id_for(api_keys, tenant_header), lane, cost):
+            return await _run_until_client_disconnects(request, make_work())
+    except AdmissionRejected as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+def _log_fields(log: RunLog) -> Dict[str, Any]:
+    records = log.records() # Formatted once, here; suppressed records never were
+    return {"execution_log": [record.message for record in records], "execution_records": records}
 
 @app.get("/")
 async def root_info():
     return {"message": "MarketCanvas AI Backend is active."}
 
 @app.post("/api/v1/workflow/execute", response_model=WorkflowExecutionResponse)
-async def api_execute_workflow_endpoint(workflow_data: WorkflowPayload = Body(...)):
+async def api_execute_workflow_endpoint(request: Request, workflow_data: WorkflowPayload = Body(...),
+                                        x_tenant_id: Optional[str] = Header(None), x_run_lane: Optional[str] = Header(None)):
     if not workflow_data.api_keys:
         return WorkflowExecutionResponse(
             updated_nodes=workflow_data.nodes,
             error="API keys configuration missing in the request payload.",
             execution_log=["Critical Error: API keys configuration not received by backend."]
         )
+    too_large = check_workflow_size(workflow_data.nodes, workflow_data.edges)
+    if too_large: raise HTTPException(status_code=413, detail=too_large)
+    _check_target_nodes(workflow_data.nodes, workflow_data.target_node_ids)
+    if workflow_data.run_id and is_run_active(workflow_data.run_id):
+        raise HTTPException(status_code=409, detail=f"Run '{workflow_data.run_id}' is already executing.")
+    run_id = workflow_data.run_id or str(uuid4())
     try:
-        processed_workflow, log = await execute_ai_workflow(workflow_data)
-        final_output_url = None
-        for node in processed_workflow.nodes: # Find final output from an OutputNode
-            if node.type == NodeType.OUTPUT and node.data.get("output_image_url"):
-                final_output_url = node.data.get("output_image_url")
-                break
+        processed_workflow, log = await _run_admitted(
+            request, lambda: execute_ai_workflow(workflow_data, run_id=run_id),
+            workflow_data.api_keys, x_tenant_id, x_run_lane, cost=len(workflow_data.nodes))
         return WorkflowExecutionResponse(
+            run_id=run_id,
             updated_nodes=processed_workflow.nodes,
-            final_output_url=final_output_url,
-            execution_log=log,
+            final_output_url=find_final_output_url(processed_workflow.nodes),
+            **_log_fields(log),
             error=None # Explicitly None if no error during processing steps
         )
+    except HTTPException:
+        raise
     except Exception as e:
         # This is a fallback for unexpected errors during the endpoint handling itself.
         # Errors within execute_ai_workflow should be part of its returned log/error.
         print(f"Critical unhandled error in /execute endpoint: {e}")
         return WorkflowExecutionResponse(
+            run_id=run_id,
             updated_nodes=workflow_data.nodes, # Return original nodes on such failure
             error=f"Server error during workflow execution: {str(e)}",
             execution_log=[f"Server Critical Error: {str(e)}"]
         )
 
+@app.post("/api/v1/workflow/execute-delta", response_model=WorkflowDeltaResponse)
+async def api_execute_workflow_delta_endpoint(request: Request, delta_data: WorkflowDeltaRequest = Body(...),
+                                              x_tenant_id: Optional[str] = Header(None), x_run_lane: Optional[str] = Header(None)):
+    # Like /execute, but against the session's server-side graph: the client sends changes, gets back changed nodes.
+    if not delta_data.api_keys: raise HTTPException(status_code=400, detail="API keys configuration missing in the request payload.")
+    try:
+        base_revision, nodes, edges = await apply_graph_delta(delta_data)
+    except GraphRevisionConflict as e:
+        raise HTTPException(status_code=409, detail={"message": str(e), "current_revision": e.current_revision})
+    too_large = check_workflow_size(nodes, edges)
+    if too_large: raise HTTPException(status_code=413, detail=too_large)
+    _check_target_nodes(nodes, delta_data.target_node_ids)
+    if delta_data.run_id and is_run_active(delta_data.run_id):
+        raise HTTPException(status_code=409, detail=f"Run '{delta_data.run_id}' is already executing.")
+    run_id = delta_data.run_id or str(uuid4())
+    try:
+        revision, changed_nodes, processed_workflow, log = await _run_admitted(
+            request, lambda: execute_workflow_delta(delta_data, base_revision, nodes, edges, run_id=run_id),
+            delta_data.api_keys, x_tenant_id, x_run_lane, cost=len(nodes))
+    except GraphRevisionConflict as e: # A concurrent delta on the same base saved first
+        raise HTTPException(status_code=409, detail={"message": str(e), "current_revision": e.current_revision})
+    return WorkflowDeltaResponse(
+        run_id=run_id, revision=revision, changed_nodes=changed_nodes,
+        final_output_url=find_final_output_url(processed_workflow.nodes), **_log_fields(log),
+    )
+
+@app.get("/api/v1/workflow/runs/{run_id}")
+async def get_run_state_api_endpoint(run_id: str):
+    state = await get_run_state(run_id)
+    if state is None: raise HTTPException(status_code=404, detail=f"Run '{run_id}' not found or expired.")
+    return {"run_id": run_id, **state}
+
+@app.post("/api/v1/workflow/promote", response_model=WorkflowExecutionResponse)
+async def api_promote_workflow_endpoint(request: Request, promote_data: PromoteRequest = Body(...),
+                                        x_tenant_id: Optional[str] = Header(None), x_run_lane: Optional[str] = Header(None)):
+    run_id = str(uuid4())
+    try:
+        processed_workflow, log = await _run_admitted(
+            request, lambda: promote_preview_run(promote_data, run_id=run_id),
+            promote_data.api_keys, x_tenant_id, x_run_lane, cost=len(promote_data.node_ids))
+    except RunNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    promoted_output = next((n.data.get("output_image_url") for n in processed_workflow.nodes if n.id in promote_data.node_ids), None)
+    return WorkflowExecutionResponse(
+        run_id=run_id,
+        updated_nodes=processed_workflow.nodes, # Only the re-rendered nodes; the client keeps its own copy of the rest
+        final_output_url=find_final_output_url(processed_workflow.nodes) or promoted_output,
+        **_log_fields(log),
+    )
+
+@app.post("/api/v1/workflow/runs/{run_id}/resume", response_model=WorkflowExecutionResponse)
+async def api_resume_workflow_endpoint(request: Request, run_id: str, resume_data: ResumeRequest = Body(...),
+                                       x_tenant_id: Optional[str] = Header(None), x_run_lane: Optional[str] = Header(None)):
+    try:
+        processed_workflow, log = await _run_admitted(
+            request, lambda: resume_workflow_run(run_id, resume_data.api_keys),
+            resume_data.api_keys, x_tenant_id, x_run_lane, cost=1.0)
+    except RunNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except RunNotResumable as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return WorkflowExecutionResponse(
+        run_id=run_id,
+        updated_nodes=processed_workflow.nodes,
+        final_output_url=find_final_output_url(processed_workflow.nodes),
+        **_log_fields(log),
+    )
+
+@app.get("/api/v1/admission")
+async def admission_status_api_endpoint():
+    return get_admission_controller().snapshot()
+
+@app.get("/api/v1/providers/latency")
+async def provider_latency_api_endpoint():
+    return get_provider_latency_stats() # Per "provider:mode": sample count, p50 and p95 seconds (this worker)
+
+# --- Run History ---
+@app.get("/api/v1/runs", response_model=List[RunSummary])
+async def list_recent_runs_api_endpoint(workflow_id: Optional[str] = None, template_id: Optional[str] = None,
+                                        before: Optional[float] = None, limit: int = Query(50, ge=1, le=500)):
+    return await get_run_history().recent_runs(workflow_id=workflow_id, template_id=template_id, before=before, limit=limit)
+
+@app.get("/api/v1/runs/latency")
+async def run_latency_trend_api_endpoint(bucket_seconds: int = Query(3600, ge=60), since: Optional[float] = None,
+                                         workflow_id: Optional[str] = None, template_id: Optional[str] = None):
+    return await get_run_history().latency_trend(bucket_seconds=bucket_seconds, since=since, workflow_id=workflow_id, template_id=template_id)
+
+@app.get("/api/v1/runs/node-outputs/{content_hash}")
+async def last_node_output_by_hash_api_endpoint(content_hash: str):
+    result = await get_run_history().last_output_for_hash(content_hash)
+    if result is None: raise HTTPException(status_code=404, detail="No previous output for this node configuration.")
+    return result
+
+@app.post("/api/v1/runs/node-outputs/lookup")
+async def last_node_output_api_endpoint(lookup: NodeOutputLookupRequest = Body(...)):
+    content_hash = node_content_hash(lookup.node, lookup.inputs)
+    result = await get_run_history().last_output_for_hash(content_hash)
+    if result is None: raise HTTPException(status_code=404, detail="No previous output for this node configuration.")
+    return result
+
+@app.get("/api/v1/runs/{run_id}")
+async def get_run_api_endpoint(run_id: str):
+    run = await get_run_history().get_run(run_id)
+    if run is None: raise HTTPException(status_code=404, detail=f"Run '{run_id}' not found in history.")
+    return run
+
+@app.delete("/api/v1/runs")
+async def prune_runs_api_endpoint(older_than_days: float = Query(..., ge=0)):
+    return {"deleted_runs": await prune_run_history(older_than_days)}
+
 @app.post("/api/v1/ai/suggest", response_model=AISuggestionResponse)
 async def api_get_ai_suggestion_endpoint(request_data: AISuggestionRequest = Body(...)):
     try:
@@ -96,13 +283,27 @@ async def api_get_ai_suggestion_endpoint(request_data: AISuggestionRequest = Bod
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error getting suggestion: {str(e)}")
 
+# Catalogs only change on restart; clients cache them and revalidate with If-None-Match instead of re-downloading.
+CATALOG_CACHE_CONTROL = "public, max-age=60"
+_catalog_etags: Dict[str, str] = {}
+
+def _catalog_response(name: str, items: list, if_none_match: Optional[str], response: Response):
+    etag = _catalog_etags.get(name)
+    if etag is None: etag = _catalog_etags[name] = etag_for([item.model_dump(mode="json") for item in items])
+    headers = {"ETag": etag, "Cache-Control": CATALOG_CACHE_CONTROL}
+    if etag_matches(etag, if_none_match): return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return items
+
 @app.get("/api/v1/styles/presets", response_model=List[StylePreset])
-async def get_style_presets_api_endpoint():
-    return PREDEFINED_STYLES
+async def get_style_presets_api_endpoint(response: Response, if_none_match: Optional[str] = Header(None)):
+    return _catalog_response("styles", PREDEFINED_STYLES, if_none_match, response)
 
 @app.get("/api/v1/workflows/templates", response_model=List[WorkflowTemplate])
-async def get_workflow_templates_api_endpoint():
-    return WORKFLOW_TEMPLATES_CACHE
+async def get_workflow_templates_api_endpoint(response: Response, if_none_match: Optional[str] = Header(None)):
+    return _catalog_response("templates", WORKFLOW_TEMPLATES_CACHE, if_none_match, response)
+
+UPLOAD_COPY_CHUNK_BYTES = 1024 * 1024
 
 @app.post("/api/v1/assets/upload")
 async def upload_asset_api_endpoint(file: UploadFile = File(...)):
@@ -117,10 +318,22 @@ async def upload_asset_api_endpoint(file: UploadFile = File(...)):
 
     try:
         async with aiofiles.open(file_path, 'wb') as out_file:
-            content = await file.read()  # Read content from UploadFile
-            await out_file.write(content)
+            while chunk := await file.read(UPLOAD_COPY_CHUNK_BYTES): # Never the whole file in memory
+                await out_file.write(chunk)
         
         file_url = f"{BACKEND_BASE_URL}/{TEMP_UPLOAD_DIR_NAME}/{unique_filename}"
         return {"file_url": file_url, "file_name": file.filename} # Return original filename for display
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to save uploaded file: {str(e)}")
+
+@app.get("/api/v1/assets/thumbnail")
+async def asset_thumbnail_api_endpoint(url: str = Query(..., max_length=2048), size: int = Query(192, ge=16, le=1024)):
+    # 404 when Pillow isn't installed or there's no local copy to render from (yet); clients then fall back to the original.
+    path = await THUMBNAILS.get(url, size)
+    if path is None: raise HTTPException(status_code=404, detail="No thumbnail available for this asset.", headers={"Cache-Control": "no-store"})
+    return FileResponse(path, media_type=f"image/{path.suffix.lstrip('.')}", headers={"Cache-Control": THUMBNAIL_CACHE_CONTROL})
+
+@app.post("/api/v1/assets/mirror/resolve")
+async def resolve_mirrored_assets_api_endpoint(request_data: MirrorResolveRequest = Body(...)):
+    # remote URL -> local URL, or null while the download is still running (keep using the remote URL until then)
+    return await ASSET_MIRROR.resolve_shared(request_data.urls[:500])
@@ -1,4 +1,4 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, PositiveFloat
 from typing import List, Dict, Any, Optional, Union
 from enum import Enum
 from uuid import uuid4
@@ -13,6 +13,16 @@ class NodeType(str, Enum):
     TEXT_OVERLAY = "textOverlay"
     OUTPUT = "outputNode"
 
+class ExecutionMode(str, Enum):
+    FULL = "full"
+    PREVIEW = "preview" # Small images, fewer steps, seeds recorded for later promotion
+
+class LogLevel(str, Enum):
+    DEBUG = "debug"
+    INFO = "info"
+    WARN = "warn"
+    ERROR = "error"
+
 class StyleApplicationMode(str, Enum):
     PRESET = "preset"
     IMAGE_REFERENCE = "image_reference"
@@ -20,8 +30,10 @@ class StyleApplicationMode(str, Enum):
 class BaseNodeData(BaseModel):
     label: Optional[str] = None
     output_image_url: Optional[str] = None
+    mirrored_image_url: Optional[str] = None # Local copy of a remote output_image_url, once downloaded
     error_message: Optional[str] = None
     provider: Optional[str] = None # For nodes supporting multiple AI backends
+    is_preview: Optional[bool] = None # Output was rendered in preview mode
 
 class ImageUploadNodeData(BaseNodeData):
     file_name: Optional[str] = None
@@ -33,6 +45,10 @@ class TextToImageNodeData(BaseNodeData):
     prompt: str = "A stunning futuristic cityscape at dusk"
     negative_prompt: Optional[str] = None
     seed: Optional[int] = None
+    preview_seed: Optional[int] = None # Seed a preview run used; promotion re-renders with it
+    fallback_provider: Optional[str] = None # Secondary provider used when the primary fails (needs its API key)
+    hedge: Optional[bool] = None # Also race fallback_provider once the primary exceeds its tracked p95 latency
+    served_by_provider: Optional[str] = None # Set when the fallback/hedge provider produced the output
     # provider field inherited from BaseNodeData, e.g., "fal_ai", "google_gemini", "stability_ai"
 
 class ProductInSceneNodeData(BaseNodeData):
@@ -96,17 +112,84 @@ class AIProviderKeyConfig(BaseModel):
     pipecat_api_key: Optional[str] = None # For AI assistant
     # blackforest_flux_key: Optional[str] = None # Example for future extension
 
-class WorkflowPayload(BaseModel):
+class WorkflowRunOptions(BaseModel):
+    """How to execute a graph; shared by full payloads and graph deltas."""
+    api_keys: Optional[AIProviderKeyConfig] = None # Mandatory for execution (checked there); template payloads carry none
+    template_id: Optional[str] = None # Template the canvas was loaded from, if any
+    execution_mode: ExecutionMode = ExecutionMode.FULL
+    deadline_seconds: Optional[float] = Field(default=None, gt=0) # Whole-run budget; server default if None
+    node_timeouts: Dict[NodeType, PositiveFloat] = Field(default_factory=dict) # Per-node-type overrides, e.g. {"textToImage": 90}
+    run_id: Optional[str] = Field(default=None, min_length=8, max_length=64) # Client-chosen, so an interrupted run can be resumed by id
+    target_node_ids: Optional[List[str]] = None # Run only these nodes and their ancestors ("run up to here"); None runs everything
+    log_level: Optional[LogLevel] = None # Execution log verbosity; server default (EXECUTION_LOG_LEVEL) if None
+
+class WorkflowPayload(WorkflowRunOptions):
     nodes: List[Node]
     edges: List[Edge]
-    api_keys: AIProviderKeyConfig # User-provided API keys are now mandatory for execution
+    workflow_id: Optional[str] = None # Client-side canvas/session id, used to group run history
+
+class ExecutionLogRecord(BaseModel):
+    level: LogLevel
+    message: str
+    node_id: Optional[str] = None
+    ts: float # Unix seconds
+    duration_ms: Optional[float] = None # Node records: how long the node took
 
 class WorkflowExecutionResponse(BaseModel):
+    run_id: Optional[str] = None # Look up run state from any worker via /api/v1/workflow/runs/{run_id}
     updated_nodes: List[Node]
     final_output_url: Optional[str] = None
-    execution_log: List[str] = Field(default_factory=list)
+    execution_log: List[str] = Field(default_factory=list) # Plain-text messages of execution_records
+    execution_records: List[ExecutionLogRecord] = Field(default_factory=list)
+    error: Optional[str] = None
+
+class WorkflowDeltaRequest(WorkflowRunOptions):
+    """Only what changed since `base_revision`; the backend keeps the rest of the graph for the session."""
+    session_id: str = Field(min_length=1, max_length=64) # The canvas workflow_id
+    base_revision: Optional[int] = None # Revision the client last synced; None replaces the session graph with upserted_*
+    upserted_nodes: List[Node] = Field(default_factory=list)
+    removed_node_ids: List[str] = Field(default_factory=list)
+    upserted_edges: List[Edge] = Field(default_factory=list)
+    removed_edge_ids: List[str] = Field(default_factory=list)
+
+class WorkflowDeltaResponse(BaseModel):
+    run_id: Optional[str] = None
+    revision: int # The session graph now matches the client's graph with changed_nodes applied
+    changed_nodes: List[Node] = Field(default_factory=list) # Only nodes whose data the run changed
+    final_output_url: Optional[str] = None
+    execution_log: List[str] = Field(default_factory=list) # Plain-text messages of execution_records
+    execution_records: List[ExecutionLogRecord] = Field(default_factory=list)
     error: Optional[str] = None
 
+class PromoteRequest(BaseModel):
+    run_id: str # A previous (preview) run from the run history
+    node_ids: List[str] # Chosen variant(s); only these and their ancestors are re-rendered at full quality
+    api_keys: AIProviderKeyConfig
+    log_level: Optional[LogLevel] = None
+
+class ResumeRequest(BaseModel):
+    api_keys: AIProviderKeyConfig # Keys are never checkpointed, so they are supplied again
+
+class MirrorResolveRequest(BaseModel):
+    urls: List[str]
+
+class RunSummary(BaseModel):
+    run_id: str
+    workflow_id: Optional[str] = None
+    template_id: Optional[str] = None
+    execution_mode: Optional[str] = None
+    status: str
+    started_at: float
+    finished_at: Optional[float] = None
+    duration_ms: Optional[float] = None
+    node_count: Optional[int] = None
+    final_output_url: Optional[str] = None
+    error: Optional[str] = None
+
+class NodeOutputLookupRequest(BaseModel):
+    node: Node
+    inputs: Dict[str, Optional[str]] = Field(default_factory=dict) # target handle -> input image URL
+
 class AISuggestionRequest(BaseModel):
     current_workflow: Optional[WorkflowPayload] = None # api_keys within current_workflow can be used
     user_query: Optional[str] = None
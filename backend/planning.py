@@ -0,0 +1,142 @@
+import hashlib
+from collections import OrderedDict
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import List, Dict, Iterable, Mapping, Optional, Set, Tuple
+from .models import Node, Edge
+
+PLAN_CACHE_MAX_ENTRIES = 256
+
+@dataclass(frozen=True)
+class InputBinding:
+    source_id: str
+    source_handle: str # "default_out" when the edge has no sourceHandle
+    target_handle: str # "default_in" when the edge has no targetHandle
+
+@dataclass(frozen=True)
+class ExecutionPlan:
+    """Immutable, topology-only view of a workflow graph. Node data (prompts, seeds...) is never part of it."""
+    topology_hash: str
+    levels: Tuple[Tuple[str, ...], ...] # Nodes in one level only depend on earlier levels
+    bindings: Mapping[str, Tuple[InputBinding, ...]] # target node id -> its inputs, one per incoming edge
+    cycles: Tuple[Tuple[str, ...], ...] # Strongly connected components that form a cycle
+    blocked: Mapping[str, str] # node id -> reason it can't run (in a cycle or downstream of one)
+
+    @property
+    def order(self) -> List[str]: return [node_id for level in self.levels for node_id in level]
+
+    def upstream_ids(self, node_id: str) -> List[str]: return [b.source_id for b in self.bindings.get(node_id, ())]
+
+    def ancestor_closure(self, node_ids: Iterable[str]) -> Set[str]:
+        # The given nodes plus everything they (transitively) take input from.
+        closure: Set[str] = set()
+        stack = list(node_ids)
+        while stack:
+            node_id = stack.pop()
+            if node_id in closure: continue
+            closure.add(node_id)
+            stack.extend(self.upstream_ids(node_id))
+        return closure
+
+def topology_hash(nodes: List[Node], edges: List[Edge]) -> str:
+    # Only ids, types and wiring matter; positions and node data don't change the plan.
+    h = hashlib.sha256()
+    for node in sorted(nodes, key=lambda n: n.id): h.update(f"n|{node.id}|{node.type.value}\n".encode())
+    for edge in sorted(edges, key=lambda e: (e.source, e.target, e.sourceHandle or "", e.targetHandle or "")):
+        h.update(f"e|{edge.source}|{edge.sourceHandle or ''}|{edge.target}|{edge.targetHandle or ''}\n".encode())
+    return h.hexdigest()
+
+def _strongly_connected_components(node_ids: List[str], adj: Dict[str, List[str]]) -> List[List[str]]:
+    # Iterative Tarjan, so deep graphs don't hit the recursion limit.
+    index: Dict[str, int] = {}
+    lowlink: Dict[str, int] = {}
+    on_stack: set = set()
+    stack: List[str] = []
+    components: List[List[str]] = []
+    counter = 0
+    for root in node_ids:
+        if root in index: continue
+        work = [(root, 0)]
+        while work:
+            v, child_idx = work.pop()
+            if child_idx == 0:
+                index[v] = lowlink[v] = counter; counter += 1
+                stack.append(v); on_stack.add(v)
+            recurse = False
+            children = adj[v]
+            while child_idx < len(children):
+                w = children[child_idx]; child_idx += 1
+                if w not in index:
+                    work.append((v, child_idx)); work.append((w, 0))
+                    recurse = True
+                    break
+                if w in on_stack: lowlink[v] = min(lowlink[v], index[w])
+            if recurse: continue
+            if lowlink[v] == index[v]:
+                component = []
+                while True:
+                    w = stack.pop(); on_stack.discard(w); component.append(w)
+                    if w == v: break
+                components.append(component)
+            if work: lowlink[work[-1][0]] = min(lowlink[work[-1][0]], lowlink[v])
+    return components
+
+def compile_execution_plan(nodes: List[Node], edges: List[Edge], topo_hash: Optional[str] = None) -> ExecutionPlan:
+    node_ids = [node.id for node in nodes]
+    known = set(node_ids)
+    adj: Dict[str, List[str]] = {node_id: [] for node_id in node_ids}
+    in_degree: Dict[str, int] = {node_id: 0 for node_id in node_ids}
+    bindings: Dict[str, List[InputBinding]] = {}
+    for edge in edges:
+        if edge.source not in known or edge.target not in known: continue # Dangling edge, ignore
+        adj[edge.source].append(edge.target)
+        in_degree[edge.target] += 1
+        bindings.setdefault(edge.target, []).append(
+            InputBinding(edge.source, edge.sourceHandle or "default_out", edge.targetHandle or "default_in"))
+
+    levels: List[Tuple[str, ...]] = []
+    frontier = [node_id for node_id in node_ids if in_degree[node_id] == 0]
+    while frontier:
+        levels.append(tuple(frontier))
+        next_frontier = []
+        for u in frontier:
+            for v in adj[u]:
+                in_degree[v] -= 1
+                if in_degree[v] == 0: next_frontier.append(v)
+        frontier = next_frontier
+
+    cycles: List[Tuple[str, ...]] = []
+    blocked: Dict[str, str] = {}
+    placed = sum(len(level) for level in levels)
+    if placed != len(node_ids):
+        leftover = [node_id for node_id in node_ids if in_degree[node_id] > 0]
+        leftover_adj = {node_id: [v for v in adj[node_id] if in_degree[v] > 0] for node_id in leftover}
+        for component in _strongly_connected_components(leftover, leftover_adj):
+            if len(component) > 1 or component[0] in leftover_adj[component[0]]:
+                cycle = tuple(reversed(component))
+                cycles.append(cycle)
+                for node_id in cycle: blocked[node_id] = f"Node is part of a cycle: {' -> '.join(cycle)}."
+        for node_id in leftover:
+            blocked.setdefault(node_id, "Node is downstream of a cycle and cannot run.")
+
+    return ExecutionPlan(
+        topology_hash=topo_hash or topology_hash(nodes, edges),
+        levels=tuple(levels),
+        bindings=MappingProxyType({k: tuple(v) for k, v in bindings.items()}),
+        cycles=tuple(cycles),
+        blocked=MappingProxyType(blocked),
+    )
+
+_PLAN_CACHE: "OrderedDict[str, ExecutionPlan]" = OrderedDict()
+
+def get_execution_plan(nodes: List[Node], edges: List[Edge]) -> Tuple[ExecutionPlan, bool]:
+    """Returns (plan, cache_hit). Plans are shared across runs, so they must never be mutated."""
+    key = topology_hash(nodes, edges)
+    plan = _PLAN_CACHE.get(key)
+    if plan is not None:
+        _PLAN_CACHE.move_to_end(key)
+        return plan, True
+    plan = compile_execution_plan(nodes, edges, topo_hash=key)
+    _PLAN_CACHE[key] = plan
+    if len(_PLAN_CACHE) > PLAN_CACHE_MAX_ENTRIES: _PLAN_CACHE.popitem(last=False)
+    return plan, False
@@ -0,0 +1,217 @@
+"""Headless batch runner: push many input rows through a workflow template without the HTTP API or the UI.
+
+    python -m backend.run --template template_social_ad_v1 --input products.csv --output results.jsonl
+
+Each input row overrides node data with `<node_id>.<field>` keys (CSV columns or JSONL object keys), e.g.
+`prod_upload.output_image_url` or `text_overlay_node.text_content`. An optional `row_id` key names the row.
+With a directory of images, each file becomes one row bound to `--image-node` (default: the first image node).
+Provider API keys are read from FAL_AI_KEY, GOOGLE_GEMINI_KEY, STABILITY_AI_KEY and PIPECAT_API_KEY.
+Progress is checkpointed next to the output file, so re-running the same command resumes where it stopped.
+Failed rows are listed in the checkpoint and run again on the next invocation (their retry appends a new result line).
+"""
+import os
+import csv
+import sys
+import json
+import time
+import asyncio
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+from uuid import uuid4
+from dotenv import load_dotenv
+from pydantic import TypeAdapter, ValidationError
+
+from .models import WorkflowTemplate, WorkflowPayload, AIProviderKeyConfig, ExecutionMode, Node, NodeType, BaseNodeData
+from .services import execute_ai_workflow, configure_local_op_executor, find_final_output_url, NODE_DATA_MODELS
+from .store import close_store
+from .history import close_run_history
+
+TEMPLATES_DATA_DIR = Path(__file__).parent / "templates_data"
+IMAGE_EXTENSIONS = {".png", ".jpg", ".jpeg", ".webp", ".gif", ".bmp"}
+CHECKPOINT_EVERY_ROWS = 50
+CHECKPOINT_EVERY_SECONDS = 10.0
+
+def load_template(name_or_id: str) -> WorkflowTemplate:
+    candidate = Path(name_or_id)
+    if candidate.suffix == ".json" and candidate.exists(): return WorkflowTemplate(**json.loads(candidate.read_text()))
+    for file_path in sorted(TEMPLATES_DATA_DIR.glob("*.json")):
+        template = WorkflowTemplate(**json.loads(file_path.read_text()))
+        if name_or_id in (template.id, file_path.stem): return template
+    raise SystemExit(f"Template '{name_or_id}' not found in {TEMPLATES_DATA_DIR}.")
+
+def _default_image_node(template: WorkflowTemplate) -> str:
+    node = next((n for n in template.workflow_payload.nodes if n.type in (NodeType.IMAGE_UPLOAD, NodeType.IMAGE_INPUT)), None)
+    if node is None: raise SystemExit("Template has no image input node; pass --image-node.")
+    return node.id
+
+def iter_rows(input_path: Path, image_node: Optional[Node], image_base_url: Optional[str]) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    # Generators all the way down: only the rows currently in flight are held in memory.
+    if input_path.is_dir():
+        field = "input_image_url" if image_node.type == NodeType.IMAGE_INPUT else "output_image_url"
+        files = (p for p in sorted(input_path.iterdir()) if p.suffix.lower() in IMAGE_EXTENSIONS)
+        for index, file_path in enumerate(files):
+            url = f"{image_base_url.rstrip('/')}/{file_path.name}" if image_base_url else file_path.resolve().as_uri()
+            yield index, {"row_id": file_path.stem, f"{image_node.id}.{field}": url, f"{image_node.id}.file_name": file_path.name}
+    elif input_path.suffix.lower() == ".csv":
+        with open(input_path, newline="") as f:
+            for index, row in enumerate(csv.DictReader(f)): yield index, row
+    elif input_path.suffix.lower() in (".jsonl", ".ndjson"):
+        with open(input_path) as f:
+            index = 0
+            for line in f:
+                if not line.strip(): continue
+                yield index, json.loads(line)
+                index += 1
+    else:
+        raise SystemExit(f"Unsupported input '{input_path}': expected a .csv, .jsonl file or a directory of images.")
+
+def _coerce(node_type: NodeType, field: str, value: Any) -> Any:
+    # CSV cells are strings; convert by the field's declared type, so "2024" stays a string label but becomes an int font size.
+    field_info = NODE_DATA_MODELS.get(node_type, BaseNodeData).model_fields.get(field)
+    if not isinstance(value, str) or field_info is None: return value
+    try: return TypeAdapter(field_info.annotation).validate_python(value)
+    except ValidationError: return value # Left for the node model to report when the row runs
+
+def build_payload(template: WorkflowTemplate, row: Dict[str, Any], api_keys: AIProviderKeyConfig, mode: ExecutionMode) -> WorkflowPayload:
+    base = template.workflow_payload
+    nodes = [Node(**n.model_dump()) for n in base.nodes]
+    nodes_by_id = {n.id: n for n in nodes}
+    for key, value in row.items():
+        if key == "row_id" or "." not in key or value in (None, ""): continue
+        node_id, field = key.split(".", 1)
+        if node_id not in nodes_by_id: raise ValueError(f"Unknown node '{node_id}' in column '{key}'.")
+        nodes_by_id[node_id].data[field] = _coerce(nodes_by_id[node_id].type, field, value)
+    return WorkflowPayload(nodes=nodes, edges=base.edges, api_keys=api_keys, template_id=template.id, execution_mode=mode)
+
+class Checkpoint:
+    """Finished rows as a contiguous watermark plus the few finished out of order, and the failed rows to retry.
+
+    Failed rows still advance the watermark, so apart from the failures the size stays bounded by concurrency.
+    """
+    def __init__(self, path: Path):
+        self.path = path
+        self.watermark = 0 # Every row index below this has finished
+        self.done_ahead: Set[int] = set()
+        self.failed: Set[int] = set() # Finished but failed; not done, so the next invocation retries them
+        if path.exists():
+            state = json.loads(path.read_text())
+            self.watermark, self.done_ahead, self.failed = state["watermark"], set(state["done_ahead"]), set(state.get("failed", ()))
+
+    def is_done(self, index: int) -> bool: return (index < self.watermark or index in self.done_ahead) and index not in self.failed
+
+    def mark_done(self, index: int, failed: bool = False):
+        if failed: self.failed.add(index)
+        else: self.failed.discard(index)
+        if index >= self.watermark: self.done_ahead.add(index) # Retried failures are already below it
+        while self.watermark in self.done_ahead:
+            self.done_ahead.discard(self.watermark)
+            self.watermark += 1
+
+    def save(self):
+        tmp_path = self.path.with_suffix(self.path.suffix + ".tmp")
+        tmp_path.write_text(json.dumps({"watermark": self.watermark, "done_ahead": sorted(self.done_ahead), "failed": sorted(self.failed),
+                                        "saved_at": time.time()}))
+        os.replace(tmp_path, self.path)
+
+def _summarise(row_id: str, index: int, workflow: WorkflowPayload, started: float, run_id: Optional[str]) -> Dict[str, Any]:
+    errors = {n.id: n.data["error_message"] for n in workflow.nodes if n.data.get("error_message")}
+    return {
+        "row_index": index, "row_id": row_id, "run_id": run_id, "status": "failed" if errors else "completed",
+        "final_output_url": find_final_output_url(workflow.nodes),
+        "node_outputs": {n.id: n.data.get("output_image_url") for n in workflow.nodes if n.data.get("output_image_url")},
+        "errors": errors, "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+    }
+
+async def run_batch(args: argparse.Namespace) -> int:
+    template = load_template(args.template)
+    image_node_id = args.image_node or (_default_image_node(template) if Path(args.input).is_dir() else None)
+    image_node = next((n for n in template.workflow_payload.nodes if n.id == image_node_id), None)
+    api_keys = AIProviderKeyConfig(
+        fal_ai_key=os.getenv("FAL_AI_KEY"), google_gemini_key=os.getenv("GOOGLE_GEMINI_KEY"),
+        stability_ai_key=os.getenv("STABILITY_AI_KEY"), pipecat_api_key=os.getenv("PIPECAT_API_KEY"))
+    mode = ExecutionMode.PREVIEW if args.preview else ExecutionMode.FULL
+    output_path = Path(args.output)
+    checkpoint = Checkpoint(Path(args.checkpoint or f"{output_path}.checkpoint"))
+    if checkpoint.watermark or checkpoint.done_ahead:
+        print(f"Resuming after row {checkpoint.watermark} ({len(checkpoint.done_ahead)} more done ahead, {len(checkpoint.failed)} failed to retry).")
+
+    queue: "asyncio.Queue[Optional[Tuple[int, Dict[str, Any]]]]" = asyncio.Queue(maxsize=args.concurrency * 2)
+    counts = {"completed": 0, "failed": 0, "skipped": 0}
+    last_save = time.monotonic()
+
+    with open(output_path, "a") as out_file:
+        def record(result: Dict[str, Any]):
+            nonlocal last_save
+            out_file.write(json.dumps(result) + "\n")
+            checkpoint.mark_done(result["row_index"], failed=result["status"] == "failed") # Failed rows are retried on the next run
+            counts[result["status"]] += 1
+            finished = counts["completed"] + counts["failed"]
+            if finished % CHECKPOINT_EVERY_ROWS == 0 or time.monotonic() - last_save > CHECKPOINT_EVERY_SECONDS:
+                out_file.flush(); checkpoint.save(); last_save = time.monotonic() # Results are on disk before the checkpoint claims them
+                print(f"{finished} rows done ({counts['failed']} failed, {counts['skipped']} skipped).", file=sys.stderr)
+
+        async def worker():
+            while True:
+                item = await queue.get()
+                if item is None: return
+                index, row = item
+                row_id = str(row.get("row_id") or index)
+                started = time.perf_counter()
+                run_id = str(uuid4()) if args.record_history else None
+                try:
+                    workflow, _ = await execute_ai_workflow(build_payload(template, row, api_keys, mode), run_id=run_id)
+                    record(_summarise(row_id, index, workflow, started, run_id))
+                except Exception as e:
+                    record({"row_index": index, "row_id": row_id, "run_id": run_id, "status": "failed", "errors": {"_row": str(e)},
+                            "duration_ms": round((time.perf_counter() - started) * 1000, 1)})
+
+        workers = [asyncio.ensure_future(worker()) for _ in range(args.concurrency)]
+        try:
+            for index, row in iter_rows(Path(args.input), image_node, args.image_base_url):
+                if args.limit is not None and index >= args.limit: break
+                if checkpoint.is_done(index): counts["skipped"] += 1; continue
+                await queue.put((index, row)) # Blocks while the workers are saturated, so reading never runs ahead
+            for _ in workers: await queue.put(None)
+            await asyncio.gather(*workers)
+        finally:
+            for w in workers: w.cancel()
+            out_file.flush(); checkpoint.save()
+
+    print(f"Done: {counts['completed']} completed, {counts['failed']} failed, {counts['skipped']} already done. Results: {output_path}")
+    return 1 if counts["failed"] else 0
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m backend.run", description="Run a workflow template over many input rows.")
+    parser.add_argument("--template", required=True, help="Template id, file stem in templates_data/, or path to a template .json")
+    parser.add_argument("--input", required=True, help="CSV file, JSONL file, or directory of images")
+    parser.add_argument("--output", required=True, help="JSONL file results are appended to")
+    parser.add_argument("--checkpoint", help="Progress file (default: <output>.checkpoint)")
+    parser.add_argument("--concurrency", type=int, default=8, help="Rows executed concurrently (default: 8)")
+    parser.add_argument("--local-op-workers", type=int, default=os.cpu_count() or 1, help="Process pool size for local image ops, 0 to run inline")
+    parser.add_argument("--image-node", help="Node that receives each image when --input is a directory")
+    parser.add_argument("--image-base-url", help="Public URL prefix the image directory is served from (default: file:// URIs)")
+    parser.add_argument("--preview", action="store_true", help="Run in preview mode (small images, fewer steps)")
+    parser.add_argument("--record-history", action="store_true", help="Also record every row in the run history database")
+    parser.add_argument("--limit", type=int, help="Only process the first N rows")
+    args = parser.parse_args(argv)
+    if args.concurrency < 1: parser.error("--concurrency must be at least 1")
+    return args
+
+async def _main(args: argparse.Namespace) -> int:
+    pool = ProcessPoolExecutor(max_workers=args.local_op_workers) if args.local_op_workers > 0 else None
+    configure_local_op_executor(pool)
+    try: return await run_batch(args)
+    finally:
+        configure_local_op_executor(None)
+        if pool: pool.shutdown()
+        await close_store()
+        await close_run_history()
+
+def main(argv: Optional[List[str]] = None) -> int:
+    load_dotenv(Path(__file__).parent / ".env")
+    return asyncio.run(_main(parse_args(argv)))
+
+if __name__ == "__main__":
+    sys.exit(main())
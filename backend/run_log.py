@@ -0,0 +1,46 @@
+import os
+import time
+from collections import deque
+from typing import Any, Deque, List, Optional, Tuple
+from .models import ExecutionLogRecord, LogLevel
+
+# Structured per-run execution log. Records are kept unformatted (format string + args) and only rendered when the
+# response is built; records below the run's level are dropped before anything is formatted.
+LEVEL_ORDER = {LogLevel.DEBUG: 10, LogLevel.INFO: 20, LogLevel.WARN: 30, LogLevel.ERROR: 40}
+DEFAULT_EXECUTION_LOG_LEVEL = LogLevel(os.getenv("EXECUTION_LOG_LEVEL", LogLevel.INFO.value))
+RUN_LOG_MAX_RECORDS = int(os.getenv("RUN_LOG_MAX_RECORDS", "2000")) # Per run; the oldest records go first
+
+_Record = Tuple[LogLevel, str, Tuple[Any, ...], Optional[str], float, Optional[float]] # level, fmt, args, node id, ts, duration
+
+def _format(fmt: str, args: Tuple[Any, ...]) -> str:
+    try: return fmt % args if args else fmt
+    except (TypeError, ValueError): return f"{fmt} {args!r}" # A bad format string shouldn't lose the record
+
+class RunLog:
+    def __init__(self, min_level: Optional[LogLevel] = None, max_records: int = RUN_LOG_MAX_RECORDS):
+        self.min_level = min_level or DEFAULT_EXECUTION_LOG_LEVEL
+        self._threshold = LEVEL_ORDER[self.min_level]
+        self._records: Deque[_Record] = deque(maxlen=max_records)
+        self.dropped = 0 # Records evicted because the run logged more than max_records
+
+    def enabled(self, level: LogLevel) -> bool: return LEVEL_ORDER[level] >= self._threshold
+
+    def log(self, level: LogLevel, fmt: str, *args: Any, node_id: Optional[str] = None, duration_ms: Optional[float] = None):
+        if LEVEL_ORDER[level] < self._threshold: return # Suppressed: args are never formatted
+        if len(self._records) == self._records.maxlen: self.dropped += 1
+        self._records.append((level, fmt, args, node_id, time.time(), duration_ms))
+
+    def debug(self, fmt: str, *args: Any, **fields: Any): self.log(LogLevel.DEBUG, fmt, *args, **fields)
+    def info(self, fmt: str, *args: Any, **fields: Any): self.log(LogLevel.INFO, fmt, *args, **fields)
+    def warn(self, fmt: str, *args: Any, **fields: Any): self.log(LogLevel.WARN, fmt, *args, **fields)
+    def error(self, fmt: str, *args: Any, **fields: Any): self.log(LogLevel.ERROR, fmt, *args, **fields)
+
+    def records(self) -> List[ExecutionLogRecord]:
+        records = [ExecutionLogRecord(level=level, message=_format(fmt, args), node_id=node_id, ts=ts, duration_ms=duration_ms)
+                   for level, fmt, args, node_id, ts, duration_ms in self._records]
+        if self.dropped:
+            records.insert(0, ExecutionLogRecord(level=LogLevel.WARN, ts=records[0].ts,
+                                                 message=f"{self.dropped} earlier log records dropped (limit {self._records.maxlen})."))
+        return records
+
+    def lines(self) -> List[str]: return [record.message for record in self.records()] # Plain-text form, as stored in run history
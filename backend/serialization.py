@@ -0,0 +1,118 @@
+import gzip
+import hashlib
+import asyncio
+import contextvars
+from typing import Any, Callable, Optional
+import orjson
+from fastapi import Request
+from fastapi.responses import JSONResponse, Response
+from fastapi.routing import APIRoute
+
+try:
+    import msgpack # Optional: binary bodies for clients that send/accept application/x-msgpack
+except ImportError:
+    msgpack = None
+try:
+    import brotli # Optional: preferred over gzip when the client accepts "br"
+except ImportError:
+    brotli = None
+
+MSGPACK_MEDIA_TYPE = "application/x-msgpack"
+COMPRESSION_MIN_BYTES = 1024 # Below this the headers cost more than compression saves
+COMPRESSION_THREAD_MIN_BYTES = 256 * 1024 # Bigger bodies are compressed off the event loop
+GZIP_LEVEL = 5
+BROTLI_QUALITY = 4 # Fast settings; large node lists are highly repetitive and compress well anyway
+_COMPRESSIBLE_TYPES = ("application/json", MSGPACK_MEDIA_TYPE, "text/plain", "text/html") # Never text/event-stream, it must stream
+
+_response_format: contextvars.ContextVar[str] = contextvars.ContextVar("response_format", default="json")
+
+def dumps(content: Any) -> bytes:
+    # orjson handles datetimes, enums and dataclasses natively; non-str keys cover Dict[NodeType, float] fields.
+    return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+def etag_for(content: Any) -> str:
+    # Weak: the same content may go out as JSON or msgpack, compressed or not.
+    return f'W/"{hashlib.blake2b(dumps(content), digest_size=12).hexdigest()}"'
+
+def etag_matches(etag: str, if_none_match: Optional[str]) -> bool:
+    if not if_none_match: return False
+    candidates = {tag.strip() for tag in if_none_match.split(",")}
+    return "*" in candidates or etag in candidates or etag[2:] in candidates # Weak comparison: W/"x" matches "x"
+
+def _accepts_msgpack(accept: Optional[str]) -> bool: return bool(msgpack) and MSGPACK_MEDIA_TYPE in (accept or "")
+
+class FastJSONResponse(JSONResponse):
+    """orjson-encoded JSON, or msgpack when the route negotiated it with the client."""
+    def render(self, content: Any) -> bytes:
+        if _response_format.get() == "msgpack":
+            self.media_type = MSGPACK_MEDIA_TYPE
+            return msgpack.packb(content, use_bin_type=True)
+        return dumps(content)
+
+class NegotiatedRoute(APIRoute):
+    """Accepts msgpack request bodies and answers in msgpack when the client's Accept header asks for it."""
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+
+        async def route_handler(request: Request) -> Response:
+            if msgpack and request.headers.get("content-type", "").startswith(MSGPACK_MEDIA_TYPE):
+                body = dumps(msgpack.unpackb(await request.body(), raw=False))
+                headers = [(k, v) for k, v in request.scope["headers"] if k not in (b"content-type", b"content-length")]
+                request = Request({**request.scope, "headers": headers + [(b"content-type", b"application/json")]}, request.receive)
+                request._body = body # Starlette reads the cached body instead of the (already consumed) stream
+            token = _response_format.set("msgpack" if _accepts_msgpack(request.headers.get("accept")) else "json")
+            try: response = await handler(request)
+            finally: _response_format.reset(token)
+            response.headers.add_vary_header("Accept")
+            return response
+        return route_handler
+
+def _pick_encoding(accept_encoding: str) -> Optional[str]:
+    offered = {part.split(";")[0].strip().lower() for part in accept_encoding.split(",")}
+    if brotli and "br" in offered: return "br"
+    if "gzip" in offered: return "gzip"
+    return None
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br": return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL)
+
+class CompressionMiddleware:
+    """Brotli/gzip for buffered API bodies (JSON, msgpack) above a size threshold; streamed and binary responses pass through."""
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_BYTES):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http": return await self.app(scope, receive, send)
+        encoding = _pick_encoding(dict(scope["headers"]).get(b"accept-encoding", b"").decode("latin-1"))
+        if encoding is None: return await self.app(scope, receive, send)
+        start_message = None
+        chunks = []
+        passthrough = False
+
+        async def buffering_send(message):
+            nonlocal start_message, passthrough
+            if passthrough: return await send(message)
+            if message["type"] == "http.response.start":
+                headers = {k.lower(): v for k, v in message.get("headers", [])}
+                content_type = headers.get(b"content-type", b"").decode("latin-1")
+                if b"content-encoding" in headers or not content_type.startswith(_COMPRESSIBLE_TYPES):
+                    passthrough = True
+                    return await send(message)
+                start_message = message
+                return
+            if message["type"] != "http.response.body": return await send(message)
+            chunks.append(message.get("body", b""))
+            if message.get("more_body", False): return
+            body = b"".join(chunks)
+            headers = [(k, v) for k, v in start_message.get("headers", []) if k.lower() != b"content-length"]
+            if len(body) >= self.minimum_size:
+                if len(body) >= COMPRESSION_THREAD_MIN_BYTES: body = await asyncio.to_thread(compress, body, encoding)
+                else: body = compress(body, encoding)
+                headers += [(b"content-encoding", encoding.encode()), (b"vary", b"Accept-Encoding")]
+            headers.append((b"content-length", str(len(body)).encode()))
+            await send({**start_message, "headers": headers})
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, buffering_send)
@@ -1,15 +1,29 @@
 import os
+import time
+import asyncio
 import httpx
 import json
-from typing import List, Dict, Any, Optional, Tuple, cast
+import hashlib
+import random
+from collections import deque
+from concurrent.futures import Executor
+from typing import List, Dict, Any, Optional, Set, Tuple, Type, Callable, Awaitable, Deque, cast
 from uuid import uuid4
 from pathlib import Path
+from pydantic import ValidationError
 from .models import (
     Node, Edge, NodeType, WorkflowPayload, StylePreset, AIProviderKeyConfig,
     BaseNodeData, TextToImageNodeData, ProductInSceneNodeData, StyleNodeData,
     ImageInputNodeData, ImageUploadNodeData, CropResizeNodeData, TextOverlayNodeData,
-    StyleApplicationMode
+    StyleApplicationMode, ExecutionMode, PromoteRequest, WorkflowDeltaRequest, WorkflowRunOptions
 )
+from .planning import get_execution_plan
+from .store import get_store
+from .history import get_run_history
+from .asset_mirror import get_asset_mirror
+from .checkpoints import CheckpointWriter, load_checkpoint, delete_checkpoint
+from .graph_sessions import save_session_graph
+from .run_log import RunLog
 
 # Base URLs for AI Providers (examples)
 FAL_BASE_URL = "https://fal.run"
@@ -17,6 +31,47 @@ GOOGLE_GEMINI_BASE_URL = "https://generativelanguage.googleapis.com/v1beta/model
 STABILITY_AI_BASE_URL = "https://api.stability.ai/v1"
 # BLACKFOREST_FLUX_BASE_URL = "..." # Example
 
+# Shared (cross-worker) node result cache and run state, see store.py
+NODE_RESULT_CACHE_NAMESPACE = "node_results"
+NODE_RESULT_CACHE_TTL_SECONDS = float(os.getenv("NODE_RESULT_CACHE_TTL_SECONDS", str(24 * 3600)))
+RUN_STATE_NAMESPACE = "runs"
+RUN_STATE_TTL_SECONDS = 24 * 3600
+_NODE_HASH_EXCLUDED_FIELDS = {"label", "output_image_url", "mirrored_image_url", "error_message", "is_preview", "preview_seed", "hedge", "served_by_provider"} # Presentation/results, not configuration
+LOCAL_OP_NODE_TYPES = (NodeType.CROP_RESIZE, NodeType.TEXT_OVERLAY) # Run on our side, so they read mirrored inputs
+PROVIDER_NODE_TYPES = (NodeType.TEXT_TO_IMAGE, NodeType.PRODUCT_IN_SCENE, NodeType.STYLE_APPLY) # Outputs are provider URLs
+
+# Preview mode: cheap, small renders for iteration. Seeds are recorded so a variant can be promoted to full quality.
+PREVIEW_IMAGE_SIZE = 384
+PREVIEW_INFERENCE_STEPS = 12
+PREVIEW_LOCAL_OP_SCALE = 0.25
+PREVIEW_PROVIDER_PARAMS = {"image_size": {"width": PREVIEW_IMAGE_SIZE, "height": PREVIEW_IMAGE_SIZE}, "num_inference_steps": PREVIEW_INFERENCE_STEPS} # fal.ai routes
+PREVIEW_STABILITY_ENGINE = "stable-diffusion-v1-6" # The SDXL engine only accepts 1024-class sizes, v1.6 accepts small ones
+FULL_STABILITY_ENGINE = "stable-diffusion-xl-1024-v1-0"
+
+# Hedged Text-to-Image requests: when a node opts in, a secondary provider is raced once the primary exceeds its p95.
+HEDGE_LATENCY_WINDOW = 200 # Recent successful calls kept per provider/mode
+HEDGE_MIN_SAMPLES = 20 # Below this the p95 isn't trusted and the default delay is used
+HEDGE_DEFAULT_DELAY_SECONDS = 20.0
+HEDGE_MIN_DELAY_SECONDS = 1.0
+
+# Sibling Text-to-Image batching: identical unseeded requests that become ready together share one multi-image call.
+TEXT_TO_IMAGE_BATCH_WINDOW_SECONDS = 0.05
+TEXT_TO_IMAGE_MAX_BATCH = {"fal_ai": 8, "stability_ai": 10} # Providers with multi-image support (num_images / samples)
+
+# Run deadline & per-node-type timeouts (seconds). Payload values override these per run.
+DEFAULT_WORKFLOW_DEADLINE_SECONDS = float(os.getenv("WORKFLOW_DEADLINE_SECONDS", "290")) # Just under the Reflex client's 300s
+DEFAULT_NODE_TIMEOUT_SECONDS = 180.0
+NODE_TYPE_TIMEOUTS: Dict[NodeType, float] = {
+    NodeType.TEXT_TO_IMAGE: 180.0,
+    NodeType.PRODUCT_IN_SCENE: 180.0,
+    NodeType.STYLE_APPLY: 180.0,
+    NodeType.CROP_RESIZE: 30.0,
+    NodeType.TEXT_OVERLAY: 30.0,
+    NodeType.IMAGE_UPLOAD: 10.0,
+    NodeType.IMAGE_INPUT: 10.0,
+    NodeType.OUTPUT: 10.0,
+}
+
 PREDEFINED_STYLES: List[StylePreset] = [
     StylePreset(id="style_vintage", name="Vintage Look", parameters={"prompt_suffix": ", vintage photo, old film grain, sepia tone"}),
     StylePreset(id="style_neon", name="Neon Glow", parameters={"prompt_suffix": ", neon lights, cyberpunk aesthetic, vibrant colors"}),
@@ -25,17 +80,143 @@ PREDEFINED_STYLES: List[StylePreset] = [
     StylePreset(id="style_cinematic", name="Cinematic", parameters={"prompt_suffix": ", cinematic shot, dramatic lighting, wide angle, movie still"}),
 ]
 
+class RunNotFound(Exception):
+    """The run (or a node asked for) isn't in the run history, or has no checkpoint to resume from; maps to 404."""
+
+class RunNotResumable(Exception):
+    """The run is still executing in this worker, so it can't be resumed yet; maps to 409."""
+
+class RunDeadline:
+    """Absolute deadline for one workflow run, shared by every node and provider call in it."""
+    def __init__(self, seconds: float, node_timeouts: Optional[Dict[NodeType, float]] = None):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+        self.node_timeouts = {**NODE_TYPE_TIMEOUTS, **(node_timeouts or {})}
+
+    def remaining(self) -> float: return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool: return self.remaining() <= 0.0
+
+    def budget_for(self, node_type: NodeType) -> float:
+        # A node never gets more time than its type allows, nor more than the run has left.
+        return min(self.node_timeouts.get(node_type, DEFAULT_NODE_TIMEOUT_SECONDS), self.remaining())
+
+class ProviderLatencyTracker:
+    """Sliding window of successful call latencies per provider/mode, used to pick the hedge delay."""
+    def __init__(self, window: int = HEDGE_LATENCY_WINDOW):
+        self.window = window
+        self._samples: Dict[str, Deque[float]] = {}
+
+    def record(self, key: str, seconds: float):
+        self._samples.setdefault(key, deque(maxlen=self.window)).append(seconds)
+
+    def percentile(self, key: str, pct: float) -> Optional[float]:
+        samples = self._samples.get(key)
+        if not samples or len(samples) < HEDGE_MIN_SAMPLES: return None
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(pct / 100.0 * len(ordered)))]
+
+    def hedge_delay(self, key: str) -> float:
+        p95 = self.percentile(key, 95)
+        return max(HEDGE_MIN_DELAY_SECONDS, p95) if p95 is not None else HEDGE_DEFAULT_DELAY_SECONDS
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        return {key: {"samples": len(s), "p50": self.percentile(key, 50), "p95": self.percentile(key, 95)} for key, s in self._samples.items()}
+
+PROVIDER_LATENCY = ProviderLatencyTracker()
+
+class TextToImageBatcher:
+    """Per-run collector that coalesces identical Text-to-Image requests into one multi-image provider call."""
+    def __init__(self, window: float = TEXT_TO_IMAGE_BATCH_WINDOW_SECONDS):
+        self.window = window
+        self._groups: Dict[Tuple[str, str], List["asyncio.Future"]] = {}
+        self._callers: Dict[Tuple[str, str], Callable[[int], Awaitable[Dict[str, Any]]]] = {}
+        self._timers: Dict[Tuple[str, str], asyncio.TimerHandle] = {} # Window timer of each open group
+        self._flush_tasks: Set["asyncio.Task"] = set()
+
+    async def submit(self, provider: str, payload: Dict[str, Any], call_many: Callable[[int], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+        loop = asyncio.get_running_loop()
+        key = (provider, json.dumps(payload, sort_keys=True))
+        future = loop.create_future()
+        group = self._groups.get(key)
+        if group is None:
+            group = self._groups[key] = []
+            self._callers[key] = call_many
+            self._timers[key] = loop.call_later(self.window, self._schedule_flush, key)
+        group.append(future)
+        if len(group) >= TEXT_TO_IMAGE_MAX_BATCH.get(provider, 1): self._schedule_flush(key)
+        return await future
+
+    def _schedule_flush(self, key: Tuple[str, str]):
+        group = self._groups.pop(key, None)
+        call_many = self._callers.pop(key, None)
+        timer = self._timers.pop(key, None)
+        if timer is not None: timer.cancel() # Flushed early: the timer must not cut short the next group under this key
+        if not group: return
+        task = asyncio.ensure_future(self._flush(group, call_many))
+        self._flush_tasks.add(task)
+        task.add_done_callback(self._flush_tasks.discard)
+
+    async def _flush(self, group: List["asyncio.Future"], call_many: Callable[[int], Awaitable[Dict[str, Any]]]):
+        waiting = [f for f in group if not f.done()] # Nodes that timed out meanwhile don't need an image
+        if not waiting: return
+        try: result = await call_many(len(waiting))
+        except Exception as e: result = {"error_message": f"Batched request failed: {str(e)}"}
+        images = result.get("images") or []
+        for i, future in enumerate(waiting):
+            if future.done(): continue
+            if i < len(images): future.set_result({**result, "images": [images[i]], "batch_size": len(waiting)})
+            else: future.set_result({"error_message": result.get("error_message") or "Batched request returned too few images."})
+
+    def close(self):
+        for timer in self._timers.values(): timer.cancel()
+        for task in list(self._flush_tasks): task.cancel()
+
+NODE_DATA_MODELS: Dict[NodeType, Type[BaseNodeData]] = {
+    NodeType.TEXT_TO_IMAGE: TextToImageNodeData, NodeType.PRODUCT_IN_SCENE: ProductInSceneNodeData, NodeType.STYLE_APPLY: StyleNodeData,
+    NodeType.IMAGE_INPUT: ImageInputNodeData, NodeType.IMAGE_UPLOAD: ImageUploadNodeData,
+    NodeType.CROP_RESIZE: CropResizeNodeData, NodeType.TEXT_OVERLAY: TextOverlayNodeData,
+}
+
 def _parse_node_data_from_dict(node_type: NodeType, data_dict: Dict[str, Any]) -> BaseNodeData:
-    if node_type == NodeType.TEXT_TO_IMAGE: return TextToImageNodeData(**data_dict)
-    if node_type == NodeType.PRODUCT_IN_SCENE: return ProductInSceneNodeData(**data_dict)
-    if node_type == NodeType.STYLE_APPLY: return StyleNodeData(**data_dict)
-    if node_type == NodeType.IMAGE_INPUT: return ImageInputNodeData(**data_dict)
-    if node_type == NodeType.IMAGE_UPLOAD: return ImageUploadNodeData(**data_dict)
-    if node_type == NodeType.CROP_RESIZE: return CropResizeNodeData(**data_dict)
-    if node_type == NodeType.TEXT_OVERLAY: return TextOverlayNodeData(**data_dict)
-    return BaseNodeData(**data_dict)
-
-async def _http_post_ai_service(url: str, headers: Dict[str, str], payload: Dict[str, Any], timeout: float = 180.0) -> Dict[str, Any]:
+    return NODE_DATA_MODELS.get(node_type, BaseNodeData)(**data_dict)
+
+def node_content_hash(node: Node, inputs: Dict[str, Optional[str]], mode: ExecutionMode = ExecutionMode.FULL) -> str:
+    # Normalise through the typed model so defaults and explicit values hash the same.
+    data = _parse_node_data_from_dict(node.type, node.data).model_dump(mode="json", exclude=_NODE_HASH_EXCLUDED_FIELDS, exclude_none=True)
+    material_dict = {"type": node.type.value, "data": data, "inputs": inputs}
+    if mode != ExecutionMode.FULL: material_dict["mode"] = mode.value # Full-quality hashes stay unchanged
+    material = json.dumps(material_dict, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(material.encode()).hexdigest()
+
+def _normalized_node_data(node: Node) -> Dict[str, Any]:
+    # The form a run writes node data back in (typed model, exclude_none), so untouched nodes compare equal.
+    try: return _parse_node_data_from_dict(node.type, node.data).model_dump(mode="json", exclude_none=True)
+    except ValidationError: return dict(node.data)
+
+def _is_result_cacheable(node: Node) -> bool:
+    # Only provider-backed nodes are worth caching; unseeded generations are expected to differ per run.
+    if node.type == NodeType.TEXT_TO_IMAGE: return node.data.get("seed") is not None
+    return node.type in (NodeType.PRODUCT_IN_SCENE, NodeType.STYLE_APPLY)
+
+def _prefetch_output(mirror: Optional[Any], node: Node):
+    # Only provider outputs: image input/upload URLs come from the client and must never be fetched server-side.
+    if mirror and node.type in PROVIDER_NODE_TYPES and node.data.get("output_image_url"): mirror.prefetch(node.data["output_image_url"])
+
+async def _set_run_state(run_id: Optional[str], state: Dict[str, Any]):
+    if not run_id: return
+    try: await get_store().set(RUN_STATE_NAMESPACE, run_id, state, ttl_seconds=RUN_STATE_TTL_SECONDS)
+    except Exception as e: print(f"Warning: could not persist run state for '{run_id}': {e}")
+
+async def get_run_state(run_id: str) -> Optional[Dict[str, Any]]:
+    return await get_store().get(RUN_STATE_NAMESPACE, run_id)
+
+_active_run_ids: Set[str] = set() # Runs executing in this worker process
+
+def is_run_active(run_id: str) -> bool: return run_id in _active_run_ids
+
+async def _http_post_ai_service(url: str, headers: Dict[str, str], payload: Dict[str, Any], timeout: float = DEFAULT_NODE_TIMEOUT_SECONDS) -> Dict[str, Any]:
     try:
         async with httpx.AsyncClient() as client:
             response = await client.post(url, json=payload, headers=headers, timeout=timeout)
@@ -57,18 +238,18 @@ async def _http_post_ai_service(url: str, headers: Dict[str, str], payload: Dict
     except Exception as e:
         return {"error_message": f"Generic AI service call error: {str(e)}"}
 
-async def _fal_ai_call(app_route: str, payload: Dict[str, Any], api_key: Optional[str]) -> Dict[str, Any]:
+async def _fal_ai_call(app_route: str, payload: Dict[str, Any], api_key: Optional[str], timeout: float = DEFAULT_NODE_TIMEOUT_SECONDS) -> Dict[str, Any]:
     if not api_key: return {"error_message": "Fal.ai API Key not provided."}
     headers = {"Authorization": f"Key {api_key}", "Content-Type": "application/json"}
-    return await _http_post_ai_service(f"{FAL_BASE_URL}/{app_route}", headers, payload)
+    return await _http_post_ai_service(f"{FAL_BASE_URL}/{app_route}", headers, payload, timeout=timeout)
 
-async def _google_gemini_call(model_id: str, prompt_text: str, api_key: Optional[str]) -> Dict[str, Any]:
+async def _google_gemini_call(model_id: str, prompt_text: str, api_key: Optional[str], timeout: float = 120.0) -> Dict[str, Any]:
     if not api_key: return {"error_message": "Google Gemini API Key not provided."}
     # This is for text generation. For image generation, Gemini requires different model and payload (e.g. multimodal)
     # This example simulates an image output for consistency.
     url = f"{GOOGLE_GEMINI_BASE_URL}/{model_id}:generateContent?key={api_key}"
     payload = {"contents": [{"parts": [{"text": prompt_text}]}]}
-    result = await _http_post_ai_service(url, {}, payload, timeout=120.0)
+    result = await _http_post_ai_service(url, {}, payload, timeout=timeout)
     if result.get("error_message"): return result
     try:
         # Simplified: assuming text response, creating a placeholder image URL
@@ -78,26 +259,76 @@ async def _google_gemini_call(model_id: str, prompt_text: str, api_key: Optional
         return {"error_message": f"Could not parse Gemini response: {str(e)} - Response: {result}"}
 
 
-async def _stability_ai_call(engine_id: str, prompt_text: str, api_key: Optional[str]) -> Dict[str, Any]:
+async def _stability_ai_call(engine_id: str, prompt_text: str, api_key: Optional[str], timeout: float = DEFAULT_NODE_TIMEOUT_SECONDS,
+                             seed: Optional[int] = None, steps: int = 30, size: Optional[int] = None, samples: int = 1) -> Dict[str, Any]:
     if not api_key: return {"error_message": "Stability AI API Key not provided."}
     headers = {"Authorization": f"Bearer {api_key}", "Accept": "application/json", "Content-Type": "application/json"}
-    payload = {"text_prompts": [{"text": prompt_text}], "samples": 1, "steps": 30} # Example payload
-    result = await _http_post_ai_service(f"{STABILITY_AI_BASE_URL}/generation/{engine_id}/text-to-image", headers, payload)
+    payload = {"text_prompts": [{"text": prompt_text}], "samples": samples, "steps": steps} # Example payload
+    if seed is not None: payload["seed"] = seed
+    if size: payload["width"] = payload["height"] = size
+    result = await _http_post_ai_service(f"{STABILITY_AI_BASE_URL}/generation/{engine_id}/text-to-image", headers, payload, timeout=timeout)
     if result.get("error_message"): return result
     try:
         # Stability AI returns base64 encoded images. For demo, return placeholder.
         # In production, save base64 to storage and return URL.
-        if result.get("artifacts") and result["artifacts"][0].get("base64"):
-            return {"images": [{"url": f"https://via.placeholder.com/512/10A37F/FFFFFF?Text=StabilityAI_Output"}]}
+        artifacts = [a for a in result.get("artifacts") or [] if a.get("base64")]
+        if artifacts:
+            return {"images": [{"url": f"https://via.placeholder.com/512/10A37F/FFFFFF?Text=StabilityAI_Output_{i + 1}"} for i in range(len(artifacts))]}
         return {"error_message": "Stability AI response did not contain image data."}
     except (IndexError, KeyError, TypeError) as e:
         return {"error_message": f"Could not parse Stability AI response: {str(e)} - Response: {result}"}
 
-async def _process_node_internal(node: Node, inputs: Dict[str, Optional[str]], api_keys: AIProviderKeyConfig, log_func: callable) -> Node:
+_local_op_executor: Optional[Executor] = None
+
+def configure_local_op_executor(executor: Optional[Executor]):
+    # Local ops (crop/resize, text overlay) run inline by default; a process pool keeps them off the event loop.
+    global _local_op_executor
+    _local_op_executor = executor
+
+def _apply_local_op(node_type: str, input_img: str, preview: bool) -> str:
+    # Top-level and argument-only so it can run in a worker process.
+    output_url = f"{input_img}?sim_{node_type.lower()}=true" # Simulate operation
+    if preview: output_url += f"&scale={PREVIEW_LOCAL_OP_SCALE}" # Local ops run on a downscaled copy
+    return output_url
+
+def _provider_api_key(provider: str, api_keys: AIProviderKeyConfig) -> Optional[str]:
+    return {"fal_ai": api_keys.fal_ai_key, "google_gemini": api_keys.google_gemini_key, "stability_ai": api_keys.stability_ai_key}.get(provider)
+
+async def _hedged_provider_call(node_id: str, primary: str, secondary: Optional[str], call: Callable[[str], Awaitable[Dict[str, Any]]],
+                                hedge: bool, hedge_delay: float, log: RunLog) -> Tuple[Dict[str, Any], str]:
+    """Returns (result, provider that produced it). Races `secondary` after `hedge_delay` if hedging, else only fails over to it."""
+    tasks: Dict["asyncio.Future", str] = {asyncio.ensure_future(call(primary)): primary}
+    try:
+        if secondary and hedge:
+            done, _ = await asyncio.wait(set(tasks), timeout=hedge_delay)
+            if not done:
+                log.info("Node '%s': '%s' slower than %.1fs, hedging with '%s'.", node_id, primary, hedge_delay, secondary, node_id=node_id)
+                tasks[asyncio.ensure_future(call(secondary))] = secondary
+        pending = set(tasks)
+        first_failure: Optional[Tuple[Dict[str, Any], str]] = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                result = task.result()
+                if not result.get("error_message"): return result, tasks[task] # Loser is cancelled in `finally`
+                first_failure = first_failure or (result, tasks[task])
+        if secondary and secondary not in tasks.values():
+            log.warn("Node '%s': '%s' failed (%s), failing over to '%s'.", node_id, primary, first_failure[0]['error_message'], secondary, node_id=node_id)
+            result = await call(secondary)
+            if not result.get("error_message"): return result, secondary
+        return first_failure
+    finally:
+        for task in tasks:
+            if not task.done(): task.cancel()
+
+async def _process_node_internal(node: Node, inputs: Dict[str, Optional[str]], api_keys: AIProviderKeyConfig, log: RunLog,
+                                 timeout: float = DEFAULT_NODE_TIMEOUT_SECONDS, mode: ExecutionMode = ExecutionMode.FULL,
+                                 batcher: Optional[TextToImageBatcher] = None) -> Node:
     node_data_obj = _parse_node_data_from_dict(node.type, node.data)
     node_data_obj.error_message = None # Clear previous errors
+    node_data_obj.mirrored_image_url = None # Belongs to the previous output
     provider = node_data_obj.provider or "fal_ai" # Default provider
-    log_func(f"Node '{node.id}' ({node.type.value}) using provider '{provider}'. Inputs: {list(inputs.keys())}")
+    log.debug("Node '%s' (%s) using provider '%s'. Inputs: %s", node.id, node.type.value, provider, list(inputs), node_id=node.id)
 
     output_url: Optional[str] = None
     error_msg: Optional[str] = None
@@ -116,24 +347,55 @@ async def _process_node_internal(node: Node, inputs: Dict[str, Optional[str]], a
     elif node.type in [NodeType.CROP_RESIZE, NodeType.TEXT_OVERLAY]: # Simulated
         input_img = inputs.get("default_in")
         if not input_img: error_msg = f"Input image for {node.type.value} missing."
-        else: output_url = f"{input_img}?sim_{node.type.value.lower()}=true" # Simulate operation
+        elif _local_op_executor is not None: # CPU-bound image work goes to the configured pool (e.g. batch runner)
+            output_url = await asyncio.get_running_loop().run_in_executor(
+                _local_op_executor, _apply_local_op, node.type.value, input_img, mode == ExecutionMode.PREVIEW)
+        else: output_url = _apply_local_op(node.type.value, input_img, mode == ExecutionMode.PREVIEW)
 
     # AI Operations
     elif node.type == NodeType.TEXT_TO_IMAGE:
         data = cast(TextToImageNodeData, node_data_obj)
+        is_preview = mode == ExecutionMode.PREVIEW
+        seed = data.seed
+        if is_preview:
+            # Pin a seed so the chosen preview can be re-rendered identically at full quality.
+            seed = seed if seed is not None else random.randint(0, 2**31 - 1)
+            data.preview_seed = seed
         payload = {"prompt": data.prompt}
         if data.negative_prompt: payload["negative_prompt"] = data.negative_prompt
-        if data.seed is not None: payload["seed"] = data.seed
-        
-        result: Optional[Dict[str, Any]] = None
-        if provider == "fal_ai": result = await _fal_ai_call("fal-ai/fast-sdxl", payload, api_keys.fal_ai_key)
-        elif provider == "google_gemini": result = await _google_gemini_call("gemini-pro", data.prompt, api_keys.google_gemini_key)
-        elif provider == "stability_ai": result = await _stability_ai_call("stable-diffusion-xl-1024-v1-0", data.prompt, api_keys.stability_ai_key)
-        else: error_msg = f"Unsupported AI provider for Text-to-Image: {provider}"
+        if seed is not None: payload["seed"] = seed
+        if is_preview: payload.update(PREVIEW_PROVIDER_PARAMS)
         
-        if result:
-            if result.get("images") and result["images"][0].get("url"): output_url = result["images"][0]["url"]
-            else: error_msg = result.get("error_message") or "AI generation failed to return image URL."
+        async def call_provider(provider_name: str, count: int = 1) -> Dict[str, Any]:
+            started = time.monotonic()
+            if provider_name == "fal_ai":
+                provider_payload = {**payload, "num_images": count} if count > 1 else payload
+                provider_result = await _fal_ai_call("fal-ai/fast-sdxl", provider_payload, api_keys.fal_ai_key, timeout=timeout)
+            elif provider_name == "google_gemini": provider_result = await _google_gemini_call("gemini-pro", data.prompt, api_keys.google_gemini_key, timeout=timeout)
+            elif provider_name == "stability_ai":
+                provider_result = await _stability_ai_call(
+                    PREVIEW_STABILITY_ENGINE if is_preview else FULL_STABILITY_ENGINE, data.prompt, api_keys.stability_ai_key, timeout=timeout,
+                    seed=seed, steps=PREVIEW_INFERENCE_STEPS if is_preview else 30, size=PREVIEW_IMAGE_SIZE if is_preview else None, samples=count)
+            else: return {"error_message": f"Unsupported AI provider for Text-to-Image: {provider_name}"}
+            if not provider_result.get("error_message"): PROVIDER_LATENCY.record(f"{provider_name}:{mode.value}", time.monotonic() - started)
+            return provider_result
+
+        secondary = data.fallback_provider if data.fallback_provider and data.fallback_provider != provider else None
+        if secondary and not _provider_api_key(secondary, api_keys):
+            log.warn("Node '%s': fallback provider '%s' ignored, no API key configured for it.", node.id, secondary, node_id=node.id)
+            secondary = None
+        # Batch only unseeded full-quality requests: a multi-image call can't honour per-node seeds,
+        # and preview renders pin a seed per node for promotion.
+        if batcher and seed is None and not secondary and provider in TEXT_TO_IMAGE_MAX_BATCH:
+            result, served_by = await batcher.submit(provider, payload, lambda count: call_provider(provider, count)), provider
+            if result.get("batch_size", 1) > 1: log.debug("Node '%s': served by a batched '%s' request of %d images.", node.id, provider, result["batch_size"], node_id=node.id)
+        else:
+            result, served_by = await _hedged_provider_call(
+                node.id, provider, secondary, call_provider, bool(data.hedge), PROVIDER_LATENCY.hedge_delay(f"{provider}:{mode.value}"), log)
+        data.served_by_provider = served_by if served_by != provider else None
+
+        if result.get("images") and result["images"][0].get("url"): output_url = result["images"][0]["url"]
+        else: error_msg = result.get("error_message") or "AI generation failed to return image URL."
 
     elif node.type == NodeType.PRODUCT_IN_SCENE:
         data = cast(ProductInSceneNodeData, node_data_obj)
@@ -142,8 +404,9 @@ async def _process_node_internal(node: Node, inputs: Dict[str, Optional[str]], a
         if not base_img or not prod_img: error_msg = "Base or product image missing for composition."
         else:
             payload = {"base_image_url": base_img, "product_image_url": prod_img, "prompt": data.prompt}
+            if mode == ExecutionMode.PREVIEW: payload.update(PREVIEW_PROVIDER_PARAMS) # Same small, few-step render as Text-to-Image
             # This type of complex task is often specific. Assume Fal.ai or a dedicated model.
-            result = await _fal_ai_call("your-fal-product-composition-app-route", payload, api_keys.fal_ai_key)
+            result = await _fal_ai_call("your-fal-product-composition-app-route", payload, api_keys.fal_ai_key, timeout=timeout)
             if result:
                 output_url = result.get("output_image_url") # Assuming this key from your Fal app
                 if not output_url: error_msg = result.get("error_message") or "Product composition failed."
@@ -159,8 +422,9 @@ async def _process_node_internal(node: Node, inputs: Dict[str, Optional[str]], a
                 if preset: style_prompt_suffix = preset.parameters.get("prompt_suffix", "")
             
             payload = {"image_url": input_img, "prompt": f"Apply artistic style {style_prompt_suffix}".strip(), "strength": data.intensity}
+            if mode == ExecutionMode.PREVIEW: payload.update(PREVIEW_PROVIDER_PARAMS)
             # Assume Fal.ai or a dedicated model for style transfer. Provider selection could be added.
-            result = await _fal_ai_call("your-fal-style-transfer-app-route", payload, api_keys.fal_ai_key)
+            result = await _fal_ai_call("your-fal-style-transfer-app-route", payload, api_keys.fal_ai_key, timeout=timeout)
             if result:
                 if result.get("images") and result["images"][0].get("url"): output_url = result["images"][0]["url"]
                 else: error_msg = result.get("error_message") or "Style application failed."
@@ -169,107 +433,267 @@ async def _process_node_internal(node: Node, inputs: Dict[str, Optional[str]], a
 
     node_data_obj.output_image_url = output_url
     node_data_obj.error_message = error_msg
+    node_data_obj.is_preview = True if mode == ExecutionMode.PREVIEW and output_url else None
     node.data = node_data_obj.model_dump(exclude_none=True)
-    if error_msg: log_func(f"Error in Node '{node.id}': {error_msg}")
-    if output_url: log_func(f"Node '{node.id}' output: {output_url[:70]}...")
-    return node
-
-def _get_execution_order(nodes: List[Node], edges: List[Edge]) -> List[str]:
-    adj: Dict[str, List[str]] = {node.id: [] for node in nodes}
-    in_degree: Dict[str, int] = {node.id: 0 for node in nodes}
-    node_map: Dict[str, Node] = {node.id: node for node in nodes}
-    for edge in edges:
-        if edge.source in node_map and edge.target in node_map:
-            adj[edge.source].append(edge.target)
-            in_degree[edge.target] += 1
-    queue = [node_id for node_id, degree in in_degree.items() if degree == 0]
-    execution_order = []
-    while queue:
-        u = queue.pop(0)
-        execution_order.append(u)
-        for v_id in adj.get(u, []):
-            in_degree[v_id] -= 1
-            if in_degree[v_id] == 0:
-                queue.append(v_id)
-    if len(execution_order) != len(nodes):
-        print(f"Warning: Cycle or disconnected components. Executed: {len(execution_order)}/{len(nodes)}")
-        # Add remaining nodes to process them and show errors if they are part of a cycle
-        # This is a simple way, full cycle detection is more complex.
-        processed_ids = set(execution_order)
-        for node in nodes:
-            if node.id not in processed_ids:
-                execution_order.append(node.id) # Add at the end
-    return execution_order
-
-async def execute_ai_workflow(workflow: WorkflowPayload) -> Tuple[WorkflowPayload, List[str]]:
-    execution_log: List[str] = []
-    def log(message: str): execution_log.append(message)
+    return node # The caller logs the outcome, with the node's duration
+
+def find_final_output_url(nodes: List[Node]) -> Optional[str]:
+    return next((n.data["output_image_url"] for n in nodes if n.type == NodeType.OUTPUT and n.data.get("output_image_url")), None)
+
+async def _record_run_history(run_id: str, workflow: WorkflowPayload, status: str, started_at: float, finished_at: float,
+                              execution_log: List[str], node_hashes: Dict[str, str], node_timings_ms: Dict[str, float]):
+    run = {
+        "run_id": run_id, "workflow_id": workflow.workflow_id, "template_id": workflow.template_id, "status": status,
+        "execution_mode": workflow.execution_mode.value,
+        "started_at": started_at, "finished_at": finished_at, "duration_ms": (finished_at - started_at) * 1000,
+        "node_count": len(workflow.nodes), "final_output_url": find_final_output_url(workflow.nodes), "error": None,
+        "execution_log": execution_log,
+        "nodes": [n.model_dump(mode="json") for n in workflow.nodes],
+        "edges": [e.model_dump(mode="json") for e in workflow.edges],
+    }
+    node_rows = [{
+        "run_id": run_id, "node_id": n.id, "node_type": n.type.value, "content_hash": node_hashes.get(n.id),
+        "output_image_url": n.data.get("output_image_url"), "error_message": n.data.get("error_message"),
+        "duration_ms": node_timings_ms.get(n.id), "finished_at": finished_at,
+    } for n in workflow.nodes if n.id in node_hashes]
+    try: await get_run_history().record_run(run, node_rows)
+    except Exception as e: print(f"Warning: could not record run history for '{run_id}': {e}")
+
+async def execute_ai_workflow(workflow: WorkflowPayload, run_id: Optional[str] = None, only_node_ids: Optional[Set[str]] = None,
+                              resume_from: Optional[Dict[str, Dict[str, Any]]] = None) -> Tuple[WorkflowPayload, RunLog]:
+    # only_node_ids restricts the run to a subset (must be ancestor-closed); other nodes are returned untouched.
+    # resume_from maps node ids to data checkpointed by an earlier attempt of this run; those nodes are not re-run.
+    log = RunLog(workflow.log_level)
 
     if not workflow.api_keys:
-        log("Critical Error: API keys configuration missing in workflow payload.")
+        log.error("Critical Error: API keys configuration missing in workflow payload.")
         for n in workflow.nodes: n.data["error_message"] = "API keys missing."
-        return workflow, execution_log
+        return workflow, log
     
     api_keys_config = workflow.api_keys
+    deadline = RunDeadline(workflow.deadline_seconds or DEFAULT_WORKFLOW_DEADLINE_SECONDS, workflow.node_timeouts)
     nodes_map = {node.id: node for node in workflow.nodes}
-    order = _get_execution_order(workflow.nodes, workflow.edges)
-    log(f"Execution Order ({len(order)} nodes): {', '.join(order)}")
+    plan, plan_cache_hit = get_execution_plan(workflow.nodes, workflow.edges)
+    log.info("Execution plan %s (%s): %d levels, %d/%d nodes runnable.", plan.topology_hash[:12],
+             "cached" if plan_cache_hit else "compiled", len(plan.levels), len(plan.order), len(nodes_map))
+    for cycle in plan.cycles: log.error("Cycle detected: %s.", " -> ".join(cycle))
+    log.debug("Run deadline: %.0fs", deadline.seconds)
+    mode = workflow.execution_mode
+    if mode != ExecutionMode.FULL: log.info("Execution mode: %s", mode.value)
+    if workflow.target_node_ids and only_node_ids is None:
+        unknown_targets = [t for t in workflow.target_node_ids if t not in nodes_map]
+        if unknown_targets: log.warn("Unknown target nodes ignored: %s.", ", ".join(unknown_targets))
+        only_node_ids = plan.ancestor_closure(t for t in workflow.target_node_ids if t in nodes_map) # Results of the rest stay as they are
+    if only_node_ids is not None: log.info("Partial run: %d of %d nodes selected.", len(only_node_ids), len(nodes_map))
+    resume_from = {node_id: data for node_id, data in (resume_from or {}).items() if node_id in nodes_map}
+    if resume_from: log.info("Resuming run: %d completed nodes restored from checkpoint.", len(resume_from))
 
     node_outputs_cache: Dict[str, Dict[str, Optional[str]]] = {node_id: {} for node_id in nodes_map}
     processed_nodes_map: Dict[str, Node] = {}
+    failed_node_ids: set = set() # Failed, timed out or skipped; their descendants are skipped without running
+    node_hashes: Dict[str, str] = {}
+    node_timings_ms: Dict[str, float] = {}
+    store = get_store()
+    mirror = get_asset_mirror()
+    batcher = TextToImageBatcher()
+    checkpoints: Optional[CheckpointWriter] = None
+    if run_id:
+        checkpoint_payload = workflow.model_dump(mode="json", exclude={"api_keys"}) # Keys are never persisted
+        checkpoint_payload["only_node_ids"] = sorted(only_node_ids) if only_node_ids is not None else None
+        checkpoints = CheckpointWriter(run_id, checkpoint_payload)
+        checkpoints.seed(resume_from)
 
-    for node_id in order:
-        if node_id not in nodes_map:
-            log(f"Error: Node ID '{node_id}' from execution order not in workflow. Skipping.")
-            continue
-        
-        current_node_original = nodes_map[node_id]
-        # Create a copy to avoid modifying the original map during iteration if needed,
-        # though we update processed_nodes_map.
-        current_node_to_process = Node(**current_node_original.model_dump())
+    async def run_node(node_id: str):
+        # Copy so the caller's payload nodes are left untouched until results are assembled.
+        current_node_to_process = Node(**nodes_map[node_id].model_dump())
 
+        if node_id in resume_from:
+            current_node_to_process.data = dict(resume_from[node_id])
+            processed_nodes_map[node_id] = current_node_to_process
+            if current_node_to_process.data.get("output_image_url"):
+                node_outputs_cache[node_id]["default_out"] = current_node_to_process.data["output_image_url"]
+                _prefetch_output(mirror, current_node_to_process)
+            log.debug("Node '%s': restored from checkpoint.", node_id, node_id=node_id)
+            return
+
+        failed_upstream = next((src for src in plan.upstream_ids(node_id) if src in failed_node_ids), None)
+        skip_reason = None
+        if failed_upstream: skip_reason = f"Skipped: upstream node '{failed_upstream}' failed or was cancelled."
+        elif deadline.expired: skip_reason = "Skipped: workflow deadline exceeded."
+        if skip_reason:
+            current_node_to_process.data["error_message"] = skip_reason
+            current_node_to_process.data.pop("output_image_url", None)
+            processed_nodes_map[node_id] = current_node_to_process
+            failed_node_ids.add(node_id)
+            log.warn("Node '%s': %s", node_id, skip_reason, node_id=node_id)
+            return
 
         inputs_for_current_node: Dict[str, Optional[str]] = {}
-        for edge in workflow.edges:
-            if edge.target == node_id:
-                source_node_id = edge.source
-                source_handle = edge.sourceHandle or "default_out"
-                target_handle = edge.targetHandle or "default_in"
-                
-                cached_output = node_outputs_cache.get(source_node_id, {}).get(source_handle)
-                if cached_output:
-                    inputs_for_current_node[target_handle] = cached_output
-                else:
-                    # This might happen if source node failed or for cycles
-                    source_node_in_map = processed_nodes_map.get(source_node_id) # Check if already processed
-                    if source_node_in_map and source_node_in_map.data.get("output_image_url") and source_handle == "default_out":
-                         inputs_for_current_node[target_handle] = source_node_in_map.data["output_image_url"]
-                    else:
-                        log(f"Warn: Output from '{source_node_id}.{source_handle}' not found for '{node_id}.{target_handle}'.")
-        
-        processed_node = await _process_node_internal(current_node_to_process, inputs_for_current_node, api_keys_config, log)
+        for binding in plan.bindings.get(node_id, ()):
+            cached_output = node_outputs_cache[binding.source_id].get(binding.source_handle)
+            if cached_output:
+                if mirror and current_node_to_process.type in LOCAL_OP_NODE_TYPES: cached_output = mirror.resolve(cached_output)
+                inputs_for_current_node[binding.target_handle] = cached_output
+            else: log.warn("Output from '%s.%s' not found for '%s.%s'.", binding.source_id, binding.source_handle, node_id, binding.target_handle, node_id=node_id)
+
+        node_hashes[node_id] = node_content_hash(current_node_to_process, inputs_for_current_node, mode)
+        cacheable = _is_result_cacheable(current_node_to_process)
+        if cacheable:
+            try: cached_url = await store.get(NODE_RESULT_CACHE_NAMESPACE, node_hashes[node_id])
+            except Exception as e: cached_url = None; log.warn("Result cache lookup failed for '%s': %s", node_id, e, node_id=node_id)
+            if cached_url:
+                current_node_to_process.data["output_image_url"] = cached_url
+                current_node_to_process.data.pop("error_message", None)
+                current_node_to_process.data.pop("mirrored_image_url", None)
+                _prefetch_output(mirror, current_node_to_process)
+                processed_nodes_map[node_id] = current_node_to_process
+                node_outputs_cache[node_id]["default_out"] = cached_url
+                if checkpoints: checkpoints.record(node_id, current_node_to_process.data)
+                log.info("Node '%s': reused cached result (%s).", node_id, node_hashes[node_id][:12], node_id=node_id)
+                return
+
+        node_budget = deadline.budget_for(current_node_to_process.type)
+        node_started = time.perf_counter()
+        try:
+            # wait_for cancels the node task on timeout, which aborts any in-flight httpx request.
+            processed_node = await asyncio.wait_for(
+                _process_node_internal(current_node_to_process, inputs_for_current_node, api_keys_config, log, timeout=node_budget, mode=mode, batcher=batcher),
+                timeout=node_budget
+            )
+        except asyncio.TimeoutError:
+            processed_node = current_node_to_process
+            processed_node.data["error_message"] = f"Timed out after {node_budget:.1f}s."
+            processed_node.data.pop("output_image_url", None)
+        node_timings_ms[node_id] = duration_ms = (time.perf_counter() - node_started) * 1000
+        if processed_node.data.get("error_message"):
+            log.error("Error in Node '%s': %s", node_id, processed_node.data["error_message"], node_id=node_id, duration_ms=duration_ms)
+        elif processed_node.data.get("output_image_url"):
+            log.info("Node '%s' output: %.70s...", node_id, processed_node.data["output_image_url"], node_id=node_id, duration_ms=duration_ms)
         processed_nodes_map[node_id] = processed_node
-        
-        # Cache output(s) of the processed node
-        # Assuming most nodes have one primary output accessible via `output_image_url` mapped to "default_out"
+        if processed_node.data.get("error_message"): failed_node_ids.add(node_id)
+        elif checkpoints: checkpoints.record(node_id, processed_node.data) # Batched, written in the background
+
+        # Nodes currently expose a single output, `output_image_url`, on the "default_out" handle.
+        # Nodes with several named outputs would populate more handles here.
         if processed_node.data.get("output_image_url"):
             node_outputs_cache[node_id]["default_out"] = processed_node.data["output_image_url"]
-            # If nodes have multiple named output handles, the logic in _process_node_internal
-            # would need to populate node.data with keys like "output_handle_name_url"
-            # and this caching logic would need to read those specific keys.
+            _prefetch_output(mirror, processed_node) # Background download, deduplicated by URL
+            if cacheable and not processed_node.data.get("error_message"):
+                try: await store.set(NODE_RESULT_CACHE_NAMESPACE, node_hashes[node_id], processed_node.data["output_image_url"], ttl_seconds=NODE_RESULT_CACHE_TTL_SECONDS)
+                except Exception as e: log.warn("Could not cache result of '%s': %s", node_id, e, node_id=node_id)
+
+    started_at = time.time()
+    if run_id: _active_run_ids.add(run_id)
+    await _set_run_state(run_id, {"status": "running", "started_at": started_at, "node_count": len(nodes_map)})
+    interrupted_status: Optional[str] = "failed" # Cleared once every level has run
+    try:
+        for level in plan.levels:
+            if only_node_ids is not None: level = [node_id for node_id in level if node_id in only_node_ids]
+            # Nodes within a level are independent of each other, so they run concurrently.
+            tasks = [asyncio.ensure_future(run_node(node_id)) for node_id in level]
+            try: await asyncio.gather(*tasks)
+            finally: # If one node raised (or the run was cancelled), stop its siblings before the run is closed out
+                for task in tasks: task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+        interrupted_status = None
+    except asyncio.CancelledError:
+        interrupted_status = "cancelled"
+        raise
+    finally:
+        if run_id: _active_run_ids.discard(run_id)
+        batcher.close()
+        if interrupted_status: # Cancelled or crashed: the run state mustn't stay "running"
+            if checkpoints: await asyncio.shield(checkpoints.close()) # Keep what finished, so the run can be resumed
+            await asyncio.shield(_set_run_state(run_id, {"status": interrupted_status, "started_at": started_at, "finished_at": time.time(), "node_count": len(nodes_map)}))
 
     final_updated_nodes = []
     for node_in_original_payload in workflow.nodes:
         if node_in_original_payload.id in processed_nodes_map:
             final_updated_nodes.append(processed_nodes_map[node_in_original_payload.id])
+        elif only_node_ids is not None and node_in_original_payload.id not in only_node_ids:
+            final_updated_nodes.append(node_in_original_payload) # Outside a partial run, keep as-is
         else:
-            # Node was not processed (e.g., due to being unreachable or in a malformed part of graph)
-            node_in_original_payload.data["error_message"] = "Node was not reached during execution."
+            reason = plan.blocked.get(node_in_original_payload.id, "Node was not reached during execution.")
+            node_in_original_payload.data["error_message"] = reason
             final_updated_nodes.append(node_in_original_payload)
-            log(f"Node '{node_in_original_payload.id}' was not in the processed map.")
+            log.warn("Node '%s' not executed: %s", node_in_original_payload.id, reason, node_id=node_in_original_payload.id)
 
+    if mirror: # Point consumers at local copies that are already downloaded; the rest keep the remote URL for now
+        for node in final_updated_nodes:
+            local_url = mirror.local_url(node.data.get("output_image_url"))
+            if local_url: node.data["mirrored_image_url"] = local_url
     workflow.nodes = final_updated_nodes
-    return workflow, execution_log
+    finished_at = time.time()
+    status = "completed_with_errors" if failed_node_ids or plan.blocked else "completed"
+    if checkpoints:
+        await checkpoints.close()
+        if status == "completed": await delete_checkpoint(run_id) # Nothing left to resume; failed runs keep theirs for a retry
+    await _set_run_state(run_id, {
+        "status": status, "started_at": started_at, "finished_at": finished_at, "node_count": len(nodes_map),
+        "failed_node_ids": sorted(failed_node_ids | set(plan.blocked)),
+    })
+    if run_id:
+        await _record_run_history(run_id, workflow, status, started_at, finished_at, log.lines(), node_hashes, node_timings_ms)
+    return workflow, log
+
+async def execute_workflow_delta(delta: WorkflowDeltaRequest, base_revision: int, nodes: List[Node], edges: List[Edge],
+                                 run_id: Optional[str] = None) -> Tuple[int, List[Node], WorkflowPayload, RunLog]:
+    """Runs a session graph (from `apply_graph_delta`) and stores the result as the next revision.
+
+    Returns (new revision, nodes whose data the run changed, workflow, log). Raises GraphRevisionConflict when another
+    delta saved its result first.
+    """
+    data_before = {n.id: _normalized_node_data(n) for n in nodes}
+    options = delta.model_dump(include=set(WorkflowRunOptions.model_fields))
+    workflow = WorkflowPayload(**options, nodes=nodes, edges=edges, workflow_id=delta.session_id)
+    workflow, log = await execute_ai_workflow(workflow, run_id=run_id)
+    revision = base_revision + 1
+    await save_session_graph(delta.session_id, base_revision, revision, workflow.nodes, workflow.edges)
+    changed = [n for n in workflow.nodes if _normalized_node_data(n) != data_before.get(n.id)]
+    return revision, changed, workflow, log
+
+async def resume_workflow_run(run_id: str, api_keys: AIProviderKeyConfig) -> Tuple[WorkflowPayload, RunLog]:
+    """Re-runs an interrupted (crashed, cancelled or partly failed) run under the same id, skipping nodes it already completed."""
+    if is_run_active(run_id): raise RunNotResumable(f"Run '{run_id}' is still executing.")
+    checkpoint = await load_checkpoint(run_id)
+    if checkpoint is None: raise RunNotFound(f"No checkpoint for run '{run_id}'; it completed, expired or never started.")
+    payload = checkpoint["payload"]
+    only_node_ids = payload.pop("only_node_ids", None)
+    workflow = WorkflowPayload(**{**payload, "api_keys": api_keys})
+    return await execute_ai_workflow(workflow, run_id=run_id, only_node_ids=set(only_node_ids) if only_node_ids is not None else None,
+                                     resume_from=checkpoint["nodes"])
+
+def get_provider_latency_stats() -> Dict[str, Dict[str, Any]]:
+    return PROVIDER_LATENCY.snapshot()
+
+async def promote_preview_run(request: PromoteRequest, run_id: Optional[str] = None) -> Tuple[WorkflowPayload, RunLog]:
+    """Re-renders the chosen nodes of a past (preview) run at full quality, locked to the seeds the preview used.
+
+    Returns only the re-rendered nodes (the chosen ones and their ancestors).
+    """
+    past_run = await get_run_history().get_run(request.run_id)
+    if past_run is None: raise RunNotFound(f"Run '{request.run_id}' not found in history.")
+    nodes = [Node(**n) for n in past_run["nodes"]]
+    unknown = set(request.node_ids) - {n.id for n in nodes}
+    if unknown: raise RunNotFound(f"Nodes not part of run '{request.run_id}': {', '.join(sorted(unknown))}")
+    workflow = WorkflowPayload(
+        nodes=nodes, edges=[Edge(**e) for e in past_run["edges"]], api_keys=request.api_keys,
+        workflow_id=past_run.get("workflow_id"), template_id=past_run.get("template_id"), execution_mode=ExecutionMode.FULL,
+        log_level=request.log_level,
+    )
+    plan, _ = get_execution_plan(workflow.nodes, workflow.edges)
+    selected = plan.ancestor_closure(request.node_ids)
+    pinned = set() # Seeded from the preview for this re-render only
+    for node in workflow.nodes:
+        if node.id in selected and node.data.get("seed") is None and node.data.get("preview_seed") is not None:
+            node.data["seed"] = node.data["preview_seed"]
+            pinned.add(node.id)
+    workflow, log = await execute_ai_workflow(workflow, run_id=run_id, only_node_ids=selected)
+    # Only what was re-rendered: the other nodes are the stored copies from history, older than the client's canvas.
+    workflow.nodes = [n for n in workflow.nodes if n.id in selected]
+    for node in workflow.nodes: # The client keeps the node unseeded, so later runs still vary
+        if node.id in pinned: node.data.pop("seed", None)
+    return workflow, log
 
 async def get_ai_assistant_suggestion(workflow: Optional[WorkflowPayload] = None, user_query: Optional[str] = None) -> str:
     # This remains conceptual, as full Pipecat integration is complex.
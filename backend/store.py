@@ -0,0 +1,151 @@
+import os
+import json
+import time
+import asyncio
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Any, Dict, Optional, Callable
+
+# Shared state for every uvicorn worker on the host: node result cache, run state, graph sessions.
+# "sqlite:///relative/or/absolute/path.db" (default) or "redis://host:6379/0" for any Redis-compatible server.
+DEFAULT_STORE_URL = f"sqlite:///{Path(__file__).parent / 'marketcanvas_store.db'}"
+
+class BackingStore(ABC):
+    """Interface for a namespaced key/value store with TTLs. Values are JSON-serializable."""
+    @abstractmethod
+    async def get(self, namespace: str, key: str) -> Optional[Any]: ...
+    @abstractmethod
+    async def set(self, namespace: str, key: str, value: Any, ttl_seconds: Optional[float] = None) -> None: ...
+    @abstractmethod
+    async def delete(self, namespace: str, key: str) -> None: ...
+    @abstractmethod
+    async def compare_and_set(self, namespace: str, key: str, expected: Any, values: Dict[str, Any], ttl_seconds: Optional[float] = None) -> bool:
+        """Atomically writes `values` (key -> value, same namespace) only if `key` currently holds `expected` (None: absent)."""
+    async def close(self) -> None: pass
+
+class SQLiteStore(BackingStore):
+    # WAL mode lets several worker processes read concurrently while one writes.
+    PURGE_EVERY_N_WRITES = 500
+
+    def __init__(self, path: str):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=10.0)
+        self._lock = threading.Lock()
+        self._writes = 0
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS kv (namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, expires_at REAL, PRIMARY KEY (namespace, key))")
+
+    async def _run(self, fn: Callable[[], Any]) -> Any:
+        def locked():
+            with self._lock: return fn()
+        return await asyncio.get_running_loop().run_in_executor(None, locked)
+
+    async def get(self, namespace: str, key: str) -> Optional[Any]:
+        def op():
+            row = self._conn.execute("SELECT value, expires_at FROM kv WHERE namespace = ? AND key = ?", (namespace, key)).fetchone()
+            if not row: return None
+            if row[1] is not None and row[1] < time.time(): return None
+            return json.loads(row[0])
+        return await self._run(op)
+
+    async def set(self, namespace: str, key: str, value: Any, ttl_seconds: Optional[float] = None) -> None:
+        encoded = json.dumps(value)
+        expires_at = time.time() + ttl_seconds if ttl_seconds else None
+        def op():
+            self._conn.execute("INSERT OR REPLACE INTO kv (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)", (namespace, key, encoded, expires_at))
+            self._writes += 1
+            if self._writes % self.PURGE_EVERY_N_WRITES == 0:
+                self._conn.execute("DELETE FROM kv WHERE expires_at IS NOT NULL AND expires_at < ?", (time.time(),))
+        await self._run(op)
+
+    async def delete(self, namespace: str, key: str) -> None:
+        await self._run(lambda: self._conn.execute("DELETE FROM kv WHERE namespace = ? AND key = ?", (namespace, key)))
+
+    async def compare_and_set(self, namespace: str, key: str, expected: Any, values: Dict[str, Any], ttl_seconds: Optional[float] = None) -> bool:
+        encoded = {k: json.dumps(v) for k, v in values.items()}
+        expires_at = time.time() + ttl_seconds if ttl_seconds else None
+        def op():
+            # BEGIN IMMEDIATE: the compare and the writes happen under the database write lock, across worker processes.
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT value, expires_at FROM kv WHERE namespace = ? AND key = ?", (namespace, key)).fetchone()
+                current = json.loads(row[0]) if row and (row[1] is None or row[1] >= time.time()) else None
+                if current != expected:
+                    self._conn.execute("ROLLBACK")
+                    return False
+                self._conn.executemany("INSERT OR REPLACE INTO kv (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+                                       [(namespace, k, v, expires_at) for k, v in encoded.items()])
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            return True
+        return await self._run(op)
+
+    async def close(self) -> None:
+        await self._run(self._conn.close)
+
+class RedisStore(BackingStore):
+    def __init__(self, url: str, key_prefix: str = "marketcanvas"):
+        try:
+            import redis.asyncio as redis_asyncio # Optional dependency, only needed for redis:// URLs
+            from redis.exceptions import WatchError
+        except ImportError as e:
+            raise RuntimeError("STORE_URL points at Redis but the 'redis' package is not installed.") from e
+        self._redis = redis_asyncio.from_url(url)
+        self._watch_error = WatchError
+        self._prefix = key_prefix
+
+    def _key(self, namespace: str, key: str) -> str: return f"{self._prefix}:{namespace}:{key}"
+
+    async def get(self, namespace: str, key: str) -> Optional[Any]:
+        raw = await self._redis.get(self._key(namespace, key))
+        return json.loads(raw) if raw is not None else None
+
+    async def set(self, namespace: str, key: str, value: Any, ttl_seconds: Optional[float] = None) -> None:
+        await self._redis.set(self._key(namespace, key), json.dumps(value), px=int(ttl_seconds * 1000) if ttl_seconds else None)
+
+    async def delete(self, namespace: str, key: str) -> None:
+        await self._redis.delete(self._key(namespace, key))
+
+    async def compare_and_set(self, namespace: str, key: str, expected: Any, values: Dict[str, Any], ttl_seconds: Optional[float] = None) -> bool:
+        # WATCH/MULTI: the transaction is discarded if another client touches the key between the read and EXEC.
+        async with self._redis.pipeline(transaction=True) as pipe:
+            await pipe.watch(self._key(namespace, key))
+            raw = await pipe.get(self._key(namespace, key))
+            if (json.loads(raw) if raw is not None else None) != expected:
+                await pipe.unwatch()
+                return False
+            pipe.multi()
+            for k, v in values.items(): pipe.set(self._key(namespace, k), json.dumps(v), px=int(ttl_seconds * 1000) if ttl_seconds else None)
+            try: await pipe.execute()
+            except self._watch_error: return False
+            return True
+
+    async def close(self) -> None:
+        await self._redis.close()
+
+def create_store(url: str) -> BackingStore:
+    if url.startswith("sqlite:///"):
+        path = Path(url[len("sqlite:///"):])
+        if not path.is_absolute(): path = Path(__file__).parent / path
+        return SQLiteStore(str(path))
+    if url.startswith(("redis://", "rediss://", "unix://")): return RedisStore(url)
+    raise ValueError(f"Unsupported STORE_URL scheme: {url}")
+
+_store: Optional[BackingStore] = None
+
+def get_store() -> BackingStore:
+    global _store
+    if _store is None: _store = create_store(os.getenv("STORE_URL", DEFAULT_STORE_URL))
+    return _store
+
+async def close_store() -> None:
+    global _store
+    if _store is not None:
+        await _store.close()
+        _store = None
@@ -0,0 +1,92 @@
+import asyncio
+import hashlib
+import os
+from pathlib import Path
+from typing import Dict, Optional
+from uuid import uuid4
+from .asset_mirror import get_asset_mirror
+
+try:
+    from PIL import Image # Optional: without it thumbnail requests fall back to the original image
+except ImportError:
+    Image = None
+
+# Small previews of node outputs for the canvas and properties panel, generated once per artifact and kept on disk.
+THUMBNAILS_AVAILABLE = Image is not None
+THUMBNAIL_SIZES = (96, 192, 384) # Requested sizes are rounded up to one of these, so each artifact has few variants
+THUMBNAIL_SOURCE_WAIT_SECONDS = 10.0 # How long to wait for an in-flight mirror download of a remote output
+THUMBNAIL_MAX_SOURCE_PIXELS = 64 * 1024 * 1024 # Refuse decompression bombs
+if Image is not None: Image.init() # Registers every format plugin, so Image.SAVE lists WEBP when it's available
+THUMBNAIL_FORMAT = "WEBP" if Image is not None and "WEBP" in Image.SAVE else "PNG"
+
+def thumbnail_size_for(requested: int) -> int:
+    return next((size for size in THUMBNAIL_SIZES if size >= requested), THUMBNAIL_SIZES[-1])
+
+def _render_thumbnail(source: Path, target: Path, size: int):
+    with Image.open(source) as img:
+        if img.width * img.height > THUMBNAIL_MAX_SOURCE_PIXELS: raise ValueError("image too large to thumbnail")
+        img.draft("RGB", (size, size)) # JPEG: decode at reduced scale instead of full resolution
+        img.thumbnail((size, size))
+        if img.mode not in ("RGB", "RGBA"): img = img.convert("RGBA" if "A" in img.getbands() or "transparency" in img.info else "RGB")
+        tmp_path = target.with_name(f".{target.name}.{uuid4().hex}.part")
+        try:
+            img.save(tmp_path, format=THUMBNAIL_FORMAT, **({"quality": 80} if THUMBNAIL_FORMAT == "WEBP" else {}))
+            os.replace(tmp_path, target) # Atomic, so concurrent workers never serve a partial file
+        finally:
+            if tmp_path.exists(): tmp_path.unlink()
+
+class ThumbnailCache:
+    def __init__(self, directory: Path, assets_root: Path, assets_base_url: str):
+        self.directory = directory
+        self.assets_root = assets_root.resolve() # Local files behind assets_base_url (uploads and mirrored outputs)
+        self.assets_base_url = assets_base_url.rstrip("/") + "/"
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._renders: Dict[str, "asyncio.Task[Optional[Path]]"] = {} # In-flight renders, deduplicated by file name
+
+    def _local_path(self, url: Optional[str]) -> Optional[Path]:
+        if not url or not url.startswith(self.assets_base_url): return None
+        path = (self.assets_root / url[len(self.assets_base_url):].split("?")[0]).resolve()
+        if self.assets_root not in path.parents or not path.is_file(): return None # No escaping the asset directory
+        return path
+
+    async def _source_path(self, url: str) -> Optional[Path]:
+        # Only local files: remote outputs are used once the asset mirror has them, never downloaded from here.
+        local = self._local_path(url)
+        if local: return local
+        mirror = get_asset_mirror()
+        if not mirror or not mirror.is_remote(url): return None
+        mirrored = await mirror.wait(url, THUMBNAIL_SOURCE_WAIT_SECONDS) or (await mirror.resolve_shared([url])).get(url)
+        return self._local_path(mirrored)
+
+    async def get(self, url: str, size: int) -> Optional[Path]:
+        """Path of the thumbnail of `url`, rendered on first request; None if there is no local copy to render from."""
+        if Image is None: return None
+        size = thumbnail_size_for(size)
+        name = f"{hashlib.sha256(url.encode()).hexdigest()[:32]}_{size}.{THUMBNAIL_FORMAT.lower()}"
+        target = self.directory / name
+        if target.is_file(): return target
+        task = self._renders.get(name)
+        if task is None:
+            task = self._renders[name] = asyncio.ensure_future(self._render(url, target, size))
+            task.add_done_callback(lambda _: self._renders.pop(name, None))
+        return await asyncio.shield(task) # A client going away doesn't cancel a render others may be waiting for
+
+    async def _render(self, url: str, target: Path, size: int) -> Optional[Path]:
+        source = await self._source_path(url)
+        if source is None: return None
+        try:
+            await asyncio.to_thread(_render_thumbnail, source, target, size)
+            return target
+        except Exception as e:
+            print(f"Warning: could not thumbnail {url[:80]}: {e}")
+            return None
+
+_thumbnails: Optional[ThumbnailCache] = None
+
+def configure_thumbnails(directory: Path, assets_root: Path, assets_base_url: str) -> ThumbnailCache:
+    global _thumbnails
+    _thumbnails = ThumbnailCache(directory, assets_root, assets_base_url)
+    return _thumbnails
+
+def get_thumbnails() -> Optional[ThumbnailCache]:
+    return _thumbnails
@@ -1,6 +1,6 @@
 import reflex as rx
-from .state.app_state import AppState # Your main state
-from .components.react_flow_custom import react_flow, background, controls, minimap
+from .state.app_state import AppState, CanvasState, CatalogState, SettingsState # Root state and the substates used here
+from .components.react_flow_custom import canvas_flow, background, controls, minimap
 from .components.ui_panels import node_palette_panel, properties_panel, right_sidebar_panel, api_key_input_modal
 
 def editor_page_layout() -> rx.Component:
@@ -17,12 +17,12 @@ def editor_page_layout() -> rx.Component:
 
                 # Bottom part of center: ReactFlow Canvas
                 rx.box(
-                    react_flow(
+                    canvas_flow(
                         # Children components for ReactFlow
                         background(
                             variant="dots", gap=15, size=1,
                             # Dynamically set background color based on theme for contrast
-                            color=rx.cond(AppState.current_ui_theme == "dark", "var(--border-color)", "var(--border-color)")
+                            color=rx.cond(SettingsState.current_ui_theme == "dark", "var(--border-color)", "var(--border-color)")
                         ),
                         controls(position="top-right", style={"background": "var(--panel-bg)", "border": "1px solid var(--border-color)"}),
                         minimap(
@@ -32,17 +32,21 @@ def editor_page_layout() -> rx.Component:
                         ),
 
                         # Core ReactFlow Props
-                        nodes=AppState.nodes_for_reactflow,
-                        edges=AppState.edges_for_reactflow,
-                        on_nodes_change=AppState.on_nodes_change,
-                        on_edges_change=AppState.on_edges_change,
-                        on_connect=AppState.on_connect,
-                        on_node_click=AppState.on_node_click_rf,
-                        on_pane_click=AppState.on_pane_click_rf,
-                        on_node_drag_stop=AppState.on_node_drag_stop_rf,
-                        on_init=AppState.on_react_flow_init, # To get instance for fitView etc.
+                        snapshot=CanvasState.canvas_snapshot, # Full graph on first load; after that only change sets
+                        ops=CanvasState.canvas_ops,
+                        on_ops_applied=CanvasState.ack_canvas_ops,
+                        on_viewport_change=CanvasState.on_viewport_change, # Large canvases: full node data only near the viewport
+                        on_connect_drop=CanvasState.on_connect_drop,
+                        on_nodes_change=CanvasState.on_nodes_change,
+                        on_edges_change=CanvasState.on_edges_change,
+                        on_connect=CanvasState.on_connect,
+                        on_node_click=CanvasState.on_node_click_rf,
+                        on_pane_click=CanvasState.on_pane_click_rf,
+                        on_node_drag_stop=CanvasState.on_node_drag_stop_rf,
+                        on_init=CanvasState.on_react_flow_init, # To get instance for fitView etc.
                         fit_view=True, # Fit view on initial load and when nodes change significantly
                         elevate_nodes_on_drag=True,
+                        only_render_visible_elements=True, # Off-screen nodes/edges aren't mounted
                         min_zoom=0.1,
                         max_zoom=3.0,
                         snap_to_grid=True, # Enable snap to grid
@@ -73,7 +77,7 @@ def editor_page_layout() -> rx.Component:
         api_key_input_modal(), # Add the modal globally, its visibility is controlled by state
         
         # Apply theme class to the root for global CSS variable overrides
-        class_name=rx.cond(AppState.current_ui_theme == "dark", "theme-dark", ""),
+        class_name=rx.cond(SettingsState.current_ui_theme == "dark", "theme-dark", ""),
         width="100vw",
         height="100vh",
         overflow="hidden", # Prevent scrollbars on the body/root
@@ -93,6 +97,6 @@ app = rx.App(
         rx.el.meta(name="viewport", content="width=device-width, initial-scale=1"),
         rx.script("console.log('MarketCanvas AI Frontend Initialized.')") # Example
     ],
-    on_load=[AppState.on_app_load] # Call state initialization methods on app load
+    on_load=[CanvasState.load_canvas, CatalogState.load_catalog] # Canvas first: it needs nothing from the backend
 )
 app.add_page(editor_page_layout, route="/", title="MarketCanvas AI Editor") # title here is for browser tab history
@@ -20,6 +20,7 @@ class ReactFlow(ReactFlowLib):
     nodes_connectable: rx.Var[bool] = True
     nodes_focusable: rx.Var[bool] = True # Allow focusing nodes with keyboard
     elevate_nodes_on_drag: rx.Var[bool] = True
+    only_render_visible_elements: rx.Var[bool] # Skip mounting nodes/edges outside the viewport (large graphs)
     pan_on_drag: rx.Var[Union[bool, List[int]]] = True # Allow panning while dragging node close to edge
 
     # Style & Viewport Props
@@ -45,6 +46,149 @@ class ReactFlow(ReactFlowLib):
     on_init: rx.EventHandler[lambda react_flow_instance: []] # Called with ReactFlow instance
     # Add more event handlers as needed: onMoveEnd, onSelectionChange, etc.
 
+# Browser side of the canvas sync: nodes/edges live in React state, seeded from a full snapshot and then patched by the
+# server's change sets. Local edits apply immediately; only what the server needs is forwarded, drags once they settle.
+CANVAS_FLOW_JS = """
+import * as CanvasReact from 'react';
+import { ReactFlow as CanvasReactFlow, applyNodeChanges as canvasApplyNodeChanges, applyEdgeChanges as canvasApplyEdgeChanges } from 'reactflow';
+
+const applyCanvasOps = (items, ops) => {
+  const byId = new Map(items.map((item) => [item.id, item]));
+  for (const op of ops) {
+    if (op.op === 'remove') byId.delete(op.id);
+    else if (op.op === 'add') byId.set(op.id, op.item);
+    else if (byId.has(op.id)) byId.set(op.id, { ...byId.get(op.id), ...op.item });
+  }
+  return Array.from(byId.values());
+};
+
+// Nodes with an output show its thumbnail above the label. Memoized per node object, so unchanged nodes keep their identity
+// and the <img> isn't re-created; loading="lazy" defers it further while the node is scrolled out of the pane.
+const shownNodes = new WeakMap();
+const withThumbnail = (node) => {
+  if (!node.data?.thumbnail_url) return node;
+  let shown = shownNodes.get(node);
+  if (!shown) {
+    const label = (
+      <div>
+        <img src={node.data.thumbnail_url} alt="" width={96} height={96} loading="lazy" decoding="async" draggable={false}
+             style={{ display: 'block', margin: '0 auto 4px', objectFit: 'contain' }}
+             onError={(event) => { event.currentTarget.style.display = 'none'; }} />
+        {node.data.label}
+      </div>
+    );
+    shown = { ...node, data: { ...node.data, label } };
+    shownNodes.set(node, shown);
+  }
+  return shown;
+};
+
+const CanvasFlow = ({ snapshot, ops, onOpsApplied, onNodesChange, onEdgesChange, onViewportChange, onConnectDrop, onInit, ...props }) => {
+  const [nodes, setNodes] = CanvasReact.useState(() => snapshot?.nodes ?? []);
+  const [edges, setEdges] = CanvasReact.useState(() => snapshot?.edges ?? []);
+  const epoch = CanvasReact.useRef(snapshot?.epoch);
+  const seq = CanvasReact.useRef(snapshot?.seq ?? 0);
+  const pendingMoves = CanvasReact.useRef(new Map());
+  const frame = CanvasReact.useRef(null);
+  const wrapper = CanvasReact.useRef(null);
+  const instance = CanvasReact.useRef(null);
+  const connectStart = CanvasReact.useRef(null);
+
+  CanvasReact.useEffect(() => {
+    if (!snapshot || snapshot.epoch === epoch.current) return;
+    epoch.current = snapshot.epoch; seq.current = snapshot.seq;
+    setNodes(snapshot.nodes ?? []); setEdges(snapshot.edges ?? []);
+  }, [snapshot]);
+
+  CanvasReact.useEffect(() => {
+    const fresh = (ops ?? []).filter((op) => op.seq > seq.current);
+    if (!fresh.length) return;
+    seq.current = fresh[fresh.length - 1].seq;
+    const nodeOps = fresh.filter((op) => op.kind === 'node'), edgeOps = fresh.filter((op) => op.kind === 'edge');
+    if (nodeOps.length) setNodes((current) => applyCanvasOps(current, nodeOps));
+    if (edgeOps.length) setEdges((current) => applyCanvasOps(current, edgeOps));
+    if (onOpsApplied) onOpsApplied(seq.current);
+  }, [ops]);
+
+  const flushMoves = CanvasReact.useCallback(() => {
+    if (frame.current !== null) { cancelAnimationFrame(frame.current); frame.current = null; }
+    if (!pendingMoves.current.size) return;
+    const moves = Array.from(pendingMoves.current.values());
+    pendingMoves.current.clear();
+    if (onNodesChange) onNodesChange(moves);
+  }, [onNodesChange]);
+
+  CanvasReact.useEffect(() => () => { if (frame.current !== null) cancelAnimationFrame(frame.current); }, []);
+
+  const handleNodesChange = CanvasReact.useCallback((changes) => {
+    setNodes((current) => canvasApplyNodeChanges(changes, current));
+    let dragging = false;
+    const forward = [];
+    for (const change of changes) {
+      if (change.type === 'position') {
+        if (change.position) pendingMoves.current.set(change.id, { id: change.id, type: 'position', position: change.position });
+        dragging = dragging || change.dragging === true;
+      } else if (change.type === 'select' || change.type === 'remove') forward.push(change);
+    }
+    if (forward.length) { flushMoves(); if (onNodesChange) onNodesChange(forward); }
+    // Mid-drag positions only accumulate (last one per node wins); drag end and keyboard nudges flush on the next frame.
+    if (!dragging && pendingMoves.current.size && frame.current === null) frame.current = requestAnimationFrame(flushMoves);
+  }, [onNodesChange, flushMoves]);
+
+  const handleEdgesChange = CanvasReact.useCallback((changes) => {
+    setEdges((current) => canvasApplyEdgeChanges(changes, current));
+    const removed = changes.filter((change) => change.type === 'remove');
+    if (removed.length && onEdgesChange) onEdgesChange(removed);
+  }, [onEdgesChange]);
+
+  // The visible area in flow coordinates, so the server can send full node data for what's on screen only.
+  const reportViewport = CanvasReact.useCallback((viewport) => {
+    const el = wrapper.current;
+    if (!onViewportChange || !el || !viewport) return;
+    onViewportChange({ x: -viewport.x / viewport.zoom, y: -viewport.y / viewport.zoom,
+                       width: el.clientWidth / viewport.zoom, height: el.clientHeight / viewport.zoom });
+  }, [onViewportChange]);
+
+  const handleInit = CanvasReact.useCallback((flow) => {
+    instance.current = flow;
+    if (onInit) onInit(flow);
+    requestAnimationFrame(() => reportViewport(flow.getViewport())); // After fitView has run
+  }, [onInit, reportViewport]);
+
+  const handleMoveEnd = CanvasReact.useCallback((event, viewport) => reportViewport(viewport), [reportViewport]);
+
+  // A connection dropped on the pane is sent with its flow position; the server snaps it to the nearest node.
+  const handleConnectStart = CanvasReact.useCallback((event, params) => { connectStart.current = params; }, []);
+  const handleConnectEnd = CanvasReact.useCallback((event) => {
+    const start = connectStart.current;
+    connectStart.current = null;
+    const flow = instance.current;
+    if (!start || !onConnectDrop || !flow?.screenToFlowPosition || !event.target?.classList?.contains('react-flow__pane')) return;
+    const point = event.changedTouches ? event.changedTouches[0] : event;
+    onConnectDrop({ ...start, position: flow.screenToFlowPosition({ x: point.clientX, y: point.clientY }) });
+  }, [onConnectDrop]);
+
+  const displayedNodes = CanvasReact.useMemo(() => nodes.map(withThumbnail), [nodes]);
+
+  return <CanvasReactFlow {...props} ref={wrapper} nodes={displayedNodes} edges={edges} onNodesChange={handleNodesChange} onEdgesChange={handleEdgesChange}
+                          onInit={handleInit} onMoveEnd={handleMoveEnd} onConnectStart={handleConnectStart} onConnectEnd={handleConnectEnd} />;
+};
+"""
+
+class CanvasFlow(ReactFlow):
+    """ReactFlow fed by `snapshot` (full graph, first load only) and `ops` (incremental change sets) instead of full lists."""
+    library = None # Defined in the page's custom code, not imported from reactflow
+    tag = "CanvasFlow"
+
+    snapshot: rx.Var[Dict[str, Any]] # {"epoch", "seq", "nodes", "edges"}; a new epoch replaces the local graph
+    ops: rx.Var[List[Dict[str, Any]]] # {"seq", "kind": "node"|"edge", "op": "add"|"update"|"remove", "id", "item"}
+    on_ops_applied: rx.EventHandler[lambda seq: [seq]] # Lets the server drop change sets the canvas already has
+    on_viewport_change: rx.EventHandler[lambda rect: [rect]] # {"x", "y", "width", "height"} in flow coordinates, after init and each pan/zoom
+    on_connect_drop: rx.EventHandler[lambda drop: [drop]] # {"nodeId", "handleId", "handleType", "position"}: connection released on the pane
+
+    def _get_custom_code(self) -> str:
+        return super()._get_custom_code() + "\n" + CANVAS_FLOW_JS
+
 class Background(ReactFlowLib):
     tag = "Background"
     variant: rx.Var[str] = "dots" # 'dots', 'lines', 'cross'
@@ -74,6 +218,7 @@ class MiniMap(ReactFlowLib):
 
 # Create-able instances for easier use
 react_flow = ReactFlow.create
+canvas_flow = CanvasFlow.create
 background = Background.create
 controls = Controls.create
 minimap = MiniMap.create
@@ -1,5 +1,5 @@
 import reflex as rx
-from ..state.app_state import AppState, StylePreset, WorkflowTemplate, NodeData
+from ..state.app_state import AppState, CanvasState, CatalogState, ExecutionState, SettingsState, UploadState, StylePreset, WorkflowTemplate, NodeData, UploadItem, LogEntry, LOG_LEVELS
 
 # --- Node Palette Configurations ---
 AVAILABLE_NODES_CONFIG = {
@@ -21,6 +21,11 @@ AI_PROVIDER_OPTIONS = [
 ]
 
 # --- Reusable Form Control Helpers ---
+PROPERTY_EDIT_DEBOUNCE_MS = 400 # Typed values stay in the browser until the user pauses (or leaves the field)
+
+def _debounced(control: rx.Component) -> rx.Component:
+    return rx.debounce_input(control, debounce_timeout=PROPERTY_EDIT_DEBOUNCE_MS, force_notify_on_blur=True)
+
 def _form_control_wrapper(label: str, control: rx.Component) -> rx.Component:
     return rx.form_control(
         rx.form_label(label, font_size="0.8em", margin_bottom="0.2em", color="var(--secondary-accent)"),
@@ -29,27 +34,27 @@ def _form_control_wrapper(label: str, control: rx.Component) -> rx.Component:
     )
 
 def _data_input_field(label: str, field_name: str, placeholder: str="", input_type: str="text", **props) -> rx.Component:
-    return _form_control_wrapper(label, rx.input(
-        value=AppState.selected_node.data.get(field_name, "" if input_type != "number" else 0),
-        on_change=lambda val: AppState.update_selected_node_data(field_name, val),
+    return _form_control_wrapper(label, _debounced(rx.input(
+        value=CanvasState.selected_node.data.get(field_name, "" if input_type != "number" else 0),
+        on_change=lambda val: CanvasState.update_selected_node_data(field_name, val),
         placeholder=placeholder, type=input_type, size="sm",
         bg="var(--input-bg)", border_color="var(--input-border)", color="var(--app-text-color)",
         _focus={"border_color": "var(--primary-accent)", "box_shadow": f"0 0 0 1px var(--primary-accent)"}, **props
-    ))
+    )))
 
 def _data_textarea_field(label: str, field_name: str, placeholder: str="", rows: int = 3, **props) -> rx.Component:
-    return _form_control_wrapper(label, rx.text_area(
-        value=AppState.selected_node.data.get(field_name, ""),
-        on_change=lambda val: AppState.update_selected_node_data(field_name, val),
+    return _form_control_wrapper(label, _debounced(rx.text_area(
+        value=CanvasState.selected_node.data.get(field_name, ""),
+        on_change=lambda val: CanvasState.update_selected_node_data(field_name, val),
         placeholder=placeholder, size="sm", rows=rows,
         bg="var(--input-bg)", border_color="var(--input-border)", color="var(--app-text-color)",
         _focus={"border_color": "var(--primary-accent)", "box_shadow": f"0 0 0 1px var(--primary-accent)"}, **props
-    ))
+    )))
 
 def _data_select_field(label: str, field_name: str, options: list, placeholder:str="Select...", **props) -> rx.Component:
     return _form_control_wrapper(label, rx.select(
-        options, value=AppState.selected_node.data.get(field_name, ""),
-        on_change=lambda val: AppState.update_selected_node_data(field_name, val),
+        options, value=CanvasState.selected_node.data.get(field_name, ""),
+        on_change=lambda val: CanvasState.update_selected_node_data(field_name, val),
         placeholder=placeholder, size="sm",
         bg="var(--input-bg)", border_color="var(--input-border)", color="var(--app-text-color)",
         icon_color="var(--secondary-accent)",
@@ -59,8 +64,48 @@ def _data_select_field(label: str, field_name: str, options: list, placeholder:s
 def _ai_provider_selector(field_name: str = "provider") -> rx.Component: # Added field_name argument
     return _data_select_field("AI Provider", field_name, AI_PROVIDER_OPTIONS, "Select AI Provider...")
 
+def _fallback_provider_controls() -> rx.Component:
+    return rx.fragment(
+        _data_select_field("Fallback Provider (optional)", "fallback_provider", [rx.option("None", value=""), *AI_PROVIDER_OPTIONS], "No fallback"),
+        rx.cond(CanvasState.selected_node.data.get("fallback_provider", "").to(bool),
+            _form_control_wrapper("Hedge slow requests", rx.switch(
+                is_checked=CanvasState.selected_node.data.get("hedge", False).to(bool),
+                on_change=lambda val: CanvasState.update_selected_node_data("hedge", val), size="sm", color_scheme="purple"
+            ))
+        ),
+        rx.cond(CanvasState.selected_node.data.get("served_by_provider", "").to(bool),
+            rx.text(f"Last output served by fallback: {CanvasState.selected_node.data.get('served_by_provider', '')}", font_size="xs", color="var(--secondary-accent)")
+        ),
+    )
+
 
 # --- Left Sidebar: Node Palette & Asset Upload ---
+def _upload_item_row(item: UploadItem) -> rx.Component:
+    return rx.vstack(
+        rx.hstack(
+            rx.text(item.name, font_size="0.7em", no_of_lines=1, flex_grow="1"),
+            rx.text(rx.cond(item.status == "error", "failed", f"{item.percent}%"), font_size="0.7em",
+                    color=rx.cond(item.status == "error", "var(--error-text-color)", "var(--secondary-accent)")),
+            width="100%", spacing="1"
+        ),
+        rx.progress(value=item.percent, size="xs", width="100%", color_scheme=rx.cond(item.status == "error", "red", "blue")),
+        rx.cond(item.detail != "", rx.text(item.detail, font_size="0.65em", color="var(--secondary-accent)", no_of_lines=1, title=item.detail)),
+        spacing="0", width="100%", margin_top="0.3em"
+    )
+
+LOG_LEVEL_COLORS = {"debug": "var(--secondary-accent)", "info": "var(--app-text-color)", "warn": "orange", "error": "var(--error-text-color)"}
+
+def _log_entry_row(entry: LogEntry) -> rx.Component:
+    return rx.hstack(
+        rx.text(entry.time_label, font_size="0.65em", color="var(--secondary-accent)", flex_shrink="0"),
+        rx.text(entry.message, font_size="0.7em", no_of_lines=1, title=entry.message, flex_grow="1",
+                color=rx.match(entry.level, *LOG_LEVEL_COLORS.items(), "var(--secondary-accent)")),
+        rx.cond(entry.duration_label != "", rx.text(entry.duration_label, font_size="0.65em", color="var(--secondary-accent)", flex_shrink="0")),
+        rx.cond(entry.node_id, rx.badge(entry.node_id, font_size="0.6em", variant="subtle", cursor="pointer", title="Select node",
+                                        on_click=lambda: CanvasState.select_node(entry.node_id))),
+        width="100%", spacing="1", margin_bottom="0.2em"
+    )
+
 def node_palette_panel() -> rx.Component:
     return rx.vstack(
         rx.heading("Toolbox", size="md", margin_bottom="1em", padding_x="0.75em", color="var(--app-text-color)"),
@@ -70,18 +115,24 @@ def node_palette_panel() -> rx.Component:
                 rx.center(
                     rx.vstack(
                         rx.icon(tag="upload_file", size="1.8em", color="var(--primary-accent)"),
-                        rx.text("Click or Drag Image", font_size="xs", color="var(--secondary-accent)"),
+                        rx.text("Click or Drag Images", font_size="xs", color="var(--secondary-accent)"),
                         spacing="1", padding_y="0.8em"
                     ),
                     height="80px", width="100%"
                 ),
                 id="asset_uploader_sidebar", border="2px dashed var(--border-color)", padding="0.5em",
-                width="100%", border_radius="md", on_drop=AppState.handle_asset_upload,
-                is_disabled=AppState.is_uploading_asset, _hover={"border_color": "var(--primary-accent)"}
+                width="100%", border_radius="md", on_drop=UploadState.handle_asset_upload, multiple=True,
+                accept={"image/*": [".png", ".jpg", ".jpeg", ".webp", ".gif"]},
+                is_disabled=UploadState.is_uploading_asset, _hover={"border_color": "var(--primary-accent)"}
+            ),
+            rx.foreach(UploadState.upload_items, _upload_item_row),
+            rx.hstack(
+                rx.switch(is_checked=UploadState.downscale_uploads, on_change=UploadState.set_downscale_uploads, size="sm", color_scheme="blue"),
+                rx.text("Downscale large images", font_size="xs", color="var(--secondary-accent)"),
+                spacing="2", margin_top="0.3em", title="Images over the size limit are resized before upload (needs Pillow)"
             ),
-            rx.cond(AppState.is_uploading_asset, rx.center(rx.circular_progress(is_indeterminate=True, size="20px", color="var(--primary-accent)"), margin_top="0.3em")),
-            rx.cond(AppState.uploaded_asset_url.is_not_none() and not AppState.is_uploading_asset,
-                rx.text(f"Up: {AppState.uploaded_asset_url.split('/')[-1][:20]}...", font_size="0.7em", color="var(--secondary-accent)", margin_top="0.3em", no_of_lines=1)
+            rx.cond(UploadState.uploaded_asset_url.is_not_none() and not UploadState.is_uploading_asset,
+                rx.text(f"Up: {UploadState.uploaded_asset_url.split('/')[-1][:20]}...", font_size="0.7em", color="var(--secondary-accent)", margin_top="0.3em", no_of_lines=1)
             ),
             spacing="1", padding_x="0.75em", margin_bottom="1em", width="100%"
         ),
@@ -90,7 +141,7 @@ def node_palette_panel() -> rx.Component:
             *[
                 rx.button(
                     rx.hstack(rx.icon(tag=config["icon"], size="1.1em"), rx.text(config["label"], font_size="0.85em"), spacing="2", align_items="center"),
-                    on_click=lambda type_key=type_key, name_prefix=config["label"]: AppState.add_node(type_key, name_prefix),
+                    on_click=lambda type_key=type_key, name_prefix=config["label"]: CanvasState.add_node(type_key, name_prefix),
                     width="100%", justify_content="flex-start", variant="ghost",
                     color_scheme=config["color_scheme"], # Reflex uses this for some base styling
                     _hover={"background_color": rx.color(config["color_scheme"], 1)} # Use Chakra color scale
@@ -102,9 +153,16 @@ def node_palette_panel() -> rx.Component:
         rx.divider(margin_y="1em", border_color="var(--border-color)"),
         rx.button(
             "Delete Selected",
-            on_click=AppState.delete_selected_node, color_scheme="red", variant="outline",
+            on_click=CanvasState.delete_selected_node, color_scheme="red", variant="outline",
             width="calc(100% - 1.5em)", margin_x="0.75em", size="sm",
-            is_disabled=AppState.selected_node.is_none(), left_icon=rx.icon(tag="delete", size="1.1em")
+            is_disabled=CanvasState.selected_node.is_none(), left_icon=rx.icon(tag="delete", size="1.1em")
+        ),
+        rx.hstack(
+            rx.button("Undo", on_click=CanvasState.undo, is_disabled=~CanvasState.can_undo, title=CanvasState.undo_label,
+                      size="sm", variant="outline", flex="1", left_icon=rx.icon(tag="undo", size="1.1em")),
+            rx.button("Redo", on_click=CanvasState.redo, is_disabled=~CanvasState.can_redo,
+                      size="sm", variant="outline", flex="1", left_icon=rx.icon(tag="redo", size="1.1em")),
+            width="calc(100% - 1.5em)", margin_x="0.75em", spacing="2"
         ),
         padding_y="1em", height="100%", overflow_y="auto", class_name="custom-scrollbar",
         bg="var(--panel-bg)", border_right="1px solid var(--border-color)", spacing="3", width="var(--sidebar-width-left)"
@@ -112,7 +170,7 @@ def node_palette_panel() -> rx.Component:
 
 # --- Center Top Area: Properties Panel ---
 def _node_specific_properties_ui() -> rx.Component:
-    node_type = AppState.selected_node.type
+    node_type = CanvasState.selected_node.type
     common_props = rx.fragment(_data_input_field("Label", "label", "Node Label"))
 
     specific_props = rx.fragment() # Default to empty fragment
@@ -120,13 +178,14 @@ def _node_specific_properties_ui() -> rx.Component:
         specific_props = _data_input_field("Image URL", "input_image_url", "https://example.com/image.jpg")
     elif node_type == "imageUpload":
         specific_props = rx.vstack(
-            rx.text(f"File: {AppState.selected_node.data.get('file_name', 'N/A')}", font_size="sm"),
-            rx.text(f"URL: {AppState.selected_node.data.get('output_image_url', 'N/A')}", font_size="xs", no_of_lines=1, title=AppState.selected_node.data.get('output_image_url', 'N/A')),
+            rx.text(f"File: {CanvasState.selected_node.data.get('file_name', 'N/A')}", font_size="sm"),
+            rx.text(f"URL: {CanvasState.selected_node.data.get('output_image_url', 'N/A')}", font_size="xs", no_of_lines=1, title=CanvasState.selected_node.data.get('output_image_url', 'N/A')),
             align_items="flex-start", spacing="1"
         )
     elif node_type == "textToImage":
         specific_props = rx.fragment(
             _ai_provider_selector(),
+            _fallback_provider_controls(),
             _data_textarea_field("Prompt", "prompt", "e.g., Enchanted forest at twilight"),
             _data_textarea_field("Negative Prompt", "negative_prompt", "e.g., blurry, ugly, text, watermark", rows=2),
             _data_input_field("Seed", "seed", "e.g., 12345", input_type="number")
@@ -140,13 +199,13 @@ def _node_specific_properties_ui() -> rx.Component:
         )
     elif node_type == "styleApply":
         style_mode_options = [rx.option(mode.replace("_", " ").title(), value=mode) for mode in ["preset", "image_reference"]]
-        preset_options = [rx.option(p.name, value=p.id) for p in AppState.available_style_presets]
+        preset_options = [rx.option(p.name, value=p.id) for p in CatalogState.available_style_presets]
         specific_props = rx.fragment(
             _ai_provider_selector(), # Assuming style models could vary by provider
             _data_select_field("Style Mode", "style_mode", style_mode_options),
-            rx.cond(AppState.selected_node.data.get("style_mode") == "preset",
+            rx.cond(CanvasState.selected_node.data.get("style_mode") == "preset",
                 _data_select_field("Style Preset", "style_preset_id", preset_options, "Select a style preset...")),
-            rx.cond(AppState.selected_node.data.get("style_mode") == "image_reference",
+            rx.cond(CanvasState.selected_node.data.get("style_mode") == "image_reference",
                 _data_input_field("Style Reference Image URL", "style_reference_image_url", "http://style-image.jpg")),
             _data_input_field("Intensity", "intensity", "0.7", input_type="number", step="0.05", min="0", max="1"),
         )
@@ -182,36 +241,51 @@ def properties_panel() -> rx.Component:
         rx.hstack(
             rx.heading(
                 rx.cond(
-                    AppState.selected_node.is_not_none(),
-                    f"{AVAILABLE_NODES_CONFIG.get(AppState.selected_node.type, {'label': 'Node'})['label']} Properties",
+                    CanvasState.selected_node.is_not_none(),
+                    f"{AVAILABLE_NODES_CONFIG.get(CanvasState.selected_node.type, {'label': 'Node'})['label']} Properties",
                     "Properties"
                 ),
                 size="md", color="var(--app-text-color)"
             ),
             rx.spacer(),
-            rx.cond(AppState.selected_node.is_not_none(),
-                rx.text(f"ID: {AppState.selected_node.id}", font_size="0.7em", color="var(--secondary-accent)")
+            rx.cond(CanvasState.selected_node.is_not_none(),
+                rx.text(f"ID: {CanvasState.selected_node.id}", font_size="0.7em", color="var(--secondary-accent)")
             ),
             padding_x="0.75em", padding_y="0.5em", width="100%",
             border_bottom="1px solid var(--border-color)", bg="var(--panel-header-bg)"
         ),
         rx.cond(
-            AppState.selected_node.is_none(),
+            CanvasState.selected_node.is_none(),
             rx.center(rx.text("Select a node to view its properties.", color="var(--secondary-accent)", padding="2em", font_style="italic")),
             rx.vstack(
                 _node_specific_properties_ui(),
-                rx.cond(AppState.selected_node.data.get("output_image_url", "").to(bool),
+                rx.cond(CanvasState.selected_node.data.get("output_image_url", "").to(bool),
                      rx.vstack(
                         rx.text("Node Output Preview:", font_size="xs", margin_top="0.5em", font_weight="500", color="var(--secondary-accent)"),
-                        rx.image(src=AppState.selected_node.data.get("output_image_url"), max_height="120px", width="auto",
+                        rx.image(src=CanvasState.selected_node_thumbnail_url, # Small rendition; the original only if there's no thumbnail
+                                 fallback_src=rx.cond(CanvasState.selected_node.data.get("mirrored_image_url", "").to(bool),
+                                                      CanvasState.selected_node.data.get("mirrored_image_url"), CanvasState.selected_node.data.get("output_image_url")),
+                                 loading="lazy", max_height="120px", width="auto",
                                  border="1px solid var(--border-color)", object_fit="contain", border_radius="md", bg="var(--canvas-bg)"),
                         align_items="flex-start", width="100%", margin_top="0.5em"
                     )
                 ),
-                rx.cond(AppState.selected_node.data.get("error_message", "").to(bool),
+                rx.button(
+                    "Run up to this node", on_click=ExecutionState.execute_up_to_selected_node, is_loading=ExecutionState.is_loading_workflow,
+                    size="sm", variant="outline", color_scheme="blue", width="100%", left_icon=rx.icon(tag="play_arrow"),
+                    title="Execute only this node and its inputs; downstream nodes are left as they are"
+                ),
+                rx.cond(CanvasState.selected_node.data.get("is_preview", False).to(bool),
+                    rx.button(
+                        "Promote to full quality", on_click=ExecutionState.promote_selected_node, is_loading=ExecutionState.is_loading_workflow,
+                        size="sm", variant="outline", color_scheme="green", width="100%",
+                        title="Re-render this node and its inputs at full resolution with the preview's seeds"
+                    )
+                ),
+                rx.cond(CanvasState.selected_node.data.get("error_message", "").to(bool),
                     rx.box(
                         rx.hstack(rx.icon(tag="error_outline", color="var(--error-text-color)"), rx.text("Node Error:", font_weight="bold", color="var(--error-text-color)")),
-                        rx.text(AppState.selected_node.data.get("error_message"), color="var(--error-text-color)", font_size="xs", white_space="pre-wrap"),
+                        rx.text(CanvasState.selected_node.data.get("error_message"), color="var(--error-text-color)", font_size="xs", white_space="pre-wrap"),
                         margin_top="0.5em", padding="0.5em", bg="var(--error-bg-color)", border_radius="md", border_left=f"3px solid var(--error-border-color)", width="100%"
                     )
                 ),
@@ -229,7 +303,7 @@ def right_sidebar_panel() -> rx.Component:
         rx.hstack(
             rx.heading("Tools & Output", size="md", color="var(--app-text-color)"),
             rx.spacer(),
-            rx.icon_button(rx.icon(tag="settings"), on_click=AppState.toggle_api_key_modal, variant="ghost", size="sm", title="Manage API Keys"),
+            rx.icon_button(rx.icon(tag="settings"), on_click=SettingsState.toggle_api_key_modal, variant="ghost", size="sm", title="Manage API Keys"),
             padding_x="0.75em", padding_y="0.5em", width="100%",
             border_bottom="1px solid var(--border-color)", bg="var(--panel-header-bg)"
         ),
@@ -244,14 +318,14 @@ def right_sidebar_panel() -> rx.Component:
                 rx.tab_panel( # Templates
                     rx.vstack(
                         rx.cond(
-                            AppState.available_workflow_templates.length() > 0,
+                            CatalogState.available_workflow_templates.length() > 0,
                             rx.foreach(
-                                AppState.available_workflow_templates,
+                                CatalogState.available_workflow_templates,
                                 lambda template: rx.button(
                                     rx.vstack(rx.text(template.name, font_weight="500", font_size="0.85em", no_of_lines=1),
                                               rx.text(template.description or "", font_size="0.75em", color="var(--secondary-accent)", no_of_lines=2),
                                               align_items="flex-start", width="100%"),
-                                    on_click=lambda: AppState.load_workflow_from_template(template.id),
+                                    on_click=lambda: CanvasState.load_workflow_from_template(template.id),
                                     width="100%", variant="outline", margin_bottom="0.5em", height="auto", padding="0.5em", text_align="left",
                                     border_color="var(--border-color)", _hover={"bg": rx.color("gray", 2, alpha=True)}
                                 )
@@ -265,27 +339,48 @@ def right_sidebar_panel() -> rx.Component:
                     rx.vstack(
                         rx.aspect_ratio(
                             rx.image(
-                                src=AppState.live_preview_image_url,
+                                src=ExecutionState.live_preview_image_url,
                                 fallback_src="https://via.placeholder.com/400x300.png?text=Workflow+Output",
                                 border="1px solid var(--border-color)", object_fit="contain", border_radius="md", bg="var(--canvas-bg)"
                             ), ratio=16/10, width="100%", margin_bottom="1em" # Adjusted ratio
                         ),
+                        rx.hstack(
+                            rx.switch(is_checked=ExecutionState.preview_mode, on_change=ExecutionState.set_preview_mode, color_scheme="green", size="sm"),
+                            rx.text("Fast preview (low-res, seeds recorded)", font_size="0.8em", color="var(--secondary-accent)"),
+                            spacing="2", width="100%"
+                        ),
                         rx.button(
-                            "🚀 Execute Workflow", on_click=AppState.execute_workflow, is_loading=AppState.is_loading_workflow,
+                            rx.cond(ExecutionState.preview_mode, "⚡ Preview Workflow", "🚀 Execute Workflow"),
+                            on_click=ExecutionState.execute_workflow, is_loading=ExecutionState.is_loading_workflow,
                             width="100%", color_scheme="green", left_icon=rx.icon(tag="play_arrow", size="1.2em")
                         ),
+                        rx.cond(ExecutionState.interrupted_run_id.to(bool),
+                            rx.button(
+                                "Resume interrupted run", on_click=ExecutionState.resume_interrupted_run, is_loading=ExecutionState.is_loading_workflow,
+                                width="100%", size="sm", variant="outline", color_scheme="orange",
+                                title="Continue from the last checkpoint; nodes that already finished are not re-generated"
+                            )
+                        ),
                         spacing="3", width="100%"
                     )
                 ),
                 rx.tab_panel( # Log
                     rx.vstack(
+                        rx.hstack(
+                            rx.select(LOG_LEVELS, value=ExecutionState.log_level, on_change=ExecutionState.set_log_level, size="xs", width="6em",
+                                      bg="var(--input-bg)", border_color="var(--input-border)", title="Hide records below this level"),
+                            rx.spacer(),
+                            rx.button("Older", on_click=ExecutionState.show_older_log_entries, is_disabled=~ExecutionState.log_older_available,
+                                      size="xs", variant="ghost"),
+                            rx.button("Latest", on_click=ExecutionState.show_latest_log_entries, is_disabled=ExecutionState.log_following,
+                                      size="xs", variant="ghost"),
+                            rx.button("Clear", on_click=ExecutionState.clear_log, size="xs", variant="ghost"),
+                            width="100%", spacing="1"
+                        ),
                         rx.box(
                             rx.cond(
-                                AppState.workflow_execution_log.length() > 0,
-                                rx.foreach(
-                                    AppState.workflow_execution_log,
-                                    lambda log_entry: rx.text(log_entry, font_size="0.7em", color="var(--secondary-accent)", no_of_lines=1, title=log_entry, margin_bottom="0.2em")
-                                ),
+                                ExecutionState.log_entries.length() > 0,
+                                rx.foreach(ExecutionState.log_entries, _log_entry_row),
                                 rx.text("Log is empty.", font_size="xs", color="var(--secondary-accent)")
                             ),
                             height="200px", width="100%", overflow_y="auto", class_name="custom-scrollbar",
@@ -304,14 +399,14 @@ def right_sidebar_panel() -> rx.Component:
                 rx.tab_panel( # AI Assistant
                     rx.vstack(
                         rx.text_area(placeholder="Ask AI for workflow suggestions or help...", size="sm", bg="var(--input-bg)", margin_bottom="0.5em",
-                                     on_key_down=lambda e: rx.cond(e == "Enter", AppState.fetch_ai_suggestion(e.target.value), None)), # Example on Enter
-                        rx.button("Get Suggestion", on_click=lambda: AppState.fetch_ai_suggestion(), # Or use a button
-                                   is_loading=AppState.is_loading_suggestion, size="sm", variant="outline", width="100%"),
-                        rx.cond(AppState.is_loading_suggestion, rx.center(rx.circular_progress(is_indeterminate=True, size="20px", color="var(--primary-accent)"))),
+                                     on_key_down=lambda e: rx.cond(e == "Enter", ExecutionState.fetch_ai_suggestion(e.target.value), None)), # Example on Enter
+                        rx.button("Get Suggestion", on_click=lambda: ExecutionState.fetch_ai_suggestion(), # Or use a button
+                                   is_loading=ExecutionState.is_loading_suggestion, size="sm", variant="outline", width="100%"),
+                        rx.cond(ExecutionState.is_loading_suggestion, rx.center(rx.circular_progress(is_indeterminate=True, size="20px", color="var(--primary-accent)"))),
                         rx.cond(
-                            AppState.ai_assistant_suggestion.to(bool),
+                            ExecutionState.ai_assistant_suggestion.to(bool),
                             rx.box(
-                                rx.markdown(AppState.ai_assistant_suggestion, component_map={"p": lambda **props: rx.text(**props, font_size="sm", white_space="pre-wrap")}), # Render markdown
+                                rx.markdown(ExecutionState.ai_assistant_suggestion, component_map={"p": lambda **props: rx.text(**props, font_size="sm", white_space="pre-wrap")}), # Render markdown
                                 padding="0.75em", bg=rx.color("blue", 1, alpha=True), border_radius="md",
                                 border_left=f"3px solid var(--primary-accent)", width="100%", margin_top="0.5em"
                             )
@@ -321,7 +416,8 @@ def right_sidebar_panel() -> rx.Component:
                 ),
                 padding="0.75em", width="100%", flex_grow="1", overflow_y="auto", class_name="custom-scrollbar"
             ),
-            width="100%", variant="line", color_scheme="gray", is_fitted=True # Tabs styling
+            width="100%", variant="line", color_scheme="gray", is_fitted=True, # Tabs styling
+            is_lazy=True, # Panels mount when opened: the full-resolution live preview only loads on the Output tab
         ),
         height="100%", # Take full height of its container
         overflow_y="hidden", # Let tabs panel handle scroll
@@ -337,8 +433,8 @@ def api_key_input_modal() -> rx.Component:
         return rx.form_control(
             rx.form_label(provider_label, font_size="sm"),
             rx.input(
-                type="password", value=getattr(AppState.api_keys, provider_key_name, ""),
-                on_change=lambda val: AppState.set_api_key(provider_key_name, val),
+                type="password", value=getattr(SettingsState.api_keys, provider_key_name, ""),
+                on_change=lambda val: SettingsState.set_api_key(provider_key_name, val),
                 placeholder=f"Enter {placeholder_suffix}", size="sm", width="100%",
                 bg="var(--input-bg)", border_color="var(--input-border)", color="var(--app-text-color)"
             ), width="100%", margin_bottom="1em"
@@ -360,12 +456,12 @@ def api_key_input_modal() -> rx.Component:
                 )
             ),
             rx.modal_footer(
-                rx.button("Close", on_click=AppState.toggle_api_key_modal, variant="outline", size="sm"),
+                rx.button("Close", on_click=SettingsState.toggle_api_key_modal, variant="outline", size="sm"),
                 # Optionally add a "Save to Session" button if implementing sessionStorage persistence
             ),
             bg="var(--panel-bg)", border_radius="lg", max_width="550px"
         ),
-        is_open=AppState.show_api_key_modal,
-        on_close=AppState.toggle_api_key_modal,
+        is_open=SettingsState.show_api_key_modal,
+        on_close=SettingsState.toggle_api_key_modal,
         size="xl", scroll_behavior="inside", is_centered=True
     )
@@ -1,9 +1,16 @@
 import reflex as rx
-from typing import List, Dict, Any, Optional, cast
+from typing import List, Dict, Any, Optional, Set, cast
 import json
 import httpx
+import orjson
 import random
+import time
+import asyncio
+from uuid import uuid4
+from urllib.parse import quote
 from pydantic import BaseModel, Field # Can use Pydantic for stricter internal models if preferred
+from .backend_client import get_http_client, catalog_cache
+from .asset_uploads import stream_asset_upload, ASSET_UPLOAD_CONCURRENCY, DOWNSCALE_AVAILABLE
 
 # --- Frontend Data Models (Mirroring backend/models.py where applicable) ---
 # Using rx.Base for objects within rx.State lists/dicts for reactivity.
@@ -14,12 +21,15 @@ class NodeData(rx.Base):
     prompt: Optional[str] = ""
     negative_prompt: Optional[str] = ""
     seed: Optional[int] = None
+    preview_seed: Optional[int] = None # Seed used by the last preview render of this node
+    is_preview: Optional[bool] = None # Output is a low-res preview that can be promoted
     # Image URLs
     input_image_url: Optional[str] = "" # For ImageInputNode
     base_image_url: Optional[str] = ""  # For ProductInSceneNode
     product_image_url: Optional[str] = "" # For ProductInSceneNode
     style_reference_image_url: Optional[str] = "" # For StyleNode
     output_image_url: Optional[str] = None # Common output
+    mirrored_image_url: Optional[str] = None # Backend-local copy of output_image_url, preferred for previews once ready
     # Style Node specific
     style_mode: Optional[str] = "preset" # Default for StyleNode
     style_preset_id: Optional[str] = ""
@@ -36,6 +46,9 @@ class NodeData(rx.Base):
     # Common utility
     error_message: Optional[str] = None
     provider: Optional[str] = "fal_ai" # Default AI provider
+    fallback_provider: Optional[str] = "" # Text-to-Image: secondary provider for failover/hedging
+    hedge: Optional[bool] = False # Text-to-Image: race the fallback provider when the primary is slow
+    served_by_provider: Optional[str] = None # Set by the backend when the fallback produced the output
 
 class Node(rx.Base):
     id: str
@@ -69,6 +82,20 @@ class WorkflowTemplate(rx.Base):
     thumbnail_url: Optional[str] = ""
     workflow_payload: Dict[str, Any] = {} # Stores nodes and edges as dicts
 
+class UploadItem(rx.Base):
+    name: str
+    percent: int = 0
+    status: str = "queued" # "queued" | "uploading" | "done" | "error"
+    detail: str = "" # e.g. "downscaled 6000x4000 to 4096x2731", or the error
+
+class LogEntry(rx.Base):
+    seq: int
+    level: str # "debug" | "info" | "warn" | "error"
+    message: str
+    node_id: Optional[str] = None
+    time_label: str = "" # HH:MM:SS
+    duration_label: str = "" # Node records, e.g. "2.4s"
+
 class AIProviderKeys(rx.Base):
     fal_ai_key: str = ""
     google_gemini_key: str = ""
@@ -76,123 +103,317 @@ class AIProviderKeys(rx.Base):
     pipecat_api_key: str = "" # For AI assistant if it uses a separate key
     # blackforest_flux_key: str = "" # Example for future
 
+UPLOAD_PROGRESS_INTERVAL_SECONDS = 0.25
+MIRROR_REFRESH_ATTEMPTS = 5
+MIRROR_REFRESH_INTERVAL_SECONDS = 2.0
+
+CANVAS_MAX_PENDING_OPS = 200 # Unacknowledged canvas change sets before falling back to a full snapshot
+
+# Large canvases: nodes are bucketed in a grid of SPATIAL_CELL_SIZE flow units for viewport / nearest-node queries. Above
+# VIEWPORT_CULLING_MIN_NODES the canvas only gets full node data for nodes in or near the viewport, the rest as a label.
+SPATIAL_CELL_SIZE = 400.0
+VIEWPORT_CULLING_MIN_NODES = 300
+VIEWPORT_DETAIL_MARGIN = 0.5 # Fraction of the viewport's size around it that is also synced in full
+NODE_CENTER_OFFSET = (75.0, 20.0) # Roughly half a default ReactFlow node; positions are top-left corners
+CONNECT_DROP_MAX_DISTANCE = 120.0 # A connection released on the pane snaps to the nearest node this close
+
+# Output previews: nodes show backend-rendered thumbnails (see backend/thumbnails.py); only the live preview loads originals.
+CANVAS_THUMBNAIL_SIZE = 96
+PANEL_THUMBNAIL_SIZE = 192
+
+# Undo/redo: each step stores only what it changed (added/removed elements, changed data fields, old/new positions).
+HISTORY_BYTE_BUDGET = 2 * 1024 * 1024 # Serialized size of all undo + redo steps; the oldest steps are dropped first
+HISTORY_COALESCE_SECONDS = 2.0 # Repeated edits of the same fields (typing) or moves of the same nodes merge into one step
+_HISTORY_INVERSE = {"node_add": "node_remove", "node_remove": "node_add", "edge_add": "edge_remove", "edge_remove": "edge_add"}
+
+# Execution log: records live in a fixed-size ring on the server; only one page of entries is sent to the browser.
+LOG_RING_SIZE = 1000
+LOG_PAGE_SIZE = 50
+LOG_LEVELS = ["debug", "info", "warn", "error"]
+LOG_LEVEL_ORDER = {level: rank for rank, level in enumerate(LOG_LEVELS)}
+
+JSON_HEADERS = {"content-type": "application/json"}
+
+def _encode_json(payload: Any) -> bytes:
+    # orjson is several times faster than httpx's stdlib `json=` for large node lists.
+    return orjson.dumps(payload, option=orjson.OPT_NON_STR_KEYS)
+
+def _thumbnail_url(backend_url: str, image_url: Optional[str], size: int) -> str:
+    # Keyed by output_image_url (not the mirror URL), so each artifact is rendered once; "" when there is no output.
+    return f"{backend_url}/api/v1/assets/thumbnail?size={size}&url={quote(image_url, safe='')}" if image_url else ""
+
+def _invert_history_op(op: Dict[str, Any]) -> Dict[str, Any]:
+    if op["t"] in _HISTORY_INVERSE: return {**op, "t": _HISTORY_INVERSE[op["t"]]}
+    return {**op, "before": op["after"], "after": op["before"]} # node_data, node_move, graph
+
+def _is_graph_revision_conflict(response: httpx.Response) -> bool:
+    if response.status_code != 409: return False
+    detail = orjson.loads(response.content).get("detail")
+    return isinstance(detail, dict) and "current_revision" in detail
+
+def _run_api_error_message(e: httpx.HTTPStatusError) -> str:
+    if e.response.status_code == 429: # Backend is shedding load; it says when capacity is expected back
+        return f"Server busy, please retry in {e.response.headers.get('Retry-After', 'a few')} seconds."
+    return f"API Error ({e.response.status_code}): {e.response.text}"
+
 class AppState(rx.State):
-    # Core Canvas State
-    nodes: List[Node] = []
-    edges: List[Edge] = []
-    selected_node_id: Optional[str] = None
+    # Root of the app's state tree: only what every feature shares. Each feature is a substate below, so an event
+    # only serializes and sends the substate it touches; features reach each other explicitly through `get_state`.
+    backend_url: str = "http://localhost:8000"
+    workflow_error_message: Optional[str] = None # Set by any substate (catalog fetches, uploads, runs)
 
-    # UI & Interaction State
-    live_preview_image_url: Optional[str] = None
-    is_loading_workflow: bool = False
-    workflow_execution_log: List[str] = []
-    workflow_error_message: Optional[str] = None
-    ai_assistant_suggestion: Optional[str] = ""
-    is_loading_suggestion: bool = False
+class SettingsState(AppState):
     current_ui_theme: str = "light" # "light" or "dark"
     show_api_key_modal: bool = False
-    _react_flow_instance: Optional[Any] = None # Store JS ReactFlow instance if needed
+    # User-provided API Keys (stored in browser session memory)
+    api_keys: AIProviderKeys = Field(default_factory=AIProviderKeys)
 
-    # Data fetched from backend
-    available_style_presets: List[StylePreset] = []
-    available_workflow_templates: List[WorkflowTemplate] = []
+    def _api_keys_payload(self) -> Dict[str, Any]: return self.api_keys.dict(exclude_none=True)
 
-    # Asset Management
-    uploaded_asset_url: Optional[str] = None # URL of the last successfully uploaded asset
-    is_uploading_asset: bool = False
+    # --- UI Theme ---
+    def set_ui_theme(self, theme_name: str): self.current_ui_theme = theme_name
 
-    # User-provided API Keys (stored in browser session memory)
-    api_keys: AIProviderKeys = Field(default_factory=AIProviderKeys)
+    # --- API Key Management ---
+    def toggle_api_key_modal(self): self.show_api_key_modal = not self.show_api_key_modal
+    
+    def set_api_key(self, provider_name_key: str, key_value: str):
+        current_keys_dict = self.api_keys.dict()
+        current_keys_dict[provider_name_key] = key_value
+        self.api_keys = AIProviderKeys(**current_keys_dict)
+        # Optionally try to persist to sessionStorage via rx.call_script for this browser session
+        # yield rx.call_script(f"sessionStorage.setItem('mcanvas_apikeys', JSON.stringify({self.api_keys.json()}))")
 
-    backend_url: str = "http://localhost:8000"
+class CatalogState(AppState):
+    # Data fetched from backend
+    available_style_presets: List[StylePreset] = []
+    available_workflow_templates: List[WorkflowTemplate] = []
 
-    # --- Lifecycle & Initial Data ---
-    async def on_app_load(self):
-        await self.fetch_style_presets()
-        await self.fetch_workflow_templates()
-        # Load API keys from sessionStorage if they exist
-        # This requires JS interop or careful handling if Reflex has a direct way.
-        # For simplicity, we'll rely on user re-entering if session is lost.
-        # A more persistent way is localStorage, but with security caveats.
-        if not self.nodes: # Default welcome canvas
-            self.add_node("imageUpload", "Upload Product", {"x": 100, "y": 150})
-            self.add_node("textToImage", "AI Background", {"x": 100, "y": 350}, initial_data={"prompt": "modern studio backdrop"})
-            self.add_node("outputNode", "Final Image", {"x": 400, "y": 250})
+    async def load_catalog(self):
+        # Both catalogs at once, from the process-wide cache: usually no backend round-trip at all.
+        await asyncio.gather(self.fetch_style_presets(), self.fetch_workflow_templates())
 
     async def fetch_style_presets(self):
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(f"{self.backend_url}/api/v1/styles/presets")
-                response.raise_for_status()
-                self.available_style_presets = [StylePreset(**p) for p in response.json()]
+            self.available_style_presets = [StylePreset(**p) for p in await catalog_cache.get(f"{self.backend_url}/api/v1/styles/presets")]
         except Exception as e:
             self.workflow_error_message = f"Failed to fetch styles: {str(e)}"
 
     async def fetch_workflow_templates(self):
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(f"{self.backend_url}/api/v1/workflows/templates")
-                response.raise_for_status()
-                self.available_workflow_templates = [WorkflowTemplate(**t) for t in response.json()]
+            self.available_workflow_templates = [WorkflowTemplate(**t) for t in await catalog_cache.get(f"{self.backend_url}/api/v1/workflows/templates")]
         except Exception as e:
             self.workflow_error_message = f"Failed to fetch templates: {str(e)}"
 
+class CanvasState(AppState):
+    # The graph is backend-only: the canvas gets a full snapshot once, then incremental change sets (see _push_canvas_op)
+    _nodes: List[Node] = []
+    _edges: List[Edge] = []
+    canvas_snapshot: Dict[str, Any] = {} # {"epoch", "seq", "nodes", "edges"}; rebuilt on page load and template load only
+    canvas_ops: List[Dict[str, Any]] = [] # Server-side changes not yet acknowledged by the canvas, in seq order
+    _canvas_seq: int = 0
+    _canvas_epoch: int = 0
+    _node_index: Dict[str, int] = {} # node id -> position in `nodes` (backend-only); rebuilt whenever `nodes` is reassigned
+    selected_node_id: Optional[str] = None
+    workflow_id: str = "" # Stable id for this canvas, groups runs in the backend run history
+    current_template_id: Optional[str] = None # Template the canvas was loaded from, if any
+    _react_flow_instance: Optional[Any] = None # Store JS ReactFlow instance if needed
+    # Graph as last synced with the backend session (backend-only); execute sends only the difference to it
+    _graph_revision: Optional[int] = None
+    _synced_nodes: Dict[str, Dict[str, Any]] = {}
+    _synced_edges: Dict[str, Dict[str, Any]] = {}
+    # Undo/redo history (backend-only): steps of {"label", "ops", "bytes", "at"}; see _record_history
+    _undo_stack: List[Dict[str, Any]] = []
+    _redo_stack: List[Dict[str, Any]] = []
+    _history_bytes: int = 0
+    can_undo: bool = False
+    can_redo: bool = False
+    undo_label: str = "" # e.g. "Delete node", shown on the undo button
+    # Spatial grid (backend-only), kept up to date on add/move/remove; see _grid_move
+    _grid: Dict[str, List[str]] = {} # cell key -> ids of nodes whose position falls in it
+    _node_cells: Dict[str, str] = {} # node id -> cell key
+    _viewport: Dict[str, float] = {} # Visible area in flow coordinates {"x", "y", "width", "height"}; empty until reported
+    _detailed_ids: Set[str] = set() # Nodes the canvas currently has full data for (only tracked while culling)
+
+    # --- Lifecycle & Initial Data ---
+    def load_canvas(self):
+        if not self.workflow_id: self.workflow_id = str(uuid4())
+        if not self._nodes: # Default welcome canvas
+            self.add_node("imageUpload", "Upload Product", {"x": 100, "y": 150})
+            self.add_node("textToImage", "AI Background", {"x": 100, "y": 350}, initial_data={"prompt": "modern studio backdrop"})
+            self.add_node("outputNode", "Final Image", {"x": 400, "y": 250})
+            self._clear_history() # The welcome canvas is the starting point, not three undoable steps
+        self._reset_canvas() # A (re)loaded page starts from the full graph
+
     # --- Computed Vars ---
     @rx.var
     def selected_node(self) -> Optional[Node]:
-        return next((n for n in self.nodes if n.id == self.selected_node_id), None) if self.selected_node_id else None
+        if not self.selected_node_id: return None
+        idx = self._node_idx(self.selected_node_id)
+        return self._nodes[idx] if idx != -1 else None
 
     @rx.var
-    def nodes_for_reactflow(self) -> List[Dict[str, Any]]:
-        return [n.dict(exclude_none=True) for n in self.nodes]
+    def selected_node_thumbnail_url(self) -> str:
+        idx = self._node_idx(self.selected_node_id)
+        return _thumbnail_url(self.backend_url, self._nodes[idx].data.output_image_url, PANEL_THUMBNAIL_SIZE) if idx != -1 else ""
+
+    # --- Canvas Sync ---
+    def _reset_canvas(self):
+        # The only place the whole graph is serialized for the browser.
+        self._canvas_epoch += 1
+        self._detailed_ids = self._detail_region_ids() if self._culling() else set()
+        self.canvas_snapshot = {
+            "epoch": self._canvas_epoch, "seq": self._canvas_seq,
+            "nodes": [self._canvas_node_item(n) for n in self._nodes], "edges": [e.dict(exclude_none=True) for e in self._edges],
+        }
+        self.canvas_ops = []
 
-    @rx.var
-    def edges_for_reactflow(self) -> List[Dict[str, Any]]:
-        return [e.dict(exclude_none=True) for e in self.edges]
+    def _push_canvas_op(self, kind: str, op: str, item_id: str, item: Optional[Dict[str, Any]] = None):
+        # kind: "node" | "edge"; op: "add" (item is the whole element), "update" (item holds the changed top-level fields), "remove".
+        # Changes the canvas made itself (drags, selection, deletes) are never echoed back.
+        self._canvas_seq += 1
+        self.canvas_ops.append({"seq": self._canvas_seq, "kind": kind, "op": op, "id": item_id, **({"item": item} if item is not None else {})})
+        if len(self.canvas_ops) > CANVAS_MAX_PENDING_OPS: self._reset_canvas() # Canvas stopped acknowledging; resync in one go
+
+    def ack_canvas_ops(self, seq: int):
+        if self.canvas_ops and self.canvas_ops[0]["seq"] <= seq: self.canvas_ops = [op for op in self.canvas_ops if op["seq"] > seq]
 
     # --- ReactFlow Event Handlers ---
     def on_react_flow_init(self, instance: Any): self._react_flow_instance = instance
 
-    def on_nodes_change(self, changes: List[Dict[str, Any]]):
-        # This implements a simplified version of ReactFlow's applyNodeChanges
-        new_nodes = self.nodes.copy() # Operate on a mutable copy
-        nodes_to_remove_ids = set()
+    def _reindex_nodes(self):
+        self._node_index = {n.id: idx for idx, n in enumerate(self._nodes)}
+        self._grid, self._node_cells = {}, {}
+        for n in self._nodes: self._grid_move(n.id, n.position)
+
+    # --- Spatial index ---
+    def _grid_move(self, node_id: str, position: Optional[Dict[str, float]]):
+        # Re-buckets one node; a move within its cell (most drags) costs a dict lookup. position=None removes it.
+        key = f"{int(position['x'] // SPATIAL_CELL_SIZE)},{int(position['y'] // SPATIAL_CELL_SIZE)}" if position else None
+        old = self._node_cells.get(node_id)
+        if old == key: return
+        if old is not None:
+            self._grid[old] = [i for i in self._grid[old] if i != node_id]
+            if not self._grid[old]: del self._grid[old]
+            del self._node_cells[node_id]
+        if key is not None:
+            self._grid.setdefault(key, []).append(node_id)
+            self._node_cells[node_id] = key
+
+    def _nodes_in_rect(self, x: float, y: float, width: float, height: float) -> List[str]:
+        # Nodes whose top-left corner lies in the rectangle (flow coordinates); only the grid cells it overlaps are visited.
+        ids = []
+        for cx in range(int(x // SPATIAL_CELL_SIZE), int((x + width) // SPATIAL_CELL_SIZE) + 1):
+            for cy in range(int(y // SPATIAL_CELL_SIZE), int((y + height) // SPATIAL_CELL_SIZE) + 1):
+                for node_id in self._grid.get(f"{cx},{cy}", ()):
+                    position = self._nodes[self._node_idx(node_id)].position
+                    if x <= position["x"] <= x + width and y <= position["y"] <= y + height: ids.append(node_id)
+        return ids
+
+    def _nearest_node(self, point: Dict[str, float], max_distance: float, exclude: Optional[str] = None) -> Optional[str]:
+        ox, oy = NODE_CENTER_OFFSET
+        candidates = self._nodes_in_rect(point["x"] - ox - max_distance, point["y"] - oy - max_distance, 2 * max_distance, 2 * max_distance)
+        best, best_distance = None, max_distance
+        for node_id in candidates:
+            if node_id == exclude: continue
+            position = self._nodes[self._node_idx(node_id)].position
+            distance = ((position["x"] + ox - point["x"]) ** 2 + (position["y"] + oy - point["y"]) ** 2) ** 0.5
+            if distance <= best_distance: best, best_distance = node_id, distance
+        return best
+
+    # --- Viewport culling ---
+    def _culling(self) -> bool: return len(self._nodes) >= VIEWPORT_CULLING_MIN_NODES
+
+    def _detail_region_ids(self) -> Set[str]:
+        if not self._viewport: return set() # Not reported yet: labels only, the visible part follows right after init
+        vp = self._viewport
+        mx, my = vp["width"] * VIEWPORT_DETAIL_MARGIN, vp["height"] * VIEWPORT_DETAIL_MARGIN
+        return set(self._nodes_in_rect(vp["x"] - mx, vp["y"] - my, vp["width"] + 2 * mx, vp["height"] + 2 * my))
+
+    def _canvas_node_data(self, node: Node) -> Dict[str, Any]:
+        # What the canvas gets as a node's `data`: everything near the viewport (with its thumbnail), just the label elsewhere,
+        # so off-screen outputs are never fetched.
+        if self._culling() and node.id not in self._detailed_ids: return {"label": node.data.label}
+        data = node.data.dict(exclude_none=True)
+        if node.data.output_image_url: data["thumbnail_url"] = _thumbnail_url(self.backend_url, node.data.output_image_url, CANVAS_THUMBNAIL_SIZE)
+        return data
+
+    def _canvas_node_item(self, node: Node) -> Dict[str, Any]: return {**node.dict(exclude_none=True), "data": self._canvas_node_data(node)}
+
+    def on_viewport_change(self, rect: Dict[str, float]):
+        # Sent by the canvas after init and after every pan/zoom; nodes coming into range get their full data.
+        self._viewport = {k: float(rect[k]) for k in ("x", "y", "width", "height")}
+        if not self._culling(): return
+        region, epoch = self._detail_region_ids(), self._canvas_epoch
+        entering = region - self._detailed_ids
+        self._detailed_ids = region
+        for node_id in entering:
+            idx = self._node_idx(node_id)
+            if idx != -1: self._push_canvas_op("node", "update", node_id, {"data": self._canvas_node_data(self._nodes[idx])})
+            if self._canvas_epoch != epoch: break # Too many at once: the canvas got a fresh snapshot instead
+
+    def _node_idx(self, node_id: Optional[str]) -> int:
+        # O(1) via the index; the scan only runs if a code path reassigned `nodes` without reindexing.
+        idx = self._node_index.get(node_id, -1) if node_id else -1
+        if 0 <= idx < len(self._nodes) and self._nodes[idx].id == node_id: return idx
+        if idx == -1 and len(self._node_index) == len(self._nodes): return -1
+        return next((i for i, n in enumerate(self._nodes) if n.id == node_id), -1)
+
+    def _remove_nodes(self, node_ids: set):
+        removed_edge_ids = [e.id for e in self._edges if e.source in node_ids or e.target in node_ids]
+        # Highest index first, so undo (which replays in reverse) re-inserts every element at its original position.
+        ops = [{"t": "edge_remove", "index": i, "edge": e.dict(exclude_none=True)} for i, e in reversed(list(enumerate(self._edges)))
+               if e.source in node_ids or e.target in node_ids]
+        ops += [{"t": "node_remove", "index": i, "node": n.dict(exclude_none=True)} for i, n in reversed(list(enumerate(self._nodes))) if n.id in node_ids]
+        self._record_history("Delete node" if len(node_ids) == 1 else f"Delete {len(node_ids)} nodes", ops)
+        self._nodes = [n for n in self._nodes if n.id not in node_ids]
+        self._edges = [e for e in self._edges if e.source not in node_ids and e.target not in node_ids]
+        self._reindex_nodes()
+        # Removing what the canvas already removed is a no-op there; deletes from the properties panel need them.
+        for node_id in node_ids: self._push_canvas_op("node", "remove", node_id)
+        for edge_id in removed_edge_ids: self._push_canvas_op("edge", "remove", edge_id)
+        if self.selected_node_id in node_ids: self.selected_node_id = None
+
+    def _move_node(self, node_id: str, position: Dict[str, float]) -> Optional[Dict[str, Any]]:
+        # Returns the history op for the move, None if nothing moved.
+        idx = self._node_idx(node_id)
+        # Snap-to-grid repeats the same position for most drag frames; skipping those sends no state delta at all.
+        if idx == -1 or self._nodes[idx].position == position: return None
+        before = dict(self._nodes[idx].position)
+        self._nodes[idx].position = position # In place: the state proxy tracks the attribute write, no Node rebuild
+        self._grid_move(node_id, position)
+        return {"t": "node_move", "id": node_id, "before": before, "after": dict(position)}
 
+    def on_nodes_change(self, changes: List[Dict[str, Any]]):
+        # ReactFlow batches a frame's changes into one call (one position change per node of a multi-select drag).
+        # Keep only the last position per node and touch each node once; the list is only rebuilt for removals.
+        positions: Dict[str, Dict[str, float]] = {}
+        removed = set()
         for change in changes:
             node_id = change.get("id")
             if not node_id: continue
-
-            idx = next((i for i, n in enumerate(new_nodes) if n.id == node_id), -1)
-
-            if change["type"] == "select":
+            if change["type"] == "position" and change.get("position"):
+                positions[node_id] = change["position"]
+            elif change["type"] == "select":
                 self.selected_node_id = node_id if change["selected"] else (None if self.selected_node_id == node_id else self.selected_node_id)
-            elif change["type"] == "position" and idx != -1 and change.get("position"):
-                # Recreate node object for full reactivity on nested position dict
-                old_node = new_nodes[idx]
-                new_nodes[idx] = Node(**{**old_node.dict(), "position": change["position"]})
             elif change["type"] == "remove":
-                nodes_to_remove_ids.add(node_id)
-                if self.selected_node_id == node_id: self.selected_node_id = None
-        
-        if nodes_to_remove_ids:
-            self.nodes = [n for n in new_nodes if n.id not in nodes_to_remove_ids]
-            self.edges = [e for e in self.edges if e.source not in nodes_to_remove_ids and e.target not in nodes_to_remove_ids]
-        else:
-            self.nodes = new_nodes # Assign back if only positions/selections changed
-
-        # Ensure selected_node_id is valid
-        if self.selected_node_id and not any(n.id == self.selected_node_id for n in self.nodes):
-            self.selected_node_id = None
+                removed.add(node_id)
+        moves = [self._move_node(node_id, position) for node_id, position in positions.items() if node_id not in removed]
+        self._record_history("Move nodes" if len(moves) > 1 else "Move node", [op for op in moves if op])
+        if removed: self._remove_nodes(removed)
+        if self.selected_node_id and self._node_idx(self.selected_node_id) == -1: self.selected_node_id = None
 
     def on_edges_change(self, changes: List[Dict[str, Any]]):
-        new_edges = self.edges.copy()
+        new_edges = self._edges.copy()
         edges_to_remove_ids = set()
         for change in changes:
             edge_id = change.get("id")
             if not edge_id: continue
             if change["type"] == "remove": edges_to_remove_ids.add(edge_id)
-        if edges_to_remove_ids: self.edges = [e for e in new_edges if e.id not in edges_to_remove_ids]
-        else: self.edges = new_edges
+        if edges_to_remove_ids:
+            self._record_history("Delete connection", [{"t": "edge_remove", "index": i, "edge": e.dict(exclude_none=True)}
+                                                       for i, e in reversed(list(enumerate(new_edges))) if e.id in edges_to_remove_ids])
+            self._edges = [e for e in new_edges if e.id not in edges_to_remove_ids]
+        else: self._edges = new_edges
 
 
     def on_connect(self, connection: Dict[str, Any]):
@@ -200,12 +421,30 @@ class AppState(rx.State):
         sh, th = connection.get("sourceHandle"), connection.get("targetHandle")
         if s and t:
             new_id = f"e_{s}{'_'+sh if sh else ''}-{t}{'_'+th if th else ''}_{random.randint(0,9999)}"
-            if not any(e.id == new_id or (e.source==s and e.target==t and e.sourceHandle==sh and e.targetHandle==th) for e in self.edges):
-                self.edges.append(Edge(id=new_id, source=s, target=t, sourceHandle=sh, targetHandle=th))
+            if not any(e.id == new_id or (e.source==s and e.target==t and e.sourceHandle==sh and e.targetHandle==th) for e in self._edges):
+                edge = Edge(id=new_id, source=s, target=t, sourceHandle=sh, targetHandle=th)
+                self._record_history("Connect", [{"t": "edge_add", "index": len(self._edges), "edge": edge.dict(exclude_none=True)}])
+                self._edges.append(edge)
+                self._push_canvas_op("edge", "add", new_id, edge.dict(exclude_none=True))
+
+    def on_connect_drop(self, drop: Dict[str, Any]):
+        # A connection released on empty canvas: connect it to the nearest node within reach, found through the grid.
+        node_id, position = drop.get("nodeId"), drop.get("position")
+        if not node_id or not position: return
+        other = self._nearest_node(position, CONNECT_DROP_MAX_DISTANCE, exclude=node_id)
+        if not other: return
+        if drop.get("handleType") == "target": self.on_connect({"source": other, "target": node_id, "targetHandle": drop.get("handleId")})
+        else: self.on_connect({"source": node_id, "sourceHandle": drop.get("handleId"), "target": other})
 
     def on_node_click_rf(self, node_data: Dict[str, Any]): self.selected_node_id = node_data.get("id")
     def on_pane_click_rf(self): self.selected_node_id = None
-    def on_node_drag_stop_rf(self, node_data: Dict[str, Any]): pass # Position updated via on_nodes_change
+    def select_node(self, node_id: str):
+        if self._node_idx(node_id) != -1: self.selected_node_id = node_id # e.g. from a log entry; the node may be gone
+    def on_node_drag_stop_rf(self, node_data: Dict[str, Any]):
+        # Drag end carries the authoritative final position, even if intermediate frames were coalesced away.
+        if node_data.get("id") and node_data.get("position"):
+            move = self._move_node(node_data["id"], node_data["position"])
+            if move: self._record_history("Move node", [move])
 
     # --- Node & Workflow Management ---
     def _generate_unique_id(self, prefix: str) -> str: return f"{prefix}_{random.randint(10000, 99999)}"
@@ -216,157 +455,481 @@ class AppState(rx.State):
         
         node_data_obj = NodeData(**(initial_data or {}))
         if not node_data_obj.label: # Set default label
-            node_data_obj.label = f"{label_prefix} #{len(self.nodes) + 1}"
+            node_data_obj.label = f"{label_prefix} #{len(self._nodes) + 1}"
         # Set default provider if node type supports it and not already set
         if node_type == "textToImage" and not node_data_obj.provider:
             node_data_obj.provider = "fal_ai"
 
         new_node = Node(id=node_id, type=node_type, position=pos, data=node_data_obj)
-        self.nodes.append(new_node)
+        self._record_history(f"Add {node_data_obj.label}", [{"t": "node_add", "index": len(self._nodes), "node": new_node.dict(exclude_none=True)}])
+        self._node_index[node_id] = len(self._nodes)
+        self._nodes.append(new_node)
+        self._grid_move(node_id, pos)
+        self._detailed_ids.add(node_id) # Added where the user is looking
+        self._push_canvas_op("node", "add", node_id, new_node.dict(exclude_none=True))
         self.selected_node_id = node_id
 
     def delete_selected_node(self):
-        if self.selected_node_id:
-            node_id_to_delete = self.selected_node_id
-            self.nodes = [n for n in self.nodes if n.id != node_id_to_delete]
-            self.edges = [e for e in self.edges if e.source != node_id_to_delete and e.target != node_id_to_delete]
-            self.selected_node_id = None
-
-    def update_selected_node_data(self, field_name: str, value: Any):
+        if self.selected_node_id: self._remove_nodes({self.selected_node_id})
+
+    def _set_node_data_fields(self, idx: int, fields: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        # Any number of fields in one validation and one state mutation; a no-op edit (e.g. blur re-sending the value) sends nothing.
+        # Returns the history op (previous and new values of the fields that changed), None if nothing changed.
+        node = self._nodes[idx]
+        old_fields, new_data = node.data.dict(), NodeData(**{**node.data.dict(), **fields})
+        if new_data == node.data: return None
+        node.data = new_data # In place, like positions; the node itself isn't rebuilt
+        self._push_canvas_op("node", "update", node.id, {"data": self._canvas_node_data(node)})
+        new_fields = new_data.dict()
+        changed = [name for name in fields if name in new_fields and new_fields[name] != old_fields.get(name)]
+        return {"t": "node_data", "id": node.id, "before": {k: old_fields.get(k) for k in changed}, "after": {k: new_fields[k] for k in changed}}
+
+    def update_selected_node_fields(self, fields: Dict[str, Any]):
         if not self.selected_node_id: return
-        idx = next((i for i, n in enumerate(self.nodes) if n.id == self.selected_node_id), -1)
-        if idx != -1:
-            current_node = self.nodes[idx]
-            new_data_dict = current_node.data.dict()
-            new_data_dict[field_name] = value
-            
-            updated_node_data_obj = NodeData(**new_data_dict)
-            # Create a new Node instance for Reflex to detect the change
-            self.nodes[idx] = Node(
-                id=current_node.id, type=current_node.type, position=current_node.position,
-                data=updated_node_data_obj, draggable=current_node.draggable, connectable=current_node.connectable
-            )
-
-    def load_workflow_from_template(self, template_id: str):
-        template = next((t for t in self.available_workflow_templates if t.id == template_id), None)
+        idx = self._node_idx(self.selected_node_id)
+        if idx == -1: return
+        edit = self._set_node_data_fields(idx, fields)
+        if edit: self._record_history(f"Edit {', '.join(edit['after'])}", [edit])
+
+    def update_selected_node_data(self, field_name: str, value: Any): self.update_selected_node_fields({field_name: value})
+
+    async def load_workflow_from_template(self, template_id: str):
+        catalog = await self.get_state(CatalogState)
+        template = next((t for t in catalog.available_workflow_templates if t.id == template_id), None)
         if template and template.workflow_payload:
-            self.nodes = [Node(**n_dict) for n_dict in template.workflow_payload.get("nodes", [])]
-            self.edges = [Edge(**e_dict) for e_dict in template.workflow_payload.get("edges", [])]
-            self.selected_node_id = None; self.live_preview_image_url = None
-            self.workflow_execution_log = [f"Loaded template: {template.name}"]
+            before = self._graph_history_state()
+            self._nodes = [Node(**n_dict) for n_dict in template.workflow_payload.get("nodes", [])]
+            self._edges = [Edge(**e_dict) for e_dict in template.workflow_payload.get("edges", [])]
+            self._reindex_nodes()
+            self._reset_canvas()
+            self.selected_node_id = None
+            self.current_template_id = template.id
+            self._record_history(f"Load {template.name}", [{"t": "graph", "before": before, "after": self._graph_history_state()}])
+            execution = await self.get_state(ExecutionState)
+            execution.live_preview_image_url = None
+            execution.clear_log() # A new canvas starts a new log; also resets the paging cursor to the latest page
+            execution._log("info", f"Loaded template: {template.name}")
             self.workflow_error_message = None
 
-    # --- UI Theme ---
-    def set_ui_theme(self, theme_name: str): self.current_ui_theme = theme_name
+    # --- Undo / Redo ---
+    def _graph_history_state(self) -> Dict[str, Any]:
+        return {"nodes": [n.dict(exclude_none=True) for n in self._nodes], "edges": [e.dict(exclude_none=True) for e in self._edges],
+                "template_id": self.current_template_id}
+
+    def _record_history(self, label: str, ops: List[Dict[str, Any]]):
+        if not ops: return
+        now, top = time.monotonic(), self._undo_stack[-1] if self._undo_stack else None
+        if top and not self._redo_stack and now - top["at"] < HISTORY_COALESCE_SECONDS and self._coalesce_history(top, ops):
+            top["at"] = now
+            self._resize_history_step(top)
+        else:
+            step = {"label": label, "ops": ops, "bytes": 0, "at": now}
+            self._resize_history_step(step)
+            self._undo_stack.append(step)
+        for step in self._redo_stack: self._history_bytes -= step["bytes"]
+        self._redo_stack = [] # A new edit forks history; the undone steps can't be redone anymore
+        while self._history_bytes > HISTORY_BYTE_BUDGET and len(self._undo_stack) > 1: # The newest step is always kept
+            self._history_bytes -= self._undo_stack.pop(0)["bytes"]
+        self._sync_history_flags()
+
+    def _coalesce_history(self, top: Dict[str, Any], ops: List[Dict[str, Any]]) -> bool:
+        # Folds `ops` into the previous step when they touch exactly the same things (same node fields, or same nodes moved).
+        kinds = {op["t"] for op in ops} | {op["t"] for op in top["ops"]}
+        if kinds not in ({"node_data"}, {"node_move"}) or len(ops) != len(top["ops"]): return False
+        key = lambda op: (op["id"], tuple(sorted(op["after"])) if op["t"] == "node_data" else None)
+        previous = {key(op): op for op in top["ops"]}
+        if set(previous) != {key(op) for op in ops}: return False
+        for op in ops: previous[key(op)]["after"] = op["after"] # The step still undoes to the first `before`
+        return True
+
+    def _resize_history_step(self, step: Dict[str, Any]):
+        size = len(orjson.dumps(step["ops"]))
+        self._history_bytes += size - step["bytes"]
+        step["bytes"] = size
+
+    def _clear_history(self):
+        self._undo_stack, self._redo_stack, self._history_bytes = [], [], 0
+        self._sync_history_flags()
+
+    def _sync_history_flags(self):
+        self.can_undo, self.can_redo = bool(self._undo_stack), bool(self._redo_stack)
+        self.undo_label = self._undo_stack[-1]["label"] if self._undo_stack else ""
+
+    def undo(self):
+        if not self._undo_stack: return
+        step = self._undo_stack.pop()
+        for op in reversed(step["ops"]): self._apply_history_op(_invert_history_op(op))
+        self._redo_stack.append(step)
+        self._sync_history_flags()
+
+    def redo(self):
+        if not self._redo_stack: return
+        step = self._redo_stack.pop()
+        for op in step["ops"]: self._apply_history_op(op)
+        step["at"] = 0.0 # Never coalesce into a redone step
+        self._undo_stack.append(step)
+        self._sync_history_flags()
+
+    def _apply_history_op(self, op: Dict[str, Any]):
+        # Applies one step's op to the graph and sends the canvas the matching change set; nothing here is recorded.
+        kind = op["t"]
+        if kind == "node_add":
+            node = Node(**op["node"])
+            if self._node_idx(node.id) != -1: return
+            self._nodes.insert(min(op["index"], len(self._nodes)), node)
+            self._reindex_nodes()
+            self._push_canvas_op("node", "add", node.id, self._canvas_node_item(node))
+        elif kind == "node_remove":
+            idx = self._node_idx(op["node"]["id"])
+            if idx == -1: return
+            self._nodes.pop(idx)
+            self._reindex_nodes()
+            self._push_canvas_op("node", "remove", op["node"]["id"])
+            if self.selected_node_id == op["node"]["id"]: self.selected_node_id = None
+        elif kind == "edge_add":
+            if any(e.id == op["edge"]["id"] for e in self._edges): return
+            self._edges.insert(min(op["index"], len(self._edges)), Edge(**op["edge"]))
+            self._push_canvas_op("edge", "add", op["edge"]["id"], op["edge"])
+        elif kind == "edge_remove":
+            self._edges = [e for e in self._edges if e.id != op["edge"]["id"]]
+            self._push_canvas_op("edge", "remove", op["edge"]["id"])
+        elif kind == "node_data":
+            idx = self._node_idx(op["id"])
+            if idx != -1: self._set_node_data_fields(idx, op["after"])
+        elif kind == "node_move":
+            idx = self._node_idx(op["id"])
+            if idx == -1: return
+            self._nodes[idx].position = dict(op["after"])
+            self._grid_move(op["id"], op["after"])
+            self._push_canvas_op("node", "update", op["id"], {"position": op["after"]})
+        elif kind == "graph":
+            self._nodes = [Node(**n) for n in op["after"]["nodes"]]
+            self._edges = [Edge(**e) for e in op["after"]["edges"]]
+            self.current_template_id = op["after"]["template_id"]
+            self._reindex_nodes()
+            self._reset_canvas()
+            if self._node_idx(self.selected_node_id) == -1: self.selected_node_id = None
+
+    def _graph_delta(self) -> Dict[str, Any]:
+        # Nodes/edges added, changed or removed since the last sync; the whole graph when there is no synced revision.
+        nodes = {n.id: n.dict(exclude_none=True) for n in self._nodes}
+        edges = {e.id: e.dict(exclude_none=True) for e in self._edges}
+        if self._graph_revision is None:
+            return {"base_revision": None, "upserted_nodes": list(nodes.values()), "upserted_edges": list(edges.values())}
+        return {
+            "base_revision": self._graph_revision,
+            "upserted_nodes": [d for node_id, d in nodes.items() if self._synced_nodes.get(node_id) != d],
+            "removed_node_ids": [node_id for node_id in self._synced_nodes if node_id not in nodes],
+            "upserted_edges": [d for edge_id, d in edges.items() if self._synced_edges.get(edge_id) != d],
+            "removed_edge_ids": [edge_id for edge_id in self._synced_edges if edge_id not in edges],
+        }
 
-    # --- API Key Management ---
-    def toggle_api_key_modal(self): self.show_api_key_modal = not self.show_api_key_modal
-    
-    def set_api_key(self, provider_name_key: str, key_value: str):
-        current_keys_dict = self.api_keys.dict()
-        current_keys_dict[provider_name_key] = key_value
-        self.api_keys = AIProviderKeys(**current_keys_dict)
-        # Optionally try to persist to sessionStorage via rx.call_script for this browser session
-        # yield rx.call_script(f"sessionStorage.setItem('mcanvas_apikeys', JSON.stringify({self.api_keys.json()}))")
+    def _mark_graph_synced(self, revision: int):
+        self._graph_revision = revision
+        self._synced_nodes = {n.id: n.dict(exclude_none=True) for n in self._nodes}
+        self._synced_edges = {e.id: e.dict(exclude_none=True) for e in self._edges}
 
+class ExecutionState(AppState):
+    live_preview_image_url: Optional[str] = None
+    is_loading_workflow: bool = False
+    log_entries: List[LogEntry] = [] # The visible page of the execution log, oldest first
+    log_level: str = "info" # Sent with runs, so the backend drops quieter records before formatting them
+    log_following: bool = True # The page tracks the newest entries; False while paging back through older ones
+    log_older_available: bool = False
+    _log_ring: List[Dict[str, Any]] = [] # Record n lives at n % LOG_RING_SIZE; the oldest are overwritten
+    _log_total: int = 0 # Records ever appended
+    _log_page_start: int = 0 # Seq of the first visible entry
+    preview_mode: bool = False # Execute with small images / fewer steps; promote chosen nodes afterwards
+    last_run_id: Optional[str] = None
+    interrupted_run_id: Optional[str] = None # Run whose response never arrived; resumable from its backend checkpoint
+    ai_assistant_suggestion: Optional[str] = ""
+    is_loading_suggestion: bool = False
 
-    # --- Asset Upload ---
-    async def handle_asset_upload(self, files: List[rx.UploadFile]):
-        if not files: return
-        self.is_uploading_asset = True; self.uploaded_asset_url = None; self.workflow_error_message = None
-        try:
-            file_to_upload = files[0]
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    f"{self.backend_url}/api/v1/assets/upload",
-                    files={"file": (file_to_upload.filename, await file_to_upload.read(), file_to_upload.content_type)},
-                    timeout=60.0
-                )
+    # --- Backend Interaction ---
+    def _apply_execution_result(self, canvas: "CanvasState", result_data: Dict[str, Any]):
+        self._append_log_records(result_data.get("execution_records")
+                                 or [{"level": "info", "message": line} for line in result_data.get("execution_log", [])])
+        self.last_run_id = result_data.get("run_id")
+
+        if result_data.get("error"):
+            self.workflow_error_message = result_data["error"]
+            return
+        if "changed_nodes" in result_data: # Delta response: patch only the nodes the run changed
+            changed_nodes = result_data["changed_nodes"]
+        else: # Full response (promote returns only the nodes it re-rendered); only those whose data differs go to the canvas
+            changed_nodes = result_data.get("updated_nodes", [])
+        for node_dict in changed_nodes:
+            idx = canvas._node_idx(node_dict["id"])
+            if idx == -1: continue
+            updated = Node(**{**node_dict, "position": canvas._nodes[idx].position}) # The canvas owns positions; a drag may be in flight
+            changed = updated.data != canvas._nodes[idx].data
+            canvas._nodes[idx] = updated
+            if changed: canvas._push_canvas_op("node", "update", updated.id, {"data": canvas._canvas_node_data(updated)})
+
+        self.live_preview_image_url = result_data.get("final_output_url")
+        if not self.live_preview_image_url: # Fallback to first available output
+            self.live_preview_image_url = next((n.data.output_image_url for n in canvas._nodes if n.data.output_image_url), None)
+        # Prefer the backend's local mirror of the preview image when it's already downloaded
+        mirrored = next((n.data.mirrored_image_url for n in canvas._nodes
+                         if n.data.mirrored_image_url and n.data.output_image_url == self.live_preview_image_url), None)
+        if mirrored: self.live_preview_image_url = mirrored
+        self._log("info", "Workflow execution successful.")
+
+    def set_preview_mode(self, enabled: bool): self.preview_mode = enabled
+
+    # --- Execution log ---
+    def _append_log_records(self, records: List[Dict[str, Any]]):
+        for record in records:
+            record = {**record, "seq": self._log_total}
+            if len(self._log_ring) < LOG_RING_SIZE: self._log_ring.append(record)
+            else: self._log_ring[self._log_total % LOG_RING_SIZE] = record
+            self._log_total += 1
+        if self.log_following: self._show_log_page(self._log_total)
+
+    def _log(self, level: str, message: str, node_id: Optional[str] = None):
+        self._append_log_records([{"level": level, "message": message, "node_id": node_id, "ts": time.time()}])
+
+    def _show_log_page(self, end: int):
+        # Up to LOG_PAGE_SIZE records at or above log_level, ending before seq `end`. Only these are formatted.
+        oldest, threshold = self._log_total - len(self._log_ring), LOG_LEVEL_ORDER[self.log_level]
+        page, seq = [], end - 1
+        while seq >= oldest and len(page) < LOG_PAGE_SIZE:
+            record = self._log_ring[seq % LOG_RING_SIZE]
+            if LOG_LEVEL_ORDER.get(record["level"], 1) >= threshold: page.append(record)
+            seq -= 1
+        page.reverse()
+        self.log_entries = [LogEntry(
+            seq=r["seq"], level=r["level"], message=r["message"], node_id=r.get("node_id"),
+            time_label=time.strftime("%H:%M:%S", time.localtime(r["ts"])) if r.get("ts") else "",
+            duration_label=f"{r['duration_ms'] / 1000:.1f}s" if r.get("duration_ms") is not None else "",
+        ) for r in page]
+        self._log_page_start = page[0]["seq"] if page else end
+        self.log_older_available = seq >= oldest
+
+    def show_older_log_entries(self):
+        if not self.log_older_available: return
+        self.log_following = False
+        self._show_log_page(self._log_page_start)
+
+    def show_latest_log_entries(self):
+        self.log_following = True
+        self._show_log_page(self._log_total)
+
+    def set_log_level(self, level: str):
+        if level not in LOG_LEVEL_ORDER: return
+        self.log_level = level
+        self.show_latest_log_entries()
+
+    def clear_log(self):
+        self._log_ring, self._log_total = [], 0
+        self.show_latest_log_entries()
+
+    @rx.background
+    async def refresh_mirrored_assets(self):
+        # Provider outputs are mirrored by the backend in the background; swap previews to local copies as they land.
+        for _ in range(MIRROR_REFRESH_ATTEMPTS):
+            await asyncio.sleep(MIRROR_REFRESH_INTERVAL_SECONDS)
+            async with self:
+                canvas = await self.get_state(CanvasState)
+                pending = list({n.data.output_image_url for n in canvas._nodes if n.data.output_image_url and not n.data.mirrored_image_url})
+                backend_url = self.backend_url
+            if not pending: return
+            try:
+                client = get_http_client()
+                response = await client.post(f"{backend_url}/api/v1/assets/mirror/resolve", json={"urls": pending}, timeout=10.0)
                 response.raise_for_status()
-                result = response.json()
-                self.uploaded_asset_url = result.get("file_url")
-
-                if self.selected_node and self.selected_node.type == "imageUpload" and self.uploaded_asset_url:
-                    self.update_selected_node_data("output_image_url", self.uploaded_asset_url)
-                    self.update_selected_node_data("file_name", result.get("file_name", file_to_upload.filename))
-                elif self.uploaded_asset_url: # Add a new ImageUpload node if none is selected or wrong type
-                    self.add_node(
-                        node_type="imageUpload",
-                        label_prefix=result.get("file_name", file_to_upload.filename).split('.')[0],
-                        initial_data={"output_image_url": self.uploaded_asset_url, "file_name": result.get("file_name", file_to_upload.filename)}
-                    )
-        except Exception as e:
-            self.workflow_error_message = f"Upload failed: {str(e)}"
-        finally:
-            self.is_uploading_asset = False
+                resolved = {remote: local for remote, local in response.json().items() if local}
+            except Exception:
+                return # Previews keep working from the remote URLs
+            if not resolved: continue
+            async with self:
+                canvas = await self.get_state(CanvasState)
+                for idx, node in enumerate(canvas._nodes):
+                    local = resolved.get(node.data.output_image_url)
+                    if local and not node.data.mirrored_image_url: canvas._set_node_data_fields(idx, {"mirrored_image_url": local})
+                if self.live_preview_image_url in resolved: self.live_preview_image_url = resolved[self.live_preview_image_url]
 
-    # --- Backend Interaction ---
     async def execute_workflow(self):
-        self.is_loading_workflow = True; self.workflow_error_message = None
-        self.workflow_execution_log = ["Sending workflow to backend..."]; self.live_preview_image_url = None
+        async for event in self._run_graph(): yield event
 
-        payload = {
-            "nodes": [n.dict(exclude_none=True) for n in self.nodes],
-            "edges": [e.dict(exclude_none=True) for e in self.edges],
-            "api_keys": self.api_keys.dict(exclude_none=True) # Send API keys
+    async def execute_up_to_selected_node(self):
+        # Only the selected node and its inputs run; downstream nodes keep their previous results.
+        canvas = await self.get_state(CanvasState)
+        if not canvas.selected_node_id: return
+        async for event in self._run_graph([canvas.selected_node_id]): yield event
+
+    async def _run_graph(self, target_node_ids: Optional[List[str]] = None):
+        self.is_loading_workflow = True; self.workflow_error_message = None
+        self.log_following = True
+        self._log("info", "Sending workflow to backend..." if not target_node_ids else f"Running up to '{target_node_ids[0]}'...")
+        if not target_node_ids: self.live_preview_image_url = None
+        run_id = str(uuid4()) # Chosen here, so the run can still be resumed if the response never arrives
+        self.interrupted_run_id = None
+
+        canvas, settings = await self.get_state(CanvasState), await self.get_state(SettingsState)
+        if not canvas.workflow_id: canvas.workflow_id = str(uuid4())
+        options = {
+            "run_id": run_id,
+            "session_id": canvas.workflow_id,
+            "api_keys": settings._api_keys_payload(), # Send API keys
+            "template_id": canvas.current_template_id,
+            "execution_mode": "preview" if self.preview_mode else "full",
+            "target_node_ids": target_node_ids,
+            "log_level": self.log_level,
         }
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.post(f"{self.backend_url}/api/v1/workflow/execute", json=payload, timeout=300.0) # Long timeout
-                response.raise_for_status()
-                result_data = response.json()
-
-                self.workflow_execution_log.extend(result_data.get("execution_log", []))
-
-                if result_data.get("error"):
-                    self.workflow_error_message = result_data["error"]
-                else:
-                    # Update nodes based on backend response. Important to recreate for reactivity.
-                    backend_nodes_map = {bn_dict["id"]: bn_dict for bn_dict in result_data.get("updated_nodes", [])}
-                    updated_nodes_list = []
-                    for fe_node in self.nodes:
-                        if fe_node.id in backend_nodes_map:
-                            updated_nodes_list.append(Node(**backend_nodes_map[fe_node.id]))
-                        else: # Should ideally not happen if backend returns all nodes
-                            updated_nodes_list.append(fe_node)
-                    self.nodes = updated_nodes_list
-                    
-                    self.live_preview_image_url = result_data.get("final_output_url")
-                    if not self.live_preview_image_url: # Fallback to first available output
-                        for node_dict_res in result_data.get("updated_nodes", []):
-                            if node_dict_res.get("data", {}).get("output_image_url"):
-                                self.live_preview_image_url = node_dict_res["data"]["output_image_url"]
-                                break
-                    self.workflow_execution_log.append("Workflow execution successful.")
-
+            client = get_http_client()
+            url = f"{self.backend_url}/api/v1/workflow/execute-delta"
+            response = await client.post(url, content=_encode_json({**options, **canvas._graph_delta()}), headers=JSON_HEADERS, timeout=300.0) # Long timeout
+            if _is_graph_revision_conflict(response): # Backend session expired or diverged: resend the whole graph once
+                canvas._graph_revision = None
+                response = await client.post(url, content=_encode_json({**options, **canvas._graph_delta()}), headers=JSON_HEADERS, timeout=300.0)
+            response.raise_for_status()
+            result = orjson.loads(response.content)
+            self._apply_execution_result(canvas, result)
+            canvas._mark_graph_synced(result["revision"])
+            if target_node_ids: # Show the intermediate that was asked for, not the (untouched) final output
+                idx = canvas._node_idx(target_node_ids[0])
+                target = canvas._nodes[idx] if idx != -1 else None
+                if target and target.data.output_image_url: self.live_preview_image_url = target.data.mirrored_image_url or target.data.output_image_url
+            yield ExecutionState.refresh_mirrored_assets
         except httpx.HTTPStatusError as e:
-            self.workflow_error_message = f"API Error ({e.response.status_code}): {e.response.text}"
+            self.workflow_error_message = _run_api_error_message(e)
+            canvas._graph_revision = None # Unknown whether the backend applied the delta
+            if e.response.status_code >= 500: self.interrupted_run_id = run_id
         except httpx.RequestError as e:
             self.workflow_error_message = f"Network Error: Could not connect to backend ({e.request.url})."
+            canvas._graph_revision = None
+            self.interrupted_run_id = run_id # Worker crash, restart or timeout mid-run
         except Exception as e:
             self.workflow_error_message = f"An unexpected error occurred during execution: {str(e)}"
         finally:
             self.is_loading_workflow = False
-            if self.workflow_error_message and self.workflow_error_message not in self.workflow_execution_log:
-                self.workflow_execution_log.append(f"Error: {self.workflow_error_message}")
+            if self.workflow_error_message: self._log("error", f"Error: {self.workflow_error_message}")
+
+    async def promote_selected_node(self):
+        # Re-render the selected preview variant (and its inputs) at full quality with the same seeds.
+        canvas, settings = await self.get_state(CanvasState), await self.get_state(SettingsState)
+        if not canvas.selected_node_id or not self.last_run_id: return
+        self.is_loading_workflow = True; self.workflow_error_message = None
+        self._log("info", f"Promoting '{canvas.selected_node_id}' to full quality...", node_id=canvas.selected_node_id)
+        payload = {"run_id": self.last_run_id, "node_ids": [canvas.selected_node_id], "api_keys": settings._api_keys_payload(), "log_level": self.log_level}
+        try:
+            client = get_http_client()
+            response = await client.post(f"{self.backend_url}/api/v1/workflow/promote", content=_encode_json(payload), headers=JSON_HEADERS, timeout=300.0)
+            response.raise_for_status()
+            self._apply_execution_result(canvas, orjson.loads(response.content))
+            yield ExecutionState.refresh_mirrored_assets
+        except httpx.HTTPStatusError as e:
+            self.workflow_error_message = _run_api_error_message(e)
+        except httpx.RequestError as e:
+            self.workflow_error_message = f"Network Error: Could not connect to backend ({e.request.url})."
+        except Exception as e:
+            self.workflow_error_message = f"An unexpected error occurred during promotion: {str(e)}"
+        finally:
+            self.is_loading_workflow = False
+            if self.workflow_error_message: self._log("error", f"Error: {self.workflow_error_message}")
+
+    async def resume_interrupted_run(self):
+        # Continue the interrupted run from its last checkpoint; nodes that already finished are not re-generated.
+        if not self.interrupted_run_id: return
+        run_id = self.interrupted_run_id
+        canvas, settings = await self.get_state(CanvasState), await self.get_state(SettingsState)
+        self.is_loading_workflow = True; self.workflow_error_message = None
+        self._log("info", f"Resuming run {run_id[:8]}...")
+        try:
+            client = get_http_client()
+            response = await client.post(f"{self.backend_url}/api/v1/workflow/runs/{run_id}/resume",
+                                         content=_encode_json({"api_keys": settings._api_keys_payload()}), headers=JSON_HEADERS, timeout=300.0)
+            response.raise_for_status()
+            self.interrupted_run_id = None
+            self._apply_execution_result(canvas, orjson.loads(response.content))
+            yield ExecutionState.refresh_mirrored_assets
+        except httpx.HTTPStatusError as e:
+            self.workflow_error_message = _run_api_error_message(e)
+            if e.response.status_code == 404: self.interrupted_run_id = None # Nothing left to resume
+        except httpx.RequestError as e:
+            self.workflow_error_message = f"Network Error: Could not connect to backend ({e.request.url})."
+        except Exception as e:
+            self.workflow_error_message = f"An unexpected error occurred while resuming: {str(e)}"
+        finally:
+            self.is_loading_workflow = False
+            if self.workflow_error_message: self._log("error", f"Error: {self.workflow_error_message}")
 
     async def fetch_ai_suggestion(self, user_query: Optional[str] = None):
         self.is_loading_suggestion = True; self.ai_assistant_suggestion = ""
+        canvas, settings = await self.get_state(CanvasState), await self.get_state(SettingsState)
         payload = {
             "user_query": user_query,
             "current_workflow": {
-                 "nodes": [n.dict(exclude_none=True) for n in self.nodes],
-                 "edges": [e.dict(exclude_none=True) for e in self.edges],
-                 "api_keys": self.api_keys.dict(exclude_none=True) # Pass keys if assistant needs them
-            } if self.nodes else None
+                 "nodes": [n.dict(exclude_none=True) for n in canvas._nodes],
+                 "edges": [e.dict(exclude_none=True) for e in canvas._edges],
+                 "api_keys": settings._api_keys_payload() # Pass keys if assistant needs them
+            } if canvas._nodes else None
         }
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.post(f"{self.backend_url}/api/v1/ai/suggest", json=payload, timeout=60.0)
-                response.raise_for_status()
-                result = response.json()
-                self.ai_assistant_suggestion = result.get("suggestion_text", "No suggestion available at the moment.")
+            client = get_http_client()
+            response = await client.post(f"{self.backend_url}/api/v1/ai/suggest", json=payload, timeout=60.0)
+            response.raise_for_status()
+            result = response.json()
+            self.ai_assistant_suggestion = result.get("suggestion_text", "No suggestion available at the moment.")
         except Exception as e:
             self.ai_assistant_suggestion = f"Error fetching AI suggestion: {str(e)}"
         finally:
             self.is_loading_suggestion = False
+
+class UploadState(AppState):
+    # Asset Management
+    uploaded_asset_url: Optional[str] = None # URL of the last successfully uploaded asset
+    is_uploading_asset: bool = False
+    upload_items: List[UploadItem] = [] # One per file of the current/last drop
+    downscale_uploads: bool = DOWNSCALE_AVAILABLE # Needs Pillow on the Reflex server
+
+    def set_downscale_uploads(self, enabled: bool): self.downscale_uploads = enabled and DOWNSCALE_AVAILABLE
+
+    # --- Asset Upload ---
+    async def handle_asset_upload(self, files: List[rx.UploadFile]):
+        # Files go to the backend concurrently (bounded), each streamed from its spooled temp file; progress is
+        # published every UPLOAD_PROGRESS_INTERVAL_SECONDS while they run.
+        if not files: return
+        self.is_uploading_asset = True; self.uploaded_asset_url = None; self.workflow_error_message = None
+        self.upload_items = [UploadItem(name=f.filename or "upload") for f in files]
+        url, downscale = f"{self.backend_url}/api/v1/assets/upload", self.downscale_uploads
+        progress = [0] * len(files)
+        semaphore = asyncio.Semaphore(ASSET_UPLOAD_CONCURRENCY)
+
+        async def upload(i: int, upload_file: rx.UploadFile) -> Dict[str, Any]:
+            async with semaphore:
+                self.upload_items[i].status = "uploading"
+                def on_progress(sent: int, total: int): progress[i] = int(100 * sent / total) if total else 100
+                return await stream_asset_upload(url, upload_file.filename or "upload", upload_file.file, upload_file.content_type, downscale, on_progress)
+
+        try:
+            tasks = [asyncio.create_task(upload(i, f)) for i, f in enumerate(files)]
+            pending = set(tasks)
+            while pending:
+                _, pending = await asyncio.wait(pending, timeout=UPLOAD_PROGRESS_INTERVAL_SECONDS)
+                for i, task in enumerate(tasks):
+                    item = self.upload_items[i]
+                    if not task.done(): item.percent = progress[i]
+                    elif task.exception() is not None: item.status, item.detail = "error", str(task.exception())
+                    elif not task.result().get("file_url"): item.status, item.detail = "error", "Backend returned no file URL."
+                    else: item.status, item.percent, item.detail = "done", 100, task.result().get("note") or ""
+                if pending: yield
+
+            uploaded = [(f, task.result()) for f, task in zip(files, tasks) if task.exception() is None and task.result().get("file_url")]
+            failed = len(files) - len(uploaded)
+            if failed: self.workflow_error_message = f"Upload failed for {failed} of {len(files)} file(s): {next((i.detail for i in self.upload_items if i.status == 'error'), 'unknown error')}"
+            if uploaded:
+                self.uploaded_asset_url = uploaded[-1][1]["file_url"]
+                canvas = await self.get_state(CanvasState)
+                if len(uploaded) == 1 and canvas.selected_node and canvas.selected_node.type == "imageUpload":
+                    upload_file, result = uploaded[0]
+                    canvas.update_selected_node_fields({"output_image_url": result["file_url"], "file_name": result.get("file_name", upload_file.filename)})
+                else: # One ImageUpload node per file
+                    for upload_file, result in uploaded:
+                        file_name = result.get("file_name", upload_file.filename)
+                        canvas.add_node(node_type="imageUpload", label_prefix=file_name.split('.')[0],
+                                        initial_data={"output_image_url": result["file_url"], "file_name": file_name})
+        finally:
+            self.is_uploading_asset = False
@@ -0,0 +1,67 @@
+import os
+import asyncio
+import tempfile
+from typing import Any, BinaryIO, Callable, Dict, Optional, Tuple
+from .backend_client import get_http_client
+
+try:
+    from PIL import Image # Optional: downscale oversized images before they are sent to the backend
+except ImportError:
+    Image = None
+
+DOWNSCALE_AVAILABLE = Image is not None
+
+ASSET_UPLOAD_CONCURRENCY = int(os.getenv("ASSET_UPLOAD_CONCURRENCY", "4"))
+ASSET_UPLOAD_TIMEOUT_SECONDS = 120.0
+UPLOAD_MAX_DIMENSION = int(os.getenv("UPLOAD_MAX_DIMENSION", "4096")) # Longest side kept when downscaling is on
+_DOWNSCALE_SPOOL_BYTES = 8 * 1024 * 1024 # Re-encoded images bigger than this spill to disk
+_DOWNSCALE_FORMATS = {"JPEG", "PNG", "WEBP"} # Kept as-is; anything else is re-encoded as PNG
+
+class _ProgressReader:
+    # Hands httpx the file in chunks (so it's never fully in memory) and reports how far the upload got.
+    # No fileno(): httpx then sizes the body with seek/tell, which doesn't force a spooled file onto disk.
+    def __init__(self, file: BinaryIO, on_read: Callable[[int], None]):
+        self._file = file
+        self._on_read = on_read
+        self._sent = 0
+
+    def read(self, size: int = -1) -> bytes:
+        chunk = self._file.read(size)
+        self._sent += len(chunk)
+        self._on_read(self._sent)
+        return chunk
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int: return self._file.seek(offset, whence)
+    def tell(self) -> int: return self._file.tell()
+
+def downscale_image(file: BinaryIO, max_dimension: int = UPLOAD_MAX_DIMENSION) -> Optional[Tuple[BinaryIO, str, str]]:
+    """(re-encoded file, content type, note) when the image is larger than max_dimension, else None (send as-is)."""
+    if Image is None: return None
+    try:
+        file.seek(0)
+        with Image.open(file) as img:
+            if max(img.size) <= max_dimension: return None
+            original_size, fmt = img.size, img.format if img.format in _DOWNSCALE_FORMATS else "PNG"
+            img.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+            if fmt == "JPEG" and img.mode not in ("RGB", "L"): img = img.convert("RGB")
+            out = tempfile.SpooledTemporaryFile(max_size=_DOWNSCALE_SPOOL_BYTES)
+            img.save(out, format=fmt, **({"quality": 90} if fmt in ("JPEG", "WEBP") else {}))
+            out.seek(0)
+            return out, Image.MIME[fmt], f"downscaled {original_size[0]}x{original_size[1]} to {img.width}x{img.height}"
+    except Exception:
+        return None # Not an image Pillow can read; the backend gets the original
+    finally:
+        file.seek(0)
+
+async def stream_asset_upload(url: str, filename: str, file: BinaryIO, content_type: Optional[str], downscale: bool,
+                              on_progress: Callable[[int, int], None]) -> Dict[str, Any]:
+    note = None
+    if downscale:
+        scaled = await asyncio.to_thread(downscale_image, file)
+        if scaled: file, content_type, note = scaled
+    total = file.seek(0, os.SEEK_END); file.seek(0)
+    reader = _ProgressReader(file, lambda sent: on_progress(sent, total))
+    response = await get_http_client().post(url, files={"file": (filename, reader, content_type or "application/octet-stream")},
+                                            timeout=ASSET_UPLOAD_TIMEOUT_SECONDS)
+    response.raise_for_status()
+    return {**response.json(), "note": note}
@@ -0,0 +1,58 @@
+import os
+import time
+import asyncio
+from typing import Any, Dict, Optional
+import httpx
+import orjson
+
+# One pooled client for the whole Reflex process: every session's calls to the backend reuse its keep-alive connections.
+HTTP_MAX_CONNECTIONS = int(os.getenv("BACKEND_HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("BACKEND_HTTP_MAX_KEEPALIVE", "20"))
+CATALOG_CACHE_TTL_SECONDS = float(os.getenv("CATALOG_CACHE_TTL_SECONDS", "300")) # Then revalidated with If-None-Match
+
+_http_client: Optional[httpx.AsyncClient] = None
+
+def get_http_client() -> httpx.AsyncClient:
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS, max_keepalive_connections=HTTP_MAX_KEEPALIVE), timeout=30.0,
+        )
+    return _http_client
+
+class _CatalogEntry:
+    def __init__(self, data: Any, etag: Optional[str]):
+        self.data = data
+        self.etag = etag
+        self.fetched_at = time.monotonic()
+
+class CatalogCache:
+    """Process-wide cache of read-only backend catalogs (style presets, templates), shared by all sessions."""
+    def __init__(self, ttl_seconds: float = CATALOG_CACHE_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self._entries: Dict[str, _CatalogEntry] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    def _fresh(self, entry: Optional[_CatalogEntry]) -> bool:
+        return entry is not None and time.monotonic() - entry.fetched_at < self.ttl_seconds
+
+    async def get(self, url: str) -> Any:
+        entry = self._entries.get(url)
+        if self._fresh(entry): return entry.data
+        async with self._locks.setdefault(url, asyncio.Lock()): # Sessions loading at once share one request
+            entry = self._entries.get(url)
+            if self._fresh(entry): return entry.data
+            headers = {"If-None-Match": entry.etag} if entry and entry.etag else {}
+            try:
+                response = await get_http_client().get(url, headers=headers, timeout=10.0)
+                if response.status_code == 304 and entry:
+                    entry.fetched_at = time.monotonic()
+                    return entry.data
+                response.raise_for_status()
+            except httpx.HTTPError:
+                if entry: return entry.data # Backend unreachable: a stale catalog beats an empty palette
+                raise
+            self._entries[url] = _CatalogEntry(orjson.loads(response.content), response.headers.get("etag"))
+            return self._entries[url].data
+
+catalog_cache = CatalogCache()
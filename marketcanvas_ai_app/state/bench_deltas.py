@@ -0,0 +1,68 @@
+"""Bytes Reflex pushes to the browser per common editor event, and which substates they come from.
+
+    cd marketcanvas_ai_app && python -m state.bench_deltas [--nodes 50 500]
+
+Runs the real event handlers against an in-memory state tree and serializes the delta after each one. An event
+should only carry the substate it touches; no event except the page-load snapshot should carry the graph.
+"""
+import json
+import asyncio
+import inspect
+import argparse
+from typing import Any, Callable, List, Tuple, Type
+import reflex as rx
+
+from .app_state import AppState, CanvasState, ExecutionState, SettingsState, Node, NodeData
+
+EVENTS: List[Tuple[str, Type[AppState], Callable[[Any], Any]]] = [
+    ("page load (snapshot)", CanvasState, lambda s: s._reset_canvas()),
+    ("select node", CanvasState, lambda s: s.on_nodes_change([{"id": "node_3", "type": "select", "selected": True}])),
+    ("move node (drag end)", CanvasState, lambda s: s.on_nodes_change([{"id": "node_3", "type": "position", "position": {"x": 990.0, "y": 40.0}}])),
+    ("edit prompt", CanvasState, lambda s: s.update_selected_node_data("prompt", "neon city skyline at night, rain")),
+    ("add node", CanvasState, lambda s: s.add_node("textOverlay", "Text Overlay")),
+    ("ack canvas ops", CanvasState, lambda s: s.ack_canvas_ops(s._canvas_seq)),
+    ("toggle API key modal", SettingsState, lambda s: s.toggle_api_key_modal()),
+    ("append log line", ExecutionState, lambda s: s._log("info", "Node node_3 done")),
+    ("toggle preview mode", ExecutionState, lambda s: s.set_preview_mode(True)),
+]
+
+def _new_root() -> rx.State:
+    try: return rx.State(_reflex_internal_init=True) # Newer Reflex guards direct instantiation
+    except TypeError: return rx.State()
+
+def _substate(root: rx.State, state_cls: Type[AppState]) -> AppState:
+    return root.get_substate(state_cls.get_full_name().split("."))
+
+def _build_canvas(canvas: CanvasState, node_count: int):
+    canvas._nodes = [Node(id=f"node_{i}", type="textToImage", position={"x": float(i % 25) * 220, "y": float(i // 25) * 160},
+                          data=NodeData(label=f"Node {i}", prompt="cinematic product shot, soft studio lighting, marble table " * 3))
+                     for i in range(node_count)]
+    canvas._reindex_nodes()
+
+async def _delta(root: rx.State) -> dict:
+    delta = root.get_delta()
+    return await delta if inspect.isawaitable(delta) else delta
+
+def _size(delta: dict) -> int:
+    return len(json.dumps(delta, default=lambda o: o.dict() if hasattr(o, "dict") else str(o)))
+
+async def run(node_counts: List[int]):
+    print(f"{'nodes':>6} {'event':<22} {'delta bytes':>12}  substates")
+    for node_count in node_counts:
+        root = _new_root()
+        _build_canvas(_substate(root, CanvasState), node_count)
+        for name, state_cls, handler in EVENTS:
+            root._clean()
+            result = handler(_substate(root, state_cls))
+            if inspect.isawaitable(result): await result
+            delta = await _delta(root)
+            touched = ", ".join(sorted(key.rsplit(".", 1)[-1] for key, value in delta.items() if value))
+            print(f"{node_count:>6} {name:<22} {_size(delta):>12}  {touched}")
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m state.bench_deltas", description=__doc__.splitlines()[0])
+    parser.add_argument("--nodes", type=int, nargs="+", default=[50, 500])
+    asyncio.run(run(parser.parse_args().nodes))
+
+if __name__ == "__main__":
+    main()